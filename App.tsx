@@ -1,6 +1,6 @@
 import React, { useState, useEffect, useRef, useCallback } from 'react';
 import UploadPanel from './components/UploadPanel';
-import MapView from './components/MapView';
+import MapView, { ProcessedImageUrls } from './components/MapView';
 import HelpButton from './components/HelpButton';
 import { JobStatus, ImageFile, Job } from './types';
 import { api } from './services/api';
@@ -10,7 +10,7 @@ const App: React.FC = () => {
   const [imageB, setImageB] = useState<ImageFile | null>(null);
   const [aoi, setAoi] = useState<number[][] | null>(null);
   const [job, setJob] = useState<Job | null>(null);
-  const [processedImageUrls, setProcessedImageUrls] = useState<{ a: string; b: string } | null>(null);
+  const [processedImageUrls, setProcessedImageUrls] = useState<ProcessedImageUrls | null>(null);
   const [isInitialized, setIsInitialized] = useState(false);
 
   const pollingIntervalRef = useRef<number | null>(null);
@@ -54,9 +54,12 @@ const App: React.FC = () => {
         clearPolling();
         if (currentJob.outputs) {
           const baseUrl = import.meta.env.VITE_API_URL || 'http://localhost:8080';
+          const { imageATilesUrl, imageBTilesUrl } = currentJob.outputs;
           setProcessedImageUrls({
             a: `${baseUrl}${currentJob.outputs.imageAUrl}`,
-            b: `${baseUrl}${currentJob.outputs.imageBUrl}`
+            b: `${baseUrl}${currentJob.outputs.imageBUrl}`,
+            aTiles: imageATilesUrl ? `${baseUrl}${imageATilesUrl}` : undefined,
+            bTiles: imageBTilesUrl ? `${baseUrl}${imageBTilesUrl}` : undefined
           });
         }
       } else if (currentJob.status === JobStatus.ERROR) {
@@ -4,6 +4,7 @@ const cors = require('cors');
 const { spawn } = require('child_process');
 const path = require('path');
 const fs = require('fs');
+const crypto = require('crypto');
 
 const app = express();
 const PORT = process.env.PORT || 8080;
@@ -102,108 +103,656 @@ function saveJobs() {
 // Load jobs on startup
 loadJobs();
 
+// Content-addressed result cache: a job whose inputs, snapped AOI and worker
+// code match a finished job reuses that job's outputs instead of running again
+const OUTPUTS_DIR = path.join(__dirname, '../data/outputs');
+const UPLOADS_DIR = path.join(__dirname, '../data/uploads');
+const RESULT_CACHE_FILE = path.join(__dirname, '../data/result_cache.json');
+const RESULT_CACHE_MAX_BYTES = parseInt(process.env.RESULT_CACHE_MAX_BYTES || String(10 * 1024 * 1024 * 1024), 10);
+
+// Worker options applied to every job; they can change the results, so they are part of the cache key
+const WORKER_JOB_OPTIONS = process.env.WORKER_MAX_MEMORY_MB
+  ? ['--max_memory', String(parseInt(process.env.WORKER_MAX_MEMORY_MB, 10))]
+  : [];
+
+// Other algorithm parameters are the worker defaults, covered by the worker source hash
+const WORKER_VERSION = crypto.createHash('sha256')
+  .update(fs.readFileSync(path.join(__dirname, '../worker/worker.py')))
+  .digest('hex');
+
+let resultCache = { hits: 0, misses: 0, evictions: 0, entries: {} };
+
+// Load the result cache index, tracking outputs of jobs finished before it existed
+function loadResultCache() {
+  try {
+    if (fs.existsSync(RESULT_CACHE_FILE)) {
+      resultCache = JSON.parse(fs.readFileSync(RESULT_CACHE_FILE, 'utf8'));
+    }
+  } catch (error) {
+    console.error('Error loading result cache:', error);
+  }
+
+  for (const job of Object.values(jobs)) {
+    if (job.status === 'done' && !job.cachedFrom && !resultCache.entries[job.id]) {
+      const outputDir = path.join(OUTPUTS_DIR, job.id);
+      if (fs.existsSync(outputDir)) {
+        resultCache.entries[job.id] = {
+          key: null,
+          bytes: directorySize(outputDir),
+          lastUsed: job.updatedAt
+        };
+      }
+    }
+  }
+}
+
+// Save the result cache index
+function saveResultCache() {
+  try {
+    fs.writeFileSync(RESULT_CACHE_FILE, JSON.stringify(resultCache, null, 2), 'utf8');
+  } catch (error) {
+    console.error('Error saving result cache:', error);
+  }
+}
+
+// Total size of the files in an output directory
+function directorySize(dir) {
+  return fs.readdirSync(dir, { withFileTypes: true })
+    .filter((entry) => entry.isFile())
+    .reduce((total, entry) => total + fs.statSync(path.join(dir, entry.name)).size, 0);
+}
+
+// Pixel grid of an ingested upload, from the sidecar written by worker/ingest.py
+function loadImageGrid(imageId) {
+  const sidecarPath = path.join(UPLOADS_DIR, `${path.basename(imageId, '.tif')}.json`);
+  try {
+    return JSON.parse(fs.readFileSync(sidecarPath, 'utf8'));
+  } catch (error) {
+    return null;
+  }
+}
+
+// Snap the AOI to whole pixels of a north-up grid, rounding the same way as
+// aoi_window in worker.py, so AOIs that differ by float noise share a key
+function aoiPixelWindow(aoi, grid) {
+  const [a, b, c, d, e, f] = grid.transform;
+  if (b !== 0 || d !== 0) {
+    return null;
+  }
+
+  const cols = [(Number(aoi.west) - c) / a, (Number(aoi.east) - c) / a];
+  const rows = [(Number(aoi.north) - f) / e, (Number(aoi.south) - f) / e];
+  const colOff = Math.floor(Math.min(...cols) + 0.1);
+  const rowOff = Math.floor(Math.min(...rows) + 0.1);
+  const colEnd = colOff + Math.floor(Math.max(...cols) - Math.min(...cols) + 0.5);
+  const rowEnd = rowOff + Math.floor(Math.max(...rows) - Math.min(...rows) + 0.5);
+
+  // Limit to the dataset extent
+  const left = Math.max(colOff, 0);
+  const top = Math.max(rowOff, 0);
+  const right = Math.min(colEnd, grid.width);
+  const bottom = Math.min(rowEnd, grid.height);
+  if (right <= left || bottom <= top) {
+    return null;
+  }
+  return [left, top, right - left, bottom - top];
+}
+
+// Cache key of a job, or null when its inputs are not content-addressed
+function resultCacheKey(imageAId, targetIds, aois) {
+  const imageIds = [imageAId, ...targetIds];
+  if (!imageIds.every((id) => /^[0-9a-f]{64}\.tif$/.test(id))) {
+    return null;
+  }
+
+  const grid = loadImageGrid(imageAId);
+  const windows = grid ? aois.map((aoi) => aoiPixelWindow(aoi, grid)) : [null];
+  if (!windows.every(Boolean)) {
+    return null;
+  }
+
+  // Single-AOI jobs keep the key layout they had before multi-AOI jobs existed
+  const key = windows.length === 1 ? { imageIds, window: windows[0] } : { imageIds, windows };
+  return crypto.createHash('sha256')
+    .update(JSON.stringify({ ...key, options: WORKER_JOB_OPTIONS, workerVersion: WORKER_VERSION }))
+    .digest('hex');
+}
+
+// Find the finished job holding the outputs for a cache key
+function lookupResult(key) {
+  if (!key) {
+    return null;
+  }
+  const entryId = Object.keys(resultCache.entries).find((id) => resultCache.entries[id].key === key);
+  if (!entryId || !jobs[entryId] || !fs.existsSync(path.join(OUTPUTS_DIR, entryId))) {
+    return null;
+  }
+  return entryId;
+}
+
+// Track the outputs of a finished job and evict least recently used outputs
+// until the outputs directory fits the size budget again
+function recordResult(job) {
+  const outputDir = path.join(OUTPUTS_DIR, job.id);
+  resultCache.entries[job.id] = {
+    key: job.cacheKey || null,
+    bytes: fs.existsSync(outputDir) ? directorySize(outputDir) : 0,
+    lastUsed: new Date().toISOString()
+  };
+
+  const entryIds = Object.keys(resultCache.entries)
+    .sort((x, y) => new Date(resultCache.entries[x].lastUsed) - new Date(resultCache.entries[y].lastUsed));
+  let totalBytes = entryIds.reduce((total, id) => total + resultCache.entries[id].bytes, 0);
+
+  for (const entryId of entryIds) {
+    if (totalBytes <= RESULT_CACHE_MAX_BYTES || entryId === job.id) {
+      break;
+    }
+    totalBytes -= resultCache.entries[entryId].bytes;
+    evictResult(entryId);
+  }
+  saveResultCache();
+}
+
+// Delete one job's outputs and fail the jobs that were serving them
+function evictResult(entryId) {
+  fs.rmSync(path.join(OUTPUTS_DIR, entryId), { recursive: true, force: true });
+  delete resultCache.entries[entryId];
+  resultCache.evictions += 1;
+
+  for (const job of Object.values(jobs)) {
+    if (job.id === entryId || job.cachedFrom === entryId) {
+      job.status = 'error';
+      job.error = 'Outputs were evicted from the result cache, please resubmit the job';
+      delete job.outputs;
+      job.updatedAt = new Date().toISOString();
+    }
+  }
+  console.log(`Evicted outputs of job ${entryId} from the result cache`);
+}
+
+// Load the result cache once the jobs are known
+loadResultCache();
+
 // POST /api/upload - Upload a GeoTIFF file
 app.post('/api/upload', upload.single('file'), (req, res) => {
   if (!req.file) {
     return res.status(400).json({ error: 'No file uploaded' });
   }
 
-  // Generate a unique image ID based on the file
-  const imageId = req.file.filename;
+  // Normalize the upload to a tiled COG stored under its content hash, so
+  // identical uploads share one image ID and are only converted once
+  const pythonExecutable = process.env.PYTHON_PATH || 'python';
+  const ingestScript = path.resolve(__dirname, '../worker/ingest.py');
+  const ingestProcess = spawn(pythonExecutable, [ingestScript, req.file.path]);
 
-  res.json({
-    message: 'Upload successful',
-    imageId: imageId
+  let stdout = '';
+  ingestProcess.stdout.on('data', (data) => {
+    stdout += data.toString();
+  });
+
+  ingestProcess.stderr.on('data', (data) => {
+    console.error(`Python ingest stderr: ${data}`);
+  });
+
+  ingestProcess.on('close', (code) => {
+    let result = null;
+    try {
+      result = JSON.parse(stdout.trim().split('\n').pop());
+    } catch (error) {
+      result = null;
+    }
+
+    if (code !== 0 || !result || result.error) {
+      // Drop the raw upload if the ingest stage left it behind
+      fs.rm(req.file.path, { force: true }, () => {});
+      return res.status(400).json({
+        error: `Invalid GeoTIFF: ${result && result.error ? result.error : `ingest exited with code ${code}`}`
+      });
+    }
+
+    res.json({
+      message: 'Upload successful',
+      imageId: result.imageId,
+      sha256: result.sha256,
+      deduplicated: result.deduplicated
+    });
+  });
+});
+
+// Resident Python services (worker/scene_index.py, worker/tile_server.py):
+// requests are JSON lines on stdin carrying an id, and each response on stdout
+// carries the id of its request
+const pythonServices = {};
+
+// Start (or restart) a resident Python service
+function startPythonService(name, script, args) {
+  const pythonExecutable = process.env.PYTHON_PATH || 'python';
+  const serviceScript = path.resolve(__dirname, '../worker', script);
+  const serviceProcess = spawn(pythonExecutable, [serviceScript, '--serve', ...args]);
+  const service = { process: serviceProcess, ready: false, buffer: '', nextId: 0, pending: {} };
+  pythonServices[name] = service;
+
+  serviceProcess.stdout.on('data', (data) => {
+    service.buffer += data.toString();
+    const lines = service.buffer.split('\n');
+    service.buffer = lines.pop();
+    for (const line of lines) {
+      if (!line.trim()) continue;
+      let response;
+      try {
+        response = JSON.parse(line);
+      } catch (error) {
+        console.error(`Invalid response from the ${name}: ${line}`);
+        continue;
+      }
+      if (response.event === 'ready') {
+        service.ready = true;
+        continue;
+      }
+      const pending = service.pending[response.id];
+      if (pending) {
+        delete service.pending[response.id];
+        clearTimeout(pending.timer);
+        if (response.error) {
+          pending.reject(new Error(response.error));
+        } else {
+          pending.resolve(response.result);
+        }
+      }
+    }
+  });
+
+  serviceProcess.stderr.on('data', (data) => {
+    console.error(`Python ${name} stderr: ${data}`);
+  });
+
+  serviceProcess.on('close', (code) => {
+    console.error(`Python ${name} exited with code ${code}`);
+    for (const pending of Object.values(service.pending)) {
+      clearTimeout(pending.timer);
+      pending.reject(new Error(`The ${name} exited`));
+    }
+    service.pending = {};
+    service.ready = false;
+    setTimeout(() => startPythonService(name, script, args), WORKER_RESTART_DELAY_MS);
   });
+}
+
+// Send one request to a resident Python service and wait for its result
+function queryPythonService(name, request, timeoutMs) {
+  const service = pythonServices[name];
+  if (!service || !service.ready) {
+    return Promise.reject(new Error(`The ${name} is not ready`));
+  }
+
+  return new Promise((resolve, reject) => {
+    const id = service.nextId++;
+    const timer = setTimeout(() => {
+      delete service.pending[id];
+      reject(new Error(`The ${name} timed out`));
+    }, timeoutMs);
+    service.pending[id] = { resolve, reject, timer };
+    service.process.stdin.write(JSON.stringify({ ...request, id }) + '\n');
+  });
+}
+
+// Resident spatial index: validates AOIs and finds the uploads covering an
+// AOI from the upload sidecars, without opening any image
+const SCENE_INDEX_TIMEOUT_MS = 5000;
+
+function startSceneIndex() {
+  fs.mkdirSync(UPLOADS_DIR, { recursive: true });
+  startPythonService('scene index', 'scene_index.py', ['--uploads_dir', UPLOADS_DIR]);
+}
+
+function querySceneIndex(request) {
+  return queryPythonService('scene index', request, SCENE_INDEX_TIMEOUT_MS);
+}
+
+// Resident tile renderer: XYZ tiles of job outputs for the map, read through
+// the overviews and kept in an in-memory and an on-disk LRU tile cache
+const TILE_CACHE_DIR = path.join(__dirname, '../data/tile_cache');
+const TILE_DISK_CACHE_MB = parseInt(process.env.TILE_DISK_CACHE_MB || '1024', 10);
+const TILE_MEMORY_CACHE_MB = parseInt(process.env.TILE_MEMORY_CACHE_MB || '64', 10);
+const TILE_TIMEOUT_MS = 30000;
+const TILE_CONTENT_TYPES = { png: 'image/png', webp: 'image/webp' };
+
+function startTileRenderer() {
+  startPythonService('tile renderer', 'tile_server.py', [
+    '--outputs_dir', OUTPUTS_DIR,
+    '--cache_dir', TILE_CACHE_DIR,
+    '--disk_cache_mb', String(TILE_DISK_CACHE_MB),
+    '--memory_cache_mb', String(TILE_MEMORY_CACHE_MB)
+  ]);
+}
+
+// GET /api/scenes?north=..&south=..&east=..&west=.. - Uploads intersecting an AOI, best coverage first
+app.get('/api/scenes', async (req, res) => {
+  const { north, south, east, west } = req.query;
+  if ([north, south, east, west].some((value) => value === undefined || Number.isNaN(Number(value)))) {
+    return res.status(400).json({ error: 'Missing or invalid AOI: north, south, east and west are required' });
+  }
+
+  try {
+    const scenes = await querySceneIndex({ op: 'query', aoi: { north, south, east, west } });
+    res.json({ scenes });
+  } catch (error) {
+    res.status(503).json({ error: error.message });
+  }
 });
 
+// Resident Python worker pool: each process runs one job at a time, requests
+// are JSON lines on stdin and events come back as JSON lines on stdout
+const WORKER_POOL_SIZE = parseInt(process.env.WORKER_POOL_SIZE || '2', 10);
+const MAX_QUEUED_JOBS = parseInt(process.env.MAX_QUEUED_JOBS || '100', 10);
+const WORKER_RESTART_DELAY_MS = 1000;
+
+// Times a job is resumed from its checkpoint after its worker died (e.g. OOM)
+// before it is marked as failed; jobs interrupted by a server restart always resume
+const JOB_RESUME_LIMIT = parseInt(process.env.JOB_RESUME_LIMIT || '2', 10);
+
+const poolWorkers = [];
+const jobQueue = [];
+
+// Worker command line of a job; with resume the worker continues from the
+// checkpoint manifest in the job's output directory
+function jobWorkerArgs(job, resume = false) {
+  const targetIds = job.imageBIds || [job.imageBId];
+  const jobAois = job.aois || [job.aoi];
+  const aoiStrings = jobAois.map((area) => `north=${area.north};south=${area.south};east=${area.east};west=${area.west}`);
+
+  return [
+    '--image_a', path.join(UPLOADS_DIR, job.imageAId),
+    '--image_b', ...targetIds.map((id) => path.join(UPLOADS_DIR, id)),
+    '--aoi', ...aoiStrings,
+    '--out_dir', path.join(OUTPUTS_DIR, job.id),
+    ...WORKER_JOB_OPTIONS,
+    // Overlapped reads, registration and writes; the outputs are the same, so it is not in the cache key
+    ...(process.env.WORKER_PIPELINE === '1' ? ['--pipeline'] : []),
+    // Optional cProfile and tracemalloc dumps written next to the outputs
+    ...(process.env.WORKER_PROFILE_JOBS === '1' ? ['--profile_job', '--trace_memory'] : []),
+    ...(resume ? ['--resume'] : [])
+  ];
+}
+
+// Queue an interrupted job again; it picks up from its checkpoint
+function resumeJob(job, reason) {
+  console.log(`Resuming job ${job.id}: ${reason}`);
+  job.status = 'pending';
+  job.message = `Resuming: ${reason}`;
+  job.resumes = (job.resumes || 0) + 1;
+  job.updatedAt = new Date().toISOString();
+  jobQueue.push({ jobId: job.id, args: jobWorkerArgs(job, true) });
+}
+
+// Requeue the jobs that were queued or running when the server stopped
+function resumeInterruptedJobs() {
+  const interrupted = Object.values(jobs)
+    .filter((job) => job.status === 'pending' || job.status === 'running')
+    .sort((a, b) => new Date(a.createdAt) - new Date(b.createdAt));
+  for (const job of interrupted) {
+    resumeJob(job, 'server restarted');
+  }
+  if (interrupted.length > 0) {
+    saveJobs();
+  }
+}
+
+// Build the job outputs once the worker has finished
+function jobOutputs(jobId, targetIds, aoiCount = 1, prefix = '') {
+  if (aoiCount > 1) {
+    // Multi-AOI outputs carry the AOI number as a file name prefix; the first
+    // AOI's rasters are also exposed at the top level, as B1 is for batches
+    const aois = Array.from({ length: aoiCount }, (_, index) => jobOutputs(jobId, targetIds, 1, `aoi${index + 1}_`));
+    return {
+      ...aois[0],
+      alignmentInfoUrl: `/api/rasters/${jobId}/alignment_info.json`,
+      aois
+    };
+  }
+
+  // Each raster also has a tile URL, whose /{z}/{x}/{y}.png children the map loads
+  if (targetIds.length === 1) {
+    return {
+      imageAUrl: `/api/rasters/${jobId}/${prefix}A_clipped.tif`,
+      imageBUrl: `/api/rasters/${jobId}/${prefix}B_clipped_aligned.tif`,
+      imageATilesUrl: `/api/tiles/${jobId}/${prefix}A_clipped.tif`,
+      imageBTilesUrl: `/api/tiles/${jobId}/${prefix}B_clipped_aligned.tif`
+    };
+  }
+
+  // Batch outputs are numbered in submission order
+  return {
+    imageAUrl: `/api/rasters/${jobId}/${prefix}A_clipped.tif`,
+    imageBUrl: `/api/rasters/${jobId}/${prefix}B1_clipped_aligned.tif`,
+    imageBUrls: targetIds.map((id, index) => `/api/rasters/${jobId}/${prefix}B${index + 1}_clipped_aligned.tif`),
+    imageATilesUrl: `/api/tiles/${jobId}/${prefix}A_clipped.tif`,
+    imageBTilesUrl: `/api/tiles/${jobId}/${prefix}B1_clipped_aligned.tif`,
+    imageBTilesUrls: targetIds.map((id, index) => `/api/tiles/${jobId}/${prefix}B${index + 1}_clipped_aligned.tif`),
+    alignmentInfoUrl: `/api/rasters/${jobId}/alignment_info.json`
+  };
+}
+
+// Apply one worker protocol event to the job store
+function handleWorkerEvent(worker, event) {
+  if (event.event === 'ready') {
+    console.log(`Python pool worker ${worker.index} ready (pid ${event.pid})`);
+    worker.ready = true;
+    dispatchJobs();
+    return;
+  }
+
+  const job = jobs[event.id];
+  if (!job) {
+    return;
+  }
+
+  if (event.event === 'started') {
+    job.status = 'running';
+  } else if (event.event === 'progress') {
+    if (event.aoi !== undefined) {
+      // Multi-AOI jobs report each AOI's own progress next to the job's
+      job.aoiProgress = { ...(job.aoiProgress || {}), [event.aoi]: event.progress };
+    } else {
+      // Pipelined stages overlap, so a late report must not move progress back
+      job.progress = Math.max(job.progress || 0, event.progress);
+      job.message = event.message;
+    }
+  } else if (event.event === 'stage') {
+    // Per-stage wall/CPU time, peak memory and I/O, in completion order
+    // (stages of multi-AOI jobs carry the AOI number)
+    if (event.phase === 'start' && event.aoi === undefined) {
+      job.stage = event.stage;
+      if (event.progress !== undefined) {
+        job.progress = Math.max(job.progress || 0, event.progress);
+      }
+    } else if (event.phase === 'end') {
+      const { event: _event, id: _id, phase: _phase, ...timing } = event;
+      job.stages = [...(job.stages || []), timing];
+    }
+  } else if (event.event === 'done') {
+    job.status = 'done';
+    job.progress = 1;
+    delete job.stage;
+    job.alignmentInfo = event.alignment_info;
+    job.outputs = jobOutputs(job.id, job.imageBIds || [job.imageBId], job.aois ? job.aois.length : 1);
+    recordResult(job);
+  } else if (event.event === 'error') {
+    job.status = 'error';
+    job.error = event.error;
+  }
+  job.updatedAt = new Date().toISOString();
+
+  if (event.event === 'done' || event.event === 'error') {
+    worker.jobId = null;
+    saveJobs();
+    dispatchJobs();
+  }
+}
+
+// Start (or restart) one resident pool worker
+function startPoolWorker(index) {
+  const pythonExecutable = process.env.PYTHON_PATH || 'python';
+  const workerScript = path.resolve(__dirname, '../worker/worker.py');
+  const workerProcess = spawn(pythonExecutable, [workerScript, '--serve']);
+  const worker = { index, process: workerProcess, ready: false, jobId: null, buffer: '' };
+  poolWorkers[index] = worker;
+
+  workerProcess.stdout.on('data', (data) => {
+    worker.buffer += data.toString();
+    const lines = worker.buffer.split('\n');
+    worker.buffer = lines.pop();
+    for (const line of lines) {
+      if (!line.trim()) continue;
+      try {
+        handleWorkerEvent(worker, JSON.parse(line));
+      } catch (error) {
+        console.error(`Invalid event from Python pool worker ${index}: ${line}`);
+      }
+    }
+  });
+
+  // Worker logs go to stderr; job failures are reported through error events
+  workerProcess.stderr.on('data', (data) => {
+    console.log(`Python worker ${index}: ${data}`);
+  });
+
+  workerProcess.on('close', (code) => {
+    console.error(`Python pool worker ${index} exited with code ${code}`);
+    const job = worker.jobId && jobs[worker.jobId];
+    if (job && job.status !== 'done' && job.status !== 'error') {
+      if ((job.resumes || 0) < JOB_RESUME_LIMIT) {
+        resumeJob(job, `worker process exited with code ${code}`);
+      } else {
+        job.status = 'error';
+        job.error = `Worker process exited with code ${code}`;
+        job.updatedAt = new Date().toISOString();
+      }
+      saveJobs();
+    }
+    worker.ready = false;
+    worker.jobId = null;
+    setTimeout(() => startPoolWorker(index), WORKER_RESTART_DELAY_MS);
+  });
+}
+
+// Stop the pool workers with the server, so a job is never resumed while an
+// orphaned worker still writes to its output directory
+function stopPoolWorkers() {
+  for (const worker of poolWorkers) {
+    if (worker) {
+      worker.process.kill();
+    }
+  }
+}
+
+// Hand queued jobs to idle pool workers
+function dispatchJobs() {
+  for (const worker of poolWorkers) {
+    if (jobQueue.length === 0) return;
+    if (!worker || !worker.ready || worker.jobId) continue;
+
+    const { jobId, args } = jobQueue.shift();
+    worker.jobId = jobId;
+    worker.process.stdin.write(JSON.stringify({ id: jobId, args }) + '\n');
+  }
+}
+
 // POST/api/jobs - Create a new alignment job
-app.post('/api/jobs', (req, res) => {
-  const { imageAId, imageBId, aoi } = req.body;
+app.post('/api/jobs', async (req, res) => {
+  const { imageAId, imageBId, imageBIds, aoi, aois } = req.body;
+
+  // A batch job aligns several target images against the same reference
+  const targetIds = Array.isArray(imageBIds) && imageBIds.length > 0 ? imageBIds : (imageBId ? [imageBId] : []);
+
+  // A multi-AOI job processes several AOIs over the same images in one worker run
+  const jobAois = Array.isArray(aois) && aois.length > 0 ? aois : (aoi ? [aoi] : []);
 
   // Validate inputs
-  if (!imageAId || !imageBId || !aoi || !aoi.north || !aoi.south || !aoi.east || !aoi.west) {
+  if (!imageAId || targetIds.length === 0 || jobAois.length === 0 ||
+      !jobAois.every((area) => area && area.north && area.south && area.east && area.west)) {
     return res.status(400).json({ error: 'Missing required parameters: imageAId, imageBId, or aoi' });
   }
 
+  // Reject AOIs that miss the images; the worker repeats the check if the index is unavailable
+  try {
+    const problems = await querySceneIndex({ op: 'validate', imageAId, imageBIds: targetIds, aois: jobAois });
+    if (problems.length > 0) {
+      return res.status(400).json({ error: `Invalid AOI: ${problems.join('; ')}` });
+    }
+  } catch (error) {
+    console.error('Skipping AOI validation:', error.message);
+  }
+
   // Generate a unique job ID
   const jobId = `job-${Date.now()}-${Math.round(Math.random() * 1E6)}`;
 
+  // Serve repeated requests from the result cache without running a worker
+  const cacheKey = resultCacheKey(imageAId, targetIds, jobAois);
+  const cachedJobId = lookupResult(cacheKey);
+  if (cachedJobId) {
+    resultCache.hits += 1;
+    resultCache.entries[cachedJobId].lastUsed = new Date().toISOString();
+    saveResultCache();
+
+    jobs[jobId] = {
+      id: jobId,
+      status: 'done',
+      progress: 1,
+      imageAId,
+      imageBId: targetIds[0],
+      imageBIds: targetIds,
+      aoi: jobAois[0],
+      ...(jobAois.length > 1 ? { aois: jobAois } : {}),
+      cacheKey,
+      cachedFrom: cachedJobId,
+      alignmentInfo: jobs[cachedJobId].alignmentInfo,
+      outputs: jobOutputs(cachedJobId, targetIds, jobAois.length),
+      createdAt: new Date().toISOString(),
+      updatedAt: new Date().toISOString()
+    };
+    saveJobs();
+    return res.json({ jobId });
+  }
+
+  // Bound the queue so a burst of submissions cannot pile up unbounded work
+  if (jobQueue.length >= MAX_QUEUED_JOBS) {
+    return res.status(503).json({ error: 'Too many queued jobs, please retry later' });
+  }
+
+  if (cacheKey) {
+    resultCache.misses += 1;
+    saveResultCache();
+  }
+
   // Initialize job in our store
   jobs[jobId] = {
     id: jobId,
     status: 'pending',
     progress: 0,
     imageAId,
-    imageBId,
-    aoi,
+    imageBId: targetIds[0],
+    imageBIds: targetIds,
+    aoi: jobAois[0],
+    ...(jobAois.length > 1 ? { aois: jobAois } : {}),
+    cacheKey,
     createdAt: new Date().toISOString(),
     updatedAt: new Date().toISOString()
   };
 
-  // Save to persistent storage
-  saveJobs();
-
   try {
-    // Define paths for the Python worker
-    const pythonExecutable = process.env.PYTHON_PATH || 'python';
-    const workerScript = path.resolve(__dirname, '../worker/worker.py');
-    const outputDir = path.resolve(__dirname, `../data/outputs/${jobId}`);
+    const outputDir = path.join(OUTPUTS_DIR, jobId);
 
     // Create output directory if it doesn't exist
     if (!fs.existsSync(outputDir)) {
       fs.mkdirSync(outputDir, { recursive: true });
     }
 
-    // Prepare the AOI as a string in the expected format
-    const aoiString = `north=${aoi.north};south=${aoi.south};east=${aoi.east};west=${aoi.west}`;
-
-    // Update job status to 'running'
-    jobs[jobId].status = 'running';
-    jobs[jobId].updatedAt = new Date().toISOString();
+    // Queue the job for the resident worker pool
+    jobQueue.push({ jobId, args: jobWorkerArgs(jobs[jobId]) });
     saveJobs();
-
-    // Spawn the Python worker process
-    const workerProcess = spawn(pythonExecutable, [
-      workerScript,
-      '--image_a', path.join(__dirname, `../data/uploads/${imageAId}`),
-      '--image_b', path.join(__dirname, `../data/uploads/${imageBId}`),
-      '--aoi', aoiString,
-      '--out_dir', outputDir
-    ]);
-
-    // Handle process output
-    workerProcess.stdout.on('data', (data) => {
-      console.log(`Python worker output: ${data}`);
-    });
-
-    workerProcess.stderr.on('data', (data) => {
-      console.error(`Python worker error: ${data}`);
-      jobs[jobId].status = 'error';
-      jobs[jobId].error = data.toString();
-      jobs[jobId].updatedAt = new Date().toISOString();
-      saveJobs();
-    });
-
-    workerProcess.on('close', (code) => {
-      console.log(`Python worker process exited with code ${code}`);
-
-      if (code === 0) {
-        // Process completed successfully
-        jobs[jobId].status = 'done';
-        jobs[jobId].outputs = {
-          imageAUrl: `/api/rasters/${jobId}/A_clipped.tif`,
-          imageBUrl: `/api/rasters/${jobId}/B_clipped_aligned.tif`
-        };
-      } else if (jobs[jobId].status !== 'error') {
-        // Process failed but not due to stderr error
-        jobs[jobId].status = 'error';
-        jobs[jobId].error = `Process failed with exit code ${code}`;
-      }
-
-      jobs[jobId].updatedAt = new Date().toISOString();
-      saveJobs();
-    });
+    dispatchJobs();
 
     // Return immediately with the job ID
     res.json({ jobId });
@@ -242,6 +791,19 @@ app.get('/api/jobs/:jobId', (req, res) => {
   res.json(job);
 });
 
+// GET /api/cache - Result cache counters and disk use
+app.get('/api/cache', (req, res) => {
+  const entries = Object.values(resultCache.entries);
+  res.json({
+    hits: resultCache.hits,
+    misses: resultCache.misses,
+    evictions: resultCache.evictions,
+    entries: entries.length,
+    bytes: entries.reduce((total, entry) => total + entry.bytes, 0),
+    maxBytes: RESULT_CACHE_MAX_BYTES
+  });
+});
+
 // GET /api/rasters/:jobId/:filename - Serve processed raster files
 app.get('/api/rasters/:jobId/:filename', (req, res) => {
   const { jobId, filename } = req.params;
@@ -261,6 +823,55 @@ app.get('/api/rasters/:jobId/:filename', (req, res) => {
   });
 });
 
+// Path of a finished job's output for the tile routes, or null
+function tileSourcePath(jobId, filename) {
+  const job = jobs[jobId];
+  if (!job || job.status !== 'done') {
+    return null;
+  }
+  const filePath = path.join(OUTPUTS_DIR, path.basename(jobId), path.basename(filename));
+  return fs.existsSync(filePath) ? filePath : null;
+}
+
+// GET /api/tiles/:jobId/:filename - Bounds and zoom range of the tiles of a job output
+app.get('/api/tiles/:jobId/:filename', async (req, res) => {
+  const { jobId, filename } = req.params;
+  if (!tileSourcePath(jobId, filename)) {
+    return res.status(404).json({ error: 'File not found' });
+  }
+
+  try {
+    const info = await queryPythonService('tile renderer', { op: 'info', jobId, filename }, TILE_TIMEOUT_MS);
+    res.json(info);
+  } catch (error) {
+    res.status(503).json({ error: error.message });
+  }
+});
+
+// GET /api/tiles/:jobId/:filename/:z/:x/:y.:format - One XYZ tile of a job output as PNG or WebP
+app.get('/api/tiles/:jobId/:filename/:z/:x/:y.:format', async (req, res) => {
+  const { jobId, filename, z, x, y, format } = req.params;
+  if (!TILE_CONTENT_TYPES[format] || ![z, x, y].every((value) => /^\d+$/.test(value))) {
+    return res.status(400).json({ error: 'Tiles are addressed as /{z}/{x}/{y}.png or /{z}/{x}/{y}.webp' });
+  }
+  if (!tileSourcePath(jobId, filename)) {
+    return res.status(404).json({ error: 'File not found' });
+  }
+
+  try {
+    const tile = await queryPythonService('tile renderer', {
+      op: 'tile', jobId, filename, z: Number(z), x: Number(x), y: Number(y), format
+    }, TILE_TIMEOUT_MS);
+    res.setHeader('Content-Type', TILE_CONTENT_TYPES[format]);
+    // Outputs of a finished job never change
+    res.setHeader('Cache-Control', 'public, max-age=86400');
+    res.send(Buffer.from(tile.data, 'base64'));
+  } catch (error) {
+    // The renderer rejects tiles outside the grid with a ValueError
+    res.status(error.message.startsWith('ValueError') ? 400 : 503).json({ error: error.message });
+  }
+});
+
 // Error handling middleware
 app.use((error, req, res, next) => {
   if (error instanceof multer.MulterError) {
@@ -272,26 +883,41 @@ app.use((error, req, res, next) => {
 });
 
 // Graceful shutdown - save jobs before exit
+// Running jobs stay 'running' in the store and resume on the next start
 process.on('SIGINT', () => {
   console.log('\nGracefully shutting down...');
   saveJobs();
+  stopPoolWorkers();
   process.exit(0);
 });
 
 process.on('SIGTERM', () => {
   console.log('\nGracefully shutting down...');
   saveJobs();
+  stopPoolWorkers();
   process.exit(0);
 });
 
-// Start the server
+// Resume interrupted jobs, then start the resident Python workers, the spatial index,
+// the tile renderer and the server
+resumeInterruptedJobs();
+for (let index = 0; index < WORKER_POOL_SIZE; index++) {
+  startPoolWorker(index);
+}
+startSceneIndex();
+startTileRenderer();
+
 app.listen(PORT, () => {
   console.log(`✅ Server is running on port ${PORT}`);
   console.log(`📊 Loaded ${Object.keys(jobs).length} existing jobs`);
+  console.log(`🐍 Python worker pool: ${WORKER_POOL_SIZE} processes, queue limit ${MAX_QUEUED_JOBS}`);
   console.log(`API endpoints available:`);
   console.log(`  POST /api/upload - Upload GeoTIFF files`);
   console.log(`  POST /api/jobs   - Create alignment job`);
   console.log(`  GET  /api/jobs   - List all jobs`);
   console.log(`  GET  /api/jobs/:jobId - Get job status`);
+  console.log(`  GET  /api/cache  - Result cache statistics`);
+  console.log(`  GET  /api/scenes - Uploads intersecting an AOI`);
   console.log(`  GET  /api/rasters/:jobId/:filename - Serve processed rasters`);
+  console.log(`  GET  /api/tiles/:jobId/:filename/:z/:x/:y.png - XYZ tiles of processed rasters`);
 });
\ No newline at end of file
@@ -92,6 +92,69 @@ const GeoTiffLayer: React.FC<GeoTiffLayerProps> = ({ url, map }) => {
   return null;
 };
 
+interface TileInfo {
+  bounds: [number, number, number, number];
+  minzoom: number;
+  maxzoom: number;
+}
+
+interface XyzTileLayerProps {
+  tilesUrl: string;
+  map: Map | null;
+}
+
+// Job outputs are rendered by the API as XYZ tiles, so only the visible
+// tiles are downloaded instead of the whole GeoTIFF
+const XyzTileLayer: React.FC<XyzTileLayerProps> = ({ tilesUrl, map }) => {
+  useEffect(() => {
+    if (!tilesUrl || !map) return;
+
+    const abortController = new AbortController();
+    let layer: L.TileLayer | null = null;
+
+    const addTileLayer = async () => {
+      try {
+        // Bounds and native zoom of the raster keep requests to tiles it covers
+        const response = await fetch(tilesUrl, { signal: abortController.signal });
+        if (!response.ok) {
+          throw new Error(`Failed to fetch tile info: ${response.statusText}`);
+        }
+        const info: TileInfo = await response.json();
+        const [west, south, east, north] = info.bounds;
+        const bounds = L.latLngBounds([south, west], [north, east]);
+
+        layer = L.tileLayer(`${tilesUrl}/{z}/{x}/{y}.png`, {
+          bounds,
+          maxNativeZoom: info.maxzoom,
+          opacity: 0.9,
+        });
+        layer.addTo(map);
+
+        // Only fit bounds if we're at default zoom
+        if (map.getZoom() === 13 && bounds.isValid()) {
+          map.fitBounds(bounds, { padding: [20, 20] });
+        }
+      } catch (error: any) {
+        if (error.name !== 'AbortError') {
+          console.error('Error loading tiles:', error);
+        }
+      }
+    };
+
+    addTileLayer();
+
+    return () => {
+      abortController.abort();
+      if (layer) {
+        map.removeLayer(layer);
+        layer = null;
+      }
+    };
+  }, [tilesUrl, map]);
+
+  return null;
+};
+
 interface DrawControlProps {
   onAoiSelect: (bounds: number[][]) => void;
   isProcessing: boolean;
@@ -197,10 +260,18 @@ const DrawControl: React.FC<DrawControlProps> = ({
   return null;
 };
 
+export interface ProcessedImageUrls {
+  a: string;
+  b: string;
+  // Tile URLs of the same rasters, preferred over downloading them whole
+  aTiles?: string;
+  bTiles?: string;
+}
+
 interface MapViewProps {
   imageAUrl: string | null;
   imageBUrl: string | null;
-  processedImageUrls: { a: string, b: string } | null;
+  processedImageUrls: ProcessedImageUrls | null;
   onAoiSelect: (bounds: number[][]) => void;
   isProcessing: boolean;
 }
@@ -296,6 +367,8 @@ const MapView: React.FC<MapViewProps> = ({
 
   const displayUrlA = processedImageUrls?.a || imageAUrl;
   const displayUrlB = processedImageUrls?.b || imageBUrl;
+  const tilesUrlA = processedImageUrls?.aTiles;
+  const tilesUrlB = processedImageUrls?.bTiles;
 
   return (
     <div className="split-view-container relative">
@@ -325,7 +398,9 @@ const MapView: React.FC<MapViewProps> = ({
             attribution='Tiles &copy; Esri &mdash; Source: Esri, i-cubed, USDA, USGS, AEX, GeoEye, Getmapping, Aerogrid, IGN, IGP, UPR-EGP, and the GIS User Community'
             url="https://server.arcgisonline.com/ArcGIS/rest/services/World_Imagery/MapServer/tile/{z}/{y}/{x}"
           />
-          {displayUrlA && <GeoTiffLayer url={displayUrlA} map={mapA} />}
+          {tilesUrlA
+            ? <XyzTileLayer tilesUrl={tilesUrlA} map={mapA} />
+            : displayUrlA && <GeoTiffLayer url={displayUrlA} map={mapA} />}
           <DrawControl
             onAoiSelect={onAoiSelect}
             isProcessing={isProcessing}
@@ -353,7 +428,9 @@ const MapView: React.FC<MapViewProps> = ({
             attribution='Tiles &copy; Esri &mdash; Source: Esri, i-cubed, USDA, USGS, AEX, GeoEye, Getmapping, Aerogrid, IGN, IGP, UPR-EGP, and the GIS User Community'
             url="https://server.arcgisonline.com/ArcGIS/rest/services/World_Imagery/MapServer/tile/{z}/{y}/{x}"
           />
-          {displayUrlB && <GeoTiffLayer url={displayUrlB} map={mapB} />}
+          {tilesUrlB
+            ? <XyzTileLayer tilesUrl={tilesUrlB} map={mapB} />
+            : displayUrlB && <GeoTiffLayer url={displayUrlB} map={mapB} />}
           <DrawControl
             onAoiSelect={onAoiSelect}
             isProcessing={isProcessing}
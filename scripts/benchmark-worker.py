@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+Offline Benchmark Suite for the Alignment Worker
+
+This script synthesizes raster pairs with a known shift using the sample
+data generator, then times clip_image_to_aoi, align_images and save_geotiff
+separately for every combination of size, data type, band count and layout.
+Every case is also run as a whole worker job (run_job on the file-backed
+pair, as a job submitted through the API runs), the path that windowed and
+pipelined processing actually speed up. The stages and the job each run in
+a fresh process so their peak memory is measured in isolation. Results are
+written as a JSON report that can be compared across commits with
+--compare.
+"""
+
+import argparse
+import importlib.util
+import itertools
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+WORKER_DIR = os.path.join(SCRIPTS_DIR, '..', 'worker')
+
+# Same footprint as the sample images; the AOI covers its central 80%
+BOUNDS = (-122.5, 37.7, -122.3, 37.9)
+AOI = {'west': -122.48, 'south': 37.72, 'east': -122.32, 'north': 37.88}
+
+# Ground-truth (row, col) offset of image B's texture
+SHIFT = (37, -21)
+
+STAGES = ("clip", "align", "save")
+
+def aoi_string(aoi):
+    """AOI in the worker's --aoi format."""
+    return ";".join(f"{key}={aoi[key]}" for key in ("north", "south", "east", "west"))
+
+def load_generator():
+    """Import scripts/generate-sample-data.py, whose file name is not a module name."""
+    spec = importlib.util.spec_from_file_location(
+        "generate_sample_data", os.path.join(SCRIPTS_DIR, "generate-sample-data.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def reset_peak_rss():
+    """Reset the peak RSS counter of this process where the kernel allows it."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is in KB on Linux and in bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / (1024 * 1024) if sys.platform == 'darwin' else maxrss / 1024
+
+def case_name(case):
+    """File name stem of a benchmark case."""
+    return f"{case['size']}px_{case['dtype']}_{case['bands']}b_{case['layout']}"
+
+def generate_case(case, work_dir):
+    """
+    Synthesize the image pair of a case unless it already exists.
+    
+    Returns:
+        Tuple of (image A path, image B path)
+    """
+    generator = load_generator()
+    paths = []
+    for label, offset in (("a", (0, 0)), ("b", SHIFT)):
+        path = os.path.join(work_dir, f"{case_name(case)}_{label}.tif")
+        if not os.path.exists(path):
+            generator.create_synthetic_geotiff(
+                path, BOUNDS, size=(case['size'], case['size']), offset=offset, dtype=case['dtype'],
+                count=case['bands'], tiled=case['layout'] == 'tiled')
+        paths.append(path)
+    return tuple(paths)
+
+def run_case(case, work_dir):
+    """
+    Time the worker stages for one case. Runs inside a fresh process.
+    
+    Returns:
+        Case result with per-stage wall time and peak RSS, and the recovered shift
+    """
+    sys.path.insert(0, WORKER_DIR)
+    import worker
+    
+    image_a, image_b = case['paths']
+    output_path = os.path.join(work_dir, f"{case_name(case)}_aligned.tif")
+    cog_options = worker.cog_creation_options() if case['output_format'] == 'cog' else None
+    stages = {}
+    
+    def timed(stage, func, *args, **kwargs):
+        exact_peak = reset_peak_rss()
+        started = time.perf_counter()
+        result = func(*args, **kwargs)
+        stages[stage] = {
+            'seconds': round(time.perf_counter() - started, 4),
+            'peak_rss_mb': round(peak_rss_mb(), 1),
+            # Without a resettable counter the peak covers all earlier stages too
+            'peak_rss_exact': exact_peak
+        }
+        return result
+    
+    def clip_both():
+        return worker.clip_image_to_aoi(image_a, AOI), worker.clip_image_to_aoi(image_b, AOI)
+    
+    clip_a, clip_b = timed("clip", clip_both)
+    aligned, alignment_info = timed("align", worker.align_images, clip_a, clip_b, case['registration'],
+                                    fft_options={'backend': case['fft_backend'], 'threads': os.cpu_count()})
+    
+    import rasterio
+    with rasterio.open(image_a) as src:
+        window = worker.aoi_window(src, AOI)
+    timed("save", worker.save_geotiff, aligned, output_path, reference_path=image_a, window=window,
+          cog_options=cog_options)
+    
+    recovered = (alignment_info['shift_y'], alignment_info['shift_x'])
+    return {
+        **{key: value for key, value in case.items() if key != 'paths'},
+        'clip_shape': list(clip_a.shape),
+        'input_bytes': os.path.getsize(image_a) + os.path.getsize(image_b),
+        'output_bytes': os.path.getsize(output_path),
+        'stages': stages,
+        'expected_shift': list(SHIFT),
+        'recovered_shift': [int(value) for value in recovered],
+        'shift_ok': tuple(recovered) == SHIFT
+    }
+
+def run_job_case(case, work_dir):
+    """
+    Time a whole worker job for one case. Runs inside a fresh process.
+    
+    Returns:
+        Job wall time and peak RSS, output size and the recovered shift
+    """
+    sys.path.insert(0, WORKER_DIR)
+    import worker
+    
+    image_a, image_b = case['paths']
+    out_dir = os.path.join(work_dir, f"{case_name(case)}_job")
+    shutil.rmtree(out_dir, ignore_errors=True)
+    argv = ["--image_a", image_a, "--image_b", image_b, "--aoi", aoi_string(AOI), "--out_dir", out_dir,
+            "--registration", case['registration'], "--fft_backend", case['fft_backend'],
+            "--output_format", case['output_format']]
+    if case['pipeline']:
+        argv.append("--pipeline")
+    if case['max_memory']:
+        argv += ["--max_memory", str(case['max_memory'])]
+    args = worker.parse_job_args(worker.build_parser(), argv)
+    
+    started = time.perf_counter()
+    alignment_info = worker.execute_job(args)
+    seconds = time.perf_counter() - started
+    
+    recovered = (alignment_info['shift_y'], alignment_info['shift_x'])
+    output_bytes = sum(os.path.getsize(os.path.join(out_dir, name))
+                       for name in os.listdir(out_dir) if name.endswith(".tif"))
+    return {
+        'seconds': round(seconds, 4),
+        # The process starts fresh, so its peak is the job's own
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+        'output_bytes': output_bytes,
+        'recovered_shift': [int(value) for value in recovered],
+        'shift_ok': tuple(recovered) == SHIFT
+    }
+
+def run_case_isolated(case, work_dir, entry="--run_case"):
+    """Run one case in a fresh interpreter (entry --run_case or --run_job) and return its result."""
+    completed = subprocess.run([sys.executable, os.path.abspath(__file__), "--work_dir", work_dir,
+                                entry, json.dumps(case)], capture_output=True, text=True)
+    if completed.returncode != 0:
+        lines = completed.stderr.strip().splitlines()
+        return {**{key: value for key, value in case.items() if key != 'paths'},
+                'error': lines[-1] if lines else f"exited with code {completed.returncode}"}
+    # The worker prints its own progress lines before the result
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+def environment_info():
+    """Versions and host details recorded with every report."""
+    import numpy
+    import rasterio
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=SCRIPTS_DIR,
+                                capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'numpy': numpy.__version__,
+        'rasterio': rasterio.__version__,
+        'gdal': rasterio.__gdal_version__,
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count()
+    }
+
+def compare_reports(report, baseline):
+    """Print per-stage time ratios of this report against a baseline report."""
+    previous = {case_name(case): case for case in baseline['cases'] if 'stages' in case}
+    print(f"\nComparison against {baseline['environment'].get('commit')} (ratio < 1 is faster)")
+    for case in report['cases']:
+        name = case_name(case)
+        if 'stages' not in case or name not in previous:
+            continue
+        ratios = []
+        for stage in STAGES:
+            before = previous[name]['stages'][stage]['seconds']
+            ratios.append(f"{stage} {case['stages'][stage]['seconds'] / before:.2f}x" if before else f"{stage} n/a")
+        if 'seconds' in case.get('job', {}) and previous[name].get('job', {}).get('seconds'):
+            ratios.append(f"job {case['job']['seconds'] / previous[name]['job']['seconds']:.2f}x")
+        print(f"  {name}: " + ", ".join(ratios))
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the worker stages and whole jobs on synthetic rasters")
+    parser.add_argument("--sizes", type=int, nargs='+', default=[1024, 4096], help="Square image sizes in pixels")
+    parser.add_argument("--dtypes", nargs='+', default=["uint8", "uint16", "float32"], help="Pixel data types")
+    parser.add_argument("--bands", type=int, nargs='+', default=[1, 3], help="Band counts")
+    parser.add_argument("--layouts", nargs='+', choices=["tiled", "striped"], default=["tiled", "striped"],
+                        help="Internal GeoTIFF layouts")
+    parser.add_argument("--registration", default="full", help="Registration method passed to align_images")
+    parser.add_argument("--fft_backend", default="scipy", help="FFT backend passed to align_images")
+    parser.add_argument("--output_format", choices=["cog", "gtiff"], default="cog", help="Format written by save_geotiff")
+    parser.add_argument("--pipeline", action="store_true", help="Run the job benchmark with the worker's --pipeline")
+    parser.add_argument("--max_memory", type=int, help="Memory budget in MB passed to the job benchmark's --max_memory")
+    parser.add_argument("--work_dir", help="Directory for synthetic inputs, reused across runs (default: temporary)")
+    parser.add_argument("--report", default="benchmark-report.json", help="Path of the JSON report")
+    parser.add_argument("--compare", help="Earlier report to compare stage timings against")
+    parser.add_argument("--run_case", help=argparse.SUPPRESS)
+    parser.add_argument("--run_job", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    # Child process of run_case_isolated
+    if args.run_case:
+        print(json.dumps(run_case(json.loads(args.run_case), args.work_dir)))
+        return
+    if args.run_job:
+        print(json.dumps(run_job_case(json.loads(args.run_job), args.work_dir)))
+        return
+    
+    temporary = None
+    if args.work_dir:
+        os.makedirs(args.work_dir, exist_ok=True)
+        work_dir = args.work_dir
+    else:
+        temporary = tempfile.TemporaryDirectory(prefix="worker-benchmark-")
+        work_dir = temporary.name
+    
+    print("Benchmarking worker stages")
+    print("=" * 50)
+    
+    cases = []
+    for size, dtype, bands, layout in itertools.product(args.sizes, args.dtypes, args.bands, args.layouts):
+        case = {'size': size, 'dtype': dtype, 'bands': bands, 'layout': layout,
+                'registration': args.registration, 'fft_backend': args.fft_backend,
+                'output_format': args.output_format, 'pipeline': args.pipeline, 'max_memory': args.max_memory}
+        case['paths'] = generate_case(case, work_dir)
+        result = run_case_isolated(case, work_dir)
+        result['job'] = run_case_isolated(case, work_dir, "--run_job")
+        cases.append(result)
+        
+        if 'error' in result:
+            print(f"{case_name(case)}: FAILED - {result['error']}")
+            continue
+        timings = ", ".join(f"{stage} {result['stages'][stage]['seconds']:.3f} s / "
+                            f"{result['stages'][stage]['peak_rss_mb']:.0f} MB" for stage in STAGES)
+        print(f"{case_name(case)}: {timings}, shift {'ok' if result['shift_ok'] else 'WRONG ' + str(result['recovered_shift'])}")
+        job = result['job']
+        if 'error' in job:
+            print(f"  job: FAILED - {job['error']}")
+        else:
+            print(f"  job: {job['seconds']:.3f} s / {job['peak_rss_mb']:.0f} MB, "
+                  f"shift {'ok' if job['shift_ok'] else 'WRONG ' + str(job['recovered_shift'])}")
+    
+    report = {'environment': environment_info(), 'shift': list(SHIFT), 'aoi': AOI, 'cases': cases}
+    with open(args.report, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport written to {args.report}")
+    
+    if args.compare:
+        with open(args.compare) as f:
+            compare_reports(report, json.load(f))
+    
+    if temporary:
+        temporary.cleanup()
+    
+    if any('error' in case or not case['shift_ok'] or not case['job'].get('shift_ok') for case in cases):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
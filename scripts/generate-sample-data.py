@@ -8,6 +8,7 @@ for testing the image alignment functionality.
 
 import numpy as np
 import rasterio
+import rasterio.windows
 from rasterio.transform import from_bounds
 import os
 
@@ -62,6 +63,73 @@ def create_sample_geotiff(filename, bounds, size=(500, 500), offset=(0, 0)):
     ) as dst:
         dst.write(raster)
 
+def synthetic_texture(rows, cols, seed=0):
+    """
+    Deterministic texture defined for any pixel coordinates.
+    
+    Coarse 16x16 pixel blobs plus per-pixel noise, both derived from a hash of
+    the global coordinates, so any block of a large raster can be generated
+    on its own and a shifted copy is an exact translation of the original.
+    
+    Args:
+        rows: 1-D array of global row indices
+        cols: 1-D array of global column indices
+        seed: Texture seed
+    
+    Returns:
+        float32 array in [0, 1) of shape (len(rows), len(cols))
+    """
+    rows = (np.asarray(rows, dtype=np.int64) & 0xFFFFFFFF).astype(np.uint32)[:, np.newaxis]
+    cols = (np.asarray(cols, dtype=np.int64) & 0xFFFFFFFF).astype(np.uint32)[np.newaxis, :]
+    
+    def coordinate_hash(y, x):
+        h = (y * np.uint32(0x9E3779B1)) ^ (x * np.uint32(0x85EBCA77)) ^ np.uint32(seed)
+        h ^= h >> np.uint32(15)
+        h *= np.uint32(0x2C1B3C6D)
+        h ^= h >> np.uint32(12)
+        return (h & np.uint32(0xFFFF)).astype(np.float32) / 65536
+    
+    return 0.8 * coordinate_hash(rows >> np.uint32(4), cols >> np.uint32(4)) + 0.2 * coordinate_hash(rows, cols)
+
+def create_synthetic_geotiff(filename, bounds, size=(4096, 4096), offset=(0, 0), dtype='uint8',
+                             count=1, tiled=True, block_size=256, seed=0):
+    """
+    Create a GeoTIFF of any size from the synthetic texture, one row of blocks at a time.
+    
+    Args:
+        filename: Output filename
+        bounds: (minx, miny, maxx, maxy) in coordinate system
+        size: (width, height) in pixels
+        offset: (row_offset, col_offset) of the texture in pixels, the ground-truth shift
+        dtype: Output data type (uint8, uint16 or float32)
+        count: Number of bands
+        tiled: Write internal tiles instead of strips
+        block_size: Tile size, and the number of rows generated per write
+        seed: Texture seed
+    """
+    width, height = size
+    minx, miny, maxx, maxy = bounds
+    transform = from_bounds(minx, miny, maxx, maxy, width, height)
+    
+    # Full range of the integer types, reflectance-like values for floats
+    scale = 1.0 if np.dtype(dtype).kind == 'f' else float(np.iinfo(dtype).max)
+    
+    profile = dict(driver='GTiff', height=height, width=width, count=count, dtype=dtype,
+                   crs='EPSG:4326', transform=transform, BIGTIFF='IF_SAFER')
+    if tiled:
+        profile.update(tiled=True, blockxsize=block_size, blockysize=block_size)
+    
+    cols = np.arange(width) + offset[1]
+    with rasterio.open(filename, 'w', **profile) as dst:
+        for row_off in range(0, height, block_size):
+            rows = np.arange(row_off, min(row_off + block_size, height)) + offset[0]
+            texture = synthetic_texture(rows, cols, seed)
+            
+            # Each band is a differently scaled copy of the texture
+            block = np.stack([texture * (1 - 0.2 * (band % 4)) for band in range(count)])
+            window = rasterio.windows.Window(0, row_off, width, len(rows))
+            dst.write((block * scale).astype(dtype), window=window)
+
 def main():
     # Create sample data directory if it doesn't exist
     sample_dir = '../data/sample-data'
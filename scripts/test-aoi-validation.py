@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+AOI Validation Test for the Scene Index
+
+This script ingests synthetic GeoTIFF pairs in a projected CRS, as uploads
+are, and checks that validate_aoi accepts an AOI given in the images' own
+coordinates, as the worker clips them, and names each image an AOI misses.
+The accepted pair is then run through a whole worker job.
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+WORKER_DIR = os.path.join(SCRIPTS_DIR, '..', 'worker')
+
+# UTM zone 10N (San Francisco) footprint of the images, in metres
+CRS = "EPSG:32610"
+BOUNDS = (545000.0, 4175000.0, 555000.0, 4185000.0)
+
+# Ground-truth (row, col) offset of image B's texture
+SHIFT = (37, -21)
+
+def load_generator():
+    """Import scripts/generate-sample-data.py, whose file name is not a module name."""
+    spec = importlib.util.spec_from_file_location(
+        "generate_sample_data", os.path.join(SCRIPTS_DIR, "generate-sample-data.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def aoi_string(aoi):
+    """AOI in the worker's --aoi format."""
+    return ";".join(f"{key}={aoi[key]}" for key in ("north", "south", "east", "west"))
+
+def ingest_pair(generator, ingest, work_dir, bounds_b):
+    """Write a projected pair (Image B over bounds_b) and ingest both; returns their stored paths."""
+    import rasterio
+    
+    uploads_dir = os.path.join(work_dir, "uploads")
+    os.makedirs(uploads_dir, exist_ok=True)
+    paths = []
+    for name, bounds, offset in (("a.tif", BOUNDS, (0, 0)), ("b.tif", bounds_b, SHIFT)):
+        path = os.path.join(work_dir, name)
+        generator.create_synthetic_geotiff(path, bounds, size=(1024, 1024), offset=offset, dtype='uint16')
+        with rasterio.open(path, 'r+') as dst:
+            dst.crs = CRS
+        result = ingest.ingest_upload(path, uploads_dir)
+        paths.append(os.path.join(uploads_dir, result['imageId']))
+    return paths
+
+def check(label, problems, expected):
+    """Compare the images validate_aoi named against the expected ones; returns 1 on a mismatch."""
+    named = sorted(image for image in ("Image A", "Image B") if any(image in problem for problem in problems))
+    if named != sorted(expected):
+        print(f"  {label}: expected problems for {expected or 'no image'}, got {problems}")
+        return 1
+    print(f"  {label}: ok")
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser(description="Check AOI validation of projected-CRS uploads")
+    parser.parse_args()
+    
+    sys.path.insert(0, WORKER_DIR)
+    import ingest
+    from scene_index import validate_aoi
+    generator = load_generator()
+    
+    print("Testing AOI validation in projected coordinates")
+    print("=" * 50)
+    
+    failures = 0
+    west, south, east, north = BOUNDS
+    inside = {'west': west + 1000, 'south': south + 1000, 'east': east - 1000, 'north': north - 1000}
+    with tempfile.TemporaryDirectory() as work_dir:
+        image_a, image_b = ingest_pair(generator, ingest, work_dir, BOUNDS)
+        failures += check("AOI inside both images", validate_aoi(image_a, [image_b], inside), [])
+        # The same AOI in degrees lies far outside the projected grids
+        degrees = {'west': -122.48, 'south': 37.72, 'east': -122.32, 'north': 37.88}
+        failures += check("AOI in degrees", validate_aoi(image_a, [image_b], degrees), ["Image A", "Image B"])
+        
+        completed = subprocess.run([sys.executable, os.path.join(WORKER_DIR, "worker.py"), "--image_a", image_a,
+                                    "--image_b", image_b, "--aoi", aoi_string(inside),
+                                    "--out_dir", os.path.join(work_dir, "out")], capture_output=True, text=True)
+        if completed.returncode != 0:
+            failures += 1
+            print(f"  job failed: {completed.stderr.strip().splitlines()[-1]}")
+        else:
+            with open(os.path.join(work_dir, "out", "alignment_info.json")) as f:
+                info = json.load(f)
+            print(f"  job ok, shift {[info['shift_y'], info['shift_x']]}")
+    
+    with tempfile.TemporaryDirectory() as work_dir:
+        # Image B lies next to Image A, so the AOI only covers A
+        image_a, image_b = ingest_pair(generator, ingest, work_dir,
+                                       (east + 5000, south, east + 15000, north))
+        failures += check("Image B beside the AOI", validate_aoi(image_a, [image_b], inside), ["Image B"])
+    
+    if failures:
+        sys.exit(1)
+    print("AOIs are validated in each image's own coordinates")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+FFT Backend Consistency Test for the Alignment Worker
+
+This script registers synthetic band pairs with known shifts at awkward
+sizes (odd, prime, non-square) with every FFT backend of the worker and
+checks that each one recovers the same shift as scikit-image's
+phase_cross_correlation. It also times one large correlation per backend.
+"""
+
+import argparse
+import importlib.util
+import os
+import sys
+import time
+
+import numpy as np
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+WORKER_DIR = os.path.join(SCRIPTS_DIR, '..', 'worker')
+
+# Largest shift along each axis of the random pairs
+MAX_SHIFT = 60
+
+def load_generator():
+    """Import scripts/generate-sample-data.py, whose file name is not a module name."""
+    spec = importlib.util.spec_from_file_location(
+        "generate_sample_data", os.path.join(SCRIPTS_DIR, "generate-sample-data.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def shifted_pair(generator, rows, cols, shift, seed):
+    """Reference band and a copy whose content is offset by shift, as uint16."""
+    dy, dx = shift
+    reference = generator.synthetic_texture(np.arange(rows), np.arange(cols), seed)
+    moving = generator.synthetic_texture(np.arange(rows) - dy, np.arange(cols) - dx, seed)
+    return (reference * 4000).astype(np.uint16), (moving * 4000).astype(np.uint16)
+
+def check_pairs(worker, generator, cases, threads):
+    """Compare every backend against skimage; returns the number of mismatches."""
+    from skimage.registration import phase_cross_correlation
+    
+    failures = 0
+    rng = np.random.default_rng(0)
+    for case in range(cases):
+        rows, cols = (int(n) for n in rng.integers(150, 1200, 2))
+        shift = tuple(int(n) for n in rng.integers(-MAX_SHIFT, MAX_SHIFT, 2))
+        reference, moving = shifted_pair(generator, rows, cols, shift, case)
+        
+        expected, _, _ = phase_cross_correlation(reference, moving, upsample_factor=100)
+        expected = tuple(int(n) for n in np.round(expected))
+        _, expected_error, _ = phase_cross_correlation(reference, moving, normalization=None)
+        
+        for backend in worker.FFT_BACKENDS:
+            fft_options = {'backend': backend, 'threads': threads}
+            recovered, _ = worker.phase_correlate(reference, moving, fft_options=fft_options)
+            recovered = tuple(int(n) for n in np.round(recovered))
+            spectrum = worker.fft_spectrum(reference, fft_options)
+            cached, _ = worker.phase_correlate(reference, moving, reference_spectrum=spectrum,
+                                               fft_options=fft_options)
+            cached = tuple(int(n) for n in np.round(cached))
+            # Unnormalised correlation is not padded, so its error must match skimage's
+            _, error = worker.phase_correlate(reference, moving, normalization=None, fft_options=fft_options)
+            
+            if recovered != expected or cached != expected or abs(error - expected_error) > 1e-3:
+                failures += 1
+                print(f"  {rows}x{cols} shift {shift}: {backend} gave {recovered} (cached {cached}), "
+                      f"error {error:.4f}; skimage gave {expected}, error {expected_error:.4f}")
+    return failures
+
+def time_backends(worker, generator, size, threads):
+    """Time one phase correlation of a size x size pair with every backend."""
+    reference, moving = shifted_pair(generator, size, size, (37, -21), 0)
+    timings = {}
+    for backend in worker.FFT_BACKENDS:
+        started = time.perf_counter()
+        worker.phase_correlate(reference, moving, fft_options={'backend': backend, 'threads': threads},
+                               upsample_factor=100)
+        timings[backend] = time.perf_counter() - started
+    return timings
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the worker's FFT backends against scikit-image")
+    parser.add_argument("--cases", type=int, default=20, help="Number of random band pairs to register")
+    parser.add_argument("--threads", type=int, default=os.cpu_count(), help="FFT threads for the scipy backend")
+    parser.add_argument("--timing_size", type=int, default=4099,
+                        help="Side of the pair timed per backend (0 skips timing)")
+    args = parser.parse_args()
+    
+    sys.path.insert(0, WORKER_DIR)
+    import worker
+    generator = load_generator()
+    
+    print("Testing FFT backends against scikit-image")
+    print("=" * 50)
+    
+    failures = check_pairs(worker, generator, args.cases, args.threads)
+    print(f"{args.cases} pairs x {len(worker.FFT_BACKENDS)} backends: {failures} mismatches")
+    
+    if args.timing_size:
+        timings = time_backends(worker, generator, args.timing_size, args.threads)
+        baseline = timings['skimage']
+        for backend, seconds in timings.items():
+            print(f"  {backend:<8} {seconds:7.3f} s  ({baseline / seconds:.1f}x skimage, "
+                  f"{args.timing_size}x{args.timing_size}, {args.threads} threads)")
+    
+    if failures:
+        sys.exit(1)
+    print("All backends agree with scikit-image")
+
+if __name__ == "__main__":
+    main()
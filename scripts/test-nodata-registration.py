@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Nodata-Aware Registration Test for the Alignment Worker
+
+This script registers synthetic band pairs whose target has nodata regions
+(a cloud and a collar) with every registration method and FFT backend of
+the worker and checks that the known shift is recovered with a finite
+error. Float bands use NaN as their nodata value, which must never reach
+the transforms. The tiled method must accept every tile that is mostly
+valid rather than falling back to whole-clip registration. It also runs one whole job on a float32 GeoTIFF pair with
+NaN nodata.
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import warnings
+
+import numpy as np
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+WORKER_DIR = os.path.join(SCRIPTS_DIR, '..', 'worker')
+
+# Ground-truth (row, col) offset of the target's texture
+SHIFT = (37, -21)
+
+# Same footprint as the sample images; the AOI covers its central 80%
+BOUNDS = (-122.5, 37.7, -122.3, 37.9)
+AOI = "north=37.88;south=37.72;east=-122.32;west=-122.48"
+
+def load_generator():
+    """Import scripts/generate-sample-data.py, whose file name is not a module name."""
+    spec = importlib.util.spec_from_file_location(
+        "generate_sample_data", os.path.join(SCRIPTS_DIR, "generate-sample-data.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def nodata_regions(size):
+    """Boolean (size, size) array marking a cloud and a collar along two edges."""
+    rows, cols = np.mgrid[:size, :size]
+    cloud = (rows - 0.4 * size) ** 2 + (cols - 0.6 * size) ** 2 < (0.2 * size) ** 2
+    collar = (cols < 0.1 * size) | (rows > 0.88 * size)
+    return cloud | collar
+
+def masked_pair(generator, size, dtype):
+    """Reference band, target band with nodata regions, and the target's validity mask."""
+    reference = generator.synthetic_texture(np.arange(size), np.arange(size), 0)
+    target = generator.synthetic_texture(np.arange(size) + SHIFT[0], np.arange(size) + SHIFT[1], 0)
+    if np.dtype(dtype).kind == 'f':
+        reference, target = reference.astype(dtype), target.astype(dtype)
+        nodata = np.nan
+    else:
+        # Integer nodata is 0, so valid pixels keep 1 and up
+        reference = (reference * 60000 + 1).astype(dtype)
+        target = (target * 60000 + 1).astype(dtype)
+        nodata = 0
+    invalid = nodata_regions(size)
+    target[invalid] = nodata
+    return reference, target, ~invalid
+
+def rejected_tiles(worker, tiles, mask):
+    """Mostly valid tiles that tiled registration rejected, as (row, col) origins."""
+    rejected = []
+    for i, row in enumerate(tiles['row_origins']):
+        for j, col in enumerate(tiles['col_origins']):
+            window = mask[row:row + tiles['size'], col:col + tiles['size']]
+            if np.count_nonzero(window) >= worker.TILE_MIN_VALID * window.size and not tiles['accepted'][i][j]:
+                rejected.append((row, col))
+    return rejected
+
+def check_methods(worker, generator, size):
+    """Register masked pairs with every method and backend; returns the number of failures."""
+    failures = 0
+    for dtype in ("float32", "uint16"):
+        reference, target, mask = masked_pair(generator, size, dtype)
+        for method in worker.REGISTRATION_METHODS:
+            factor = worker.pyramid_factor(reference.shape) if method == "pyramid" else None
+            for backend in worker.FFT_BACKENDS:
+                try:
+                    # NaN reaching a transform shows up as an invalid-value warning first
+                    with warnings.catch_warnings():
+                        warnings.simplefilter("error", RuntimeWarning)
+                        info = worker.estimate_shift(reference[None], target[None], method, factor,
+                                                     mask_b=mask, fft_options={'backend': backend})
+                    shift = (info['shift_y'], info['shift_x'])
+                    problem = None
+                    if shift != SHIFT:
+                        problem = f"shift {shift}"
+                    elif not np.isfinite(info['error']):
+                        problem = f"error {info['error']}"
+                    elif method == "tiled" and rejected_tiles(worker, info['tiles'], mask):
+                        problem = f"mostly valid tiles rejected at {rejected_tiles(worker, info['tiles'], mask)}"
+                except Exception as error:
+                    problem = f"{type(error).__name__}: {error}"
+                if problem:
+                    failures += 1
+                    print(f"  {dtype} {method} {backend}: {problem}, expected shift {SHIFT}")
+    return failures
+
+def check_job(generator, work_dir):
+    """Run one job on a float32 pair with NaN nodata; returns the number of failures."""
+    import rasterio
+    
+    paths = []
+    for name, offset in (("a.tif", (0, 0)), ("b.tif", SHIFT)):
+        path = os.path.join(work_dir, name)
+        generator.create_synthetic_geotiff(path, BOUNDS, size=(1024, 1024), offset=offset, dtype='float32')
+        with rasterio.open(path, 'r+') as dst:
+            dst.nodata = float('nan')
+            if name == "b.tif":
+                band = dst.read(1)
+                band[nodata_regions(1024)] = np.nan
+                dst.write(band, 1)
+        paths.append(path)
+    
+    out_dir = os.path.join(work_dir, "out")
+    completed = subprocess.run([sys.executable, os.path.join(WORKER_DIR, "worker.py"), "--image_a", paths[0],
+                                "--image_b", paths[1], "--aoi", AOI, "--out_dir", out_dir],
+                               capture_output=True, text=True)
+    if completed.returncode != 0:
+        print(f"  job failed: {completed.stderr.strip().splitlines()[-1]}")
+        return 1
+    with open(os.path.join(out_dir, "alignment_info.json")) as f:
+        info = json.load(f)
+    shift = (info['shift_y'], info['shift_x'])
+    if shift != SHIFT or "RuntimeWarning" in completed.stderr:
+        print(f"  job gave shift {shift}, expected {SHIFT}\n{completed.stderr}")
+        return 1
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser(description="Check registration of pairs with nodata regions")
+    parser.add_argument("--size", type=int, default=1024, help="Side of the synthetic band pairs")
+    args = parser.parse_args()
+    
+    sys.path.insert(0, WORKER_DIR)
+    import worker
+    generator = load_generator()
+    
+    print("Testing nodata-aware registration")
+    print("=" * 50)
+    
+    failures = check_methods(worker, generator, args.size)
+    print(f"2 dtypes x {len(worker.REGISTRATION_METHODS)} methods x {len(worker.FFT_BACKENDS)} backends: "
+          f"{failures} failures")
+    with tempfile.TemporaryDirectory() as work_dir:
+        job_failures = check_job(generator, work_dir)
+    print(f"Float32 job with NaN nodata: {'failed' if job_failures else 'ok'}")
+    
+    if failures or job_failures:
+        sys.exit(1)
+    print("Every method registers around nodata")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Startup Time Regression Test for the Alignment Worker
+
+This script measures how long a cold interpreter takes to import
+worker/worker.py and fails when it exceeds the startup budget. Heavy
+modules must stay lazily imported for the worker to fit in the budget.
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+WORKER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'worker')
+
+# Cold-start budget for importing the worker module, in seconds
+DEFAULT_BUDGET = 0.5
+
+def measure_cold_start():
+    """Time one fresh interpreter importing the worker module."""
+    code = f"import sys; sys.path.insert(0, {WORKER_DIR!r}); import worker"
+    started = time.perf_counter()
+    subprocess.run([sys.executable, "-c", code], check=True)
+    return time.perf_counter() - started
+
+def main():
+    parser = argparse.ArgumentParser(description="Fail when worker cold start exceeds its budget")
+    parser.add_argument("--budget", type=float, default=DEFAULT_BUDGET, help="Budget in seconds")
+    parser.add_argument("--runs", type=int, default=5, help="Number of cold starts to measure")
+    args = parser.parse_args()
+
+    print("Testing worker cold-start time")
+    print("=" * 50)
+
+    # Warm the OS file cache once so the measurement reflects import work, not disk
+    measure_cold_start()
+    timings = [measure_cold_start() for _ in range(args.runs)]
+    median = statistics.median(timings)
+
+    print(f"Cold start (median of {args.runs}): {median:.3f} s, budget {args.budget:.3f} s")
+
+    if median > args.budget:
+        print("Startup budget exceeded. Per-module import cost:")
+        subprocess.run([sys.executable, os.path.join(WORKER_DIR, "worker.py"), "--profile_startup"])
+        sys.exit(1)
+
+    print("Startup time within budget")
+
+if __name__ == "__main__":
+    main()
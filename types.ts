@@ -12,12 +12,19 @@ export interface ImageFile {
     file: File;
 }
 
+export interface JobOutputs {
+    imageAUrl: string;
+    imageBUrl: string;
+    // XYZ tile URLs of the same rasters (absent on jobs finished before tiles existed)
+    imageATilesUrl?: string;
+    imageBTilesUrl?: string;
+    // Per-AOI outputs of multi-AOI jobs; the top-level URLs are those of the first AOI
+    aois?: JobOutputs[];
+}
+
 export interface Job {
     id: string;
     status: JobStatus;
     message?: string;
-    outputs?: {
-        imageAUrl: string;
-        imageBUrl: string;
-    };
+    outputs?: JobOutputs;
 }
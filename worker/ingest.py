@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+Upload Ingest Stage
+
+This script normalizes uploaded GeoTIFFs into internally tiled Cloud-Optimized
+GeoTIFFs with overviews. Converted files are stored under the SHA-256 of the
+uploaded bytes, so identical uploads are converted once and later ones only
+cost a hashing pass. Each stored image gets a JSON sidecar describing its
+pixel grid, footprint, block layout and band statistics, which the API
+server uses to key cached results, and its footprint is added to the
+spatial index of uploads (see scene_index.py).
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from typing import List
+
+import numpy as np
+import rasterio
+import shapely
+from rasterio.enums import Resampling
+from rasterio.warp import transform_geom
+from shapely.geometry import box, mapping
+
+from scene_index import FOOTPRINT_CRS, load_metadata, metadata_path, update_index
+from worker import COG_BLOCKSIZE, COMPRESSION_METHODS, cog_creation_options, write_cog
+
+# Bytes read per chunk while hashing an upload
+HASH_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Layout version of the sidecar; older sidecars are rewritten on the next ingest
+METADATA_VERSION = 2
+
+# Longest side of the decimated read (served from overviews) behind the band statistics
+STATISTICS_SIZE = 1024
+
+# Points added along each footprint edge so it stays accurate after reprojection
+FOOTPRINT_DENSIFY_POINTS = 20
+
+
+def hash_file(path: str) -> str:
+    """
+    Compute the SHA-256 of a file in a single streaming pass.
+    
+    Args:
+        path: Path to the file
+    
+    Returns:
+        Hex digest
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def is_cloud_optimized(path: str) -> bool:
+    """
+    Check whether a GeoTIFF is already internally tiled with overviews.
+    
+    Args:
+        path: Path to the GeoTIFF
+    
+    Returns:
+        True if the file can be used as-is
+    """
+    with rasterio.open(path) as src:
+        if src.tags(ns='IMAGE_STRUCTURE').get('LAYOUT') == 'COG':
+            return True
+        
+        # Strip layouts (including single-strip images whose block happens to
+        # be square) are always converted, however small
+        tiled = bool(src.profile.get('tiled'))
+        needs_overviews = max(src.width, src.height) > COG_BLOCKSIZE
+        return tiled and (bool(src.overviews(1)) or not needs_overviews)
+
+
+def band_statistics(src) -> List[dict]:
+    """
+    Approximate per-band statistics of a dataset.
+    
+    Computed from a read decimated to STATISTICS_SIZE, which GDAL serves from
+    the overviews, with nodata pixels excluded.
+    
+    Args:
+        src: Open rasterio dataset
+    
+    Returns:
+        One {min, max, mean, std, valid_fraction} per band; values are None
+        for bands without valid pixels
+    """
+    factor = max(1, -(-max(src.width, src.height) // STATISTICS_SIZE))
+    out_shape = (src.count, max(1, src.height // factor), max(1, src.width // factor))
+    data = src.read(out_shape=out_shape, masked=True, resampling=Resampling.nearest)
+    
+    statistics = []
+    for band in data:
+        valid = band.compressed().astype(np.float64)
+        if valid.size == 0:
+            statistics.append({"min": None, "max": None, "mean": None, "std": None, "valid_fraction": 0.0})
+            continue
+        statistics.append({
+            "min": float(valid.min()),
+            "max": float(valid.max()),
+            "mean": float(valid.mean()),
+            "std": float(valid.std()),
+            "valid_fraction": valid.size / band.size
+        })
+    return statistics
+
+
+def footprint(src) -> dict:
+    """
+    Footprint of a dataset as a GeoJSON polygon in FOOTPRINT_CRS.
+    
+    Images without a CRS keep their own coordinates, which the worker also
+    compares AOIs against directly.
+    """
+    left, bottom, right, top = src.bounds
+    outline = box(left, bottom, right, top)
+    if src.crs is None:
+        return mapping(outline)
+    
+    # Densify the edges, which are curved in FOOTPRINT_CRS for most projections
+    step = max(right - left, top - bottom) / FOOTPRINT_DENSIFY_POINTS
+    return transform_geom(src.crs, FOOTPRINT_CRS, mapping(shapely.segmentize(outline, step)))
+
+
+def image_metadata(path: str) -> dict:
+    """
+    Describe an ingested image for the API server and the spatial index.
+    
+    Args:
+        path: Path to the GeoTIFF
+    
+    Returns:
+        Dictionary with crs, transform (GDAL-ordered affine coefficients
+        a, b, c, d, e, f), width, height, bounds (in the image CRS),
+        footprint (GeoJSON polygon in FOOTPRINT_CRS), count, dtypes, nodata,
+        block_shapes (rows, cols per band), overviews (decimation factors),
+        compression and statistics (per band, see band_statistics)
+    """
+    with rasterio.open(path) as src:
+        return {
+            "crs": src.crs.to_string() if src.crs else None,
+            "transform": list(src.transform)[:6],
+            "width": src.width,
+            "height": src.height,
+            "bounds": list(src.bounds),
+            "footprint": footprint(src),
+            "count": src.count,
+            "dtypes": list(src.dtypes),
+            "nodata": src.nodata,
+            "block_shapes": [list(block_shape) for block_shape in src.block_shapes],
+            "overviews": src.overviews(1),
+            "compression": src.compression.name if src.compression else None,
+            "statistics": band_statistics(src)
+        }
+
+
+def write_metadata(image_path: str, sha256: str):
+    """Write the sidecar of an ingested image atomically and add it to the spatial index."""
+    metadata = {"version": METADATA_VERSION, "sha256": sha256, **image_metadata(image_path)}
+    sidecar_path = metadata_path(image_path)
+    staging_path = f"{sidecar_path}.{os.getpid()}.tmp"
+    with open(staging_path, 'w') as f:
+        json.dump(metadata, f, indent=2)
+    os.replace(staging_path, sidecar_path)
+    update_index(os.path.dirname(os.path.abspath(image_path)), os.path.basename(image_path), metadata)
+
+
+def metadata_current(image_path: str) -> bool:
+    """Whether an ingested image has a sidecar of the current layout."""
+    metadata = load_metadata(image_path)
+    return bool(metadata) and metadata.get("version") == METADATA_VERSION
+
+
+def ingest_upload(path: str, uploads_dir: str, compress: str = "deflate", num_threads: int = 1) -> dict:
+    """
+    Ingest one upload: hash it, dedupe it and store it as a COG.
+    
+    The upload is removed once its content-addressed copy exists.
+    
+    Args:
+        path: Path to the uploaded file
+        uploads_dir: Directory holding content-addressed uploads
+        compress: Compression codec for converted files, one of COMPRESSION_METHODS
+        num_threads: Threads used for compression and overview generation
+    
+    Returns:
+        Ingest result with imageId (the content-addressed file name), sha256,
+        deduplicated and converted flags
+    """
+    sha256 = hash_file(path)
+    image_id = f"{sha256}.tif"
+    target_path = os.path.join(uploads_dir, image_id)
+    result = {"source": os.path.basename(path), "imageId": image_id, "sha256": sha256,
+              "deduplicated": False, "converted": False}
+    
+    if os.path.abspath(path) == os.path.abspath(target_path):
+        if not metadata_current(target_path):
+            write_metadata(target_path, sha256)
+        return result
+    
+    if os.path.exists(target_path):
+        # Same bytes were ingested before
+        result["deduplicated"] = True
+        os.remove(path)
+        if not metadata_current(target_path):
+            write_metadata(target_path, sha256)
+        return result
+    
+    # Write next to the target and rename, so concurrent ingests of the same
+    # content never expose a partial file
+    staging_path = f"{target_path}.{os.getpid()}.ingest.tif"
+    try:
+        if is_cloud_optimized(path):
+            os.replace(path, staging_path)
+        else:
+            write_cog(path, staging_path, cog_creation_options(compress, num_threads))
+            result["converted"] = True
+            os.remove(path)
+        os.replace(staging_path, target_path)
+    finally:
+        if os.path.exists(staging_path):
+            os.remove(staging_path)
+    
+    write_metadata(target_path, sha256)
+    return result
+
+
+def ingest_uploads(paths: List[str], uploads_dir: str, compress: str = "deflate",
+                   workers: int = 1) -> List[dict]:
+    """
+    Ingest several uploads concurrently.
+    
+    Args:
+        paths: Paths to the uploaded files
+        uploads_dir: Directory holding content-addressed uploads
+        compress: Compression codec for converted files
+        workers: Number of uploads converted at the same time
+    
+    Returns:
+        One result per path, in order; failed uploads carry an 'error' entry
+    """
+    workers = max(1, min(workers, len(paths)))
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(ingest_upload, path, uploads_dir, compress, threads) for path in paths]
+    
+    results = []
+    for path, future in zip(paths, futures):
+        try:
+            results.append(future.result())
+        except Exception as e:
+            results.append({"source": os.path.basename(path), "error": f"{type(e).__name__}: {e}"})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Normalize uploads to content-addressed COGs")
+    parser.add_argument("paths", nargs='+', help="Uploaded GeoTIFF files")
+    parser.add_argument("--uploads_dir", help="Directory for content-addressed uploads (default: next to the first file)")
+    parser.add_argument("--compress", choices=COMPRESSION_METHODS, default="deflate",
+                        help="Compression codec for converted files")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="Number of uploads converted concurrently")
+    
+    args = parser.parse_args()
+    uploads_dir = args.uploads_dir or os.path.dirname(os.path.abspath(args.paths[0]))
+    
+    if len(args.paths) == 1:
+        try:
+            results = [ingest_upload(args.paths[0], uploads_dir, args.compress, os.cpu_count() or 1)]
+        except Exception as e:
+            traceback.print_exc()
+            results = [{"source": os.path.basename(args.paths[0]), "error": f"{type(e).__name__}: {e}"}]
+    else:
+        results = ingest_uploads(args.paths, uploads_dir, args.compress, args.workers)
+    
+    # One JSON result per line for the API server
+    for result in results:
+        print(json.dumps(result))
+    
+    if any("error" in result for result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+Spatial Index of Uploaded Scenes
+
+This script keeps a persistent shapely STRtree over the footprints of all
+ingested uploads, built from the metadata sidecars written by ingest.py.
+AOI validation, "which uploads cover this AOI" queries and pixel window
+planning are answered from the index and the sidecars alone, without
+opening any image with GDAL. Run with --serve it answers JSON-line
+requests on stdin for the API server.
+"""
+
+import argparse
+import fcntl
+import json
+import math
+import os
+import pickle
+import sys
+import traceback
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+
+import shapely
+from shapely.geometry import box, shape
+
+# Index file kept next to the uploads, and the lock serializing its updates
+INDEX_FILE = "scene_index.pkl"
+INDEX_LOCK_FILE = "scene_index.lock"
+
+# Layout version of the pickled index; other versions are rebuilt from the sidecars
+INDEX_VERSION = 1
+
+# Coordinate reference system of the indexed footprints and of AOI queries
+FOOTPRINT_CRS = "EPSG:4326"
+
+
+def metadata_path(image_path: str) -> str:
+    """Path of the JSON sidecar stored next to an ingested image."""
+    return os.path.splitext(image_path)[0] + '.json'
+
+
+def load_metadata(image_path: str) -> Optional[dict]:
+    """Read the sidecar of an image, or None when it has none."""
+    try:
+        with open(metadata_path(image_path)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def aoi_polygon(aoi: dict):
+    """AOI {north, south, east, west} as a shapely box."""
+    return box(float(aoi['west']), float(aoi['south']), float(aoi['east']), float(aoi['north']))
+
+
+def plan_window(metadata: dict, aoi: dict) -> Optional[Tuple[int, int, int, int]]:
+    """
+    Pixel window of an image covering the AOI, from its sidecar alone.
+    
+    Rounds the same way as aoi_window in worker.py, which interprets the AOI
+    in the image's own coordinates.
+    
+    Args:
+        metadata: Sidecar of the image
+        aoi: Area of Interest as {north: lat, south: lat, east: lng, west: lng}
+    
+    Returns:
+        (col_off, row_off, width, height) limited to the image extent, or
+        None when the AOI misses the image
+    """
+    a, b, c, d, e, f = metadata['transform']
+    determinant = a * e - b * d
+    
+    # Invert the affine transform for the four AOI corners
+    cols, rows = [], []
+    for x, y in ((aoi['west'], aoi['north']), (aoi['east'], aoi['north']),
+                 (aoi['east'], aoi['south']), (aoi['west'], aoi['south'])):
+        x, y = float(x) - c, float(y) - f
+        cols.append((e * x - b * y) / determinant)
+        rows.append((a * y - d * x) / determinant)
+    
+    col_off = math.floor(min(cols) + 0.1)
+    row_off = math.floor(min(rows) + 0.1)
+    col_end = col_off + math.floor(max(cols) - min(cols) + 0.5)
+    row_end = row_off + math.floor(max(rows) - min(rows) + 0.5)
+    
+    # Limit to the image extent
+    left, top = max(col_off, 0), max(row_off, 0)
+    right, bottom = min(col_end, metadata['width']), min(row_end, metadata['height'])
+    if right <= left or bottom <= top:
+        return None
+    return left, top, right - left, bottom - top
+
+
+def footprint_geometry(metadata: dict):
+    """Footprint polygon of a sidecar, or None for sidecars written before footprints existed."""
+    if not metadata.get('footprint'):
+        return None
+    return shape(metadata['footprint'])
+
+
+class SceneIndex:
+    """STRtree over the footprints of the ingested uploads, keyed by image ID."""
+    
+    def __init__(self, footprints: Optional[dict] = None):
+        self.footprints = dict(footprints or {})
+        self.image_ids = sorted(self.footprints)
+        self.tree = shapely.STRtree([self.footprints[image_id] for image_id in self.image_ids])
+    
+    @classmethod
+    def build(cls, uploads_dir: str) -> "SceneIndex":
+        """Build the index from every sidecar in the uploads directory."""
+        footprints = {}
+        for name in os.listdir(uploads_dir):
+            if not name.endswith('.json'):
+                continue
+            image_id = f"{os.path.splitext(name)[0]}.tif"
+            metadata = load_metadata(os.path.join(uploads_dir, image_id))
+            footprint = footprint_geometry(metadata) if metadata else None
+            if footprint is not None and os.path.exists(os.path.join(uploads_dir, image_id)):
+                footprints[image_id] = footprint
+        return cls(footprints)
+    
+    @classmethod
+    def load(cls, uploads_dir: str) -> "SceneIndex":
+        """Load the persisted index, building it from the sidecars when missing or outdated."""
+        try:
+            with open(os.path.join(uploads_dir, INDEX_FILE), 'rb') as f:
+                state = pickle.load(f)
+            if state.get('version') == INDEX_VERSION:
+                index = cls.__new__(cls)
+                index.footprints = dict(zip(state['image_ids'], state['footprints']))
+                index.image_ids = state['image_ids']
+                index.tree = state['tree']
+                return index
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, KeyError):
+            pass
+        return cls.build(uploads_dir)
+    
+    def save(self, uploads_dir: str):
+        """Persist the index, tree included, atomically."""
+        state = {'version': INDEX_VERSION, 'image_ids': self.image_ids,
+                 'footprints': [self.footprints[image_id] for image_id in self.image_ids], 'tree': self.tree}
+        index_path = os.path.join(uploads_dir, INDEX_FILE)
+        staging_path = f"{index_path}.{os.getpid()}.tmp"
+        with open(staging_path, 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(staging_path, index_path)
+    
+    def with_scene(self, image_id: str, footprint) -> "SceneIndex":
+        """New index with one scene added or replaced; an STRtree cannot be extended in place."""
+        return SceneIndex({**self.footprints, image_id: footprint})
+    
+    def query(self, aoi: dict) -> List[dict]:
+        """
+        Find the scenes intersecting an AOI.
+        
+        Args:
+            aoi: Area of Interest in FOOTPRINT_CRS
+        
+        Returns:
+            One entry per intersecting scene, best coverage first, with imageId,
+            coverage (fraction of the AOI inside the footprint) and covers
+        """
+        area = aoi_polygon(aoi)
+        matches = []
+        for position in self.tree.query(area, predicate='intersects'):
+            image_id = self.image_ids[position]
+            footprint = self.footprints[image_id]
+            covers = footprint.covers(area)
+            coverage = 1.0 if covers else (footprint.intersection(area).area / area.area if area.area else 0.0)
+            matches.append({"imageId": image_id, "coverage": round(coverage, 6), "covers": covers})
+        return sorted(matches, key=lambda match: (-match['coverage'], match['imageId']))
+
+
+@contextmanager
+def index_lock(uploads_dir: str):
+    """Serialize read-modify-write cycles of the index across ingest processes."""
+    with open(os.path.join(uploads_dir, INDEX_LOCK_FILE), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def update_index(uploads_dir: str, image_id: str, metadata: dict):
+    """Add one ingested scene to the persisted index."""
+    footprint = footprint_geometry(metadata)
+    if footprint is None:
+        return
+    with index_lock(uploads_dir):
+        SceneIndex.load(uploads_dir).with_scene(image_id, footprint).save(uploads_dir)
+
+
+def validate_aoi(image_a: str, image_bs: List[str], aoi: dict, sidecars: Optional[dict] = None) -> List[str]:
+    """
+    Check an AOI against the sidecars of a job's images before any of them is opened.
+    
+    Every image must yield a non-empty pixel window. Like aoi_window in
+    worker.py, which clips Image A and every Image B, the AOI is read in
+    each image's own coordinates. Images without a sidecar are not checked.
+    
+    Args:
+        image_a: Path to the reference image
+        image_bs: Paths to the images to align
+        aoi: Area of Interest as {north: lat, south: lat, east: lng, west: lng}
+        sidecars: Optional cache of loaded sidecars keyed by path, filled as needed
+    
+    Returns:
+        Problems found, empty when the AOI is usable
+    """
+    sidecars = {} if sidecars is None else sidecars
+    
+    def sidecar(path: str) -> Optional[dict]:
+        if path not in sidecars:
+            sidecars[path] = load_metadata(path)
+        return sidecars[path]
+    
+    problems = []
+    area = aoi_polygon(aoi)
+    if area.area == 0:
+        return [f"AOI {aoi} is empty"]
+    
+    for label, path in [("Image A", image_a)] + [("Image B", image_b) for image_b in image_bs]:
+        metadata = sidecar(path)
+        if metadata and plan_window(metadata, aoi) is None:
+            problems.append(f"AOI {aoi} does not overlap {label} ({os.path.basename(path)})")
+    return problems
+
+
+def serve(uploads_dir: str):
+    """
+    Answer index requests for the API server.
+    
+    Requests arrive on stdin as JSON lines {"id": ..., "op": ...}: op "query"
+    takes an aoi and returns the intersecting scenes, op "validate" takes
+    imageAId, imageBIds and aois and returns the problems found. Each response
+    is one JSON line {"id": ..., "result": ...} or {"id": ..., "error": ...}.
+    The index is reloaded whenever ingest has replaced the index file, and
+    sidecars are cached, since ingested images never change.
+    """
+    index_path = os.path.join(uploads_dir, INDEX_FILE)
+    index, loaded_mtime = None, None
+    sidecars = {}
+    
+    print(json.dumps({"event": "ready", "pid": os.getpid()}), flush=True)
+    
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request.get("id")
+            
+            mtime = os.path.getmtime(index_path) if os.path.exists(index_path) else None
+            if index is None or mtime != loaded_mtime:
+                index, loaded_mtime = SceneIndex.load(uploads_dir), mtime
+            
+            if request["op"] == "query":
+                result = index.query(request["aoi"])
+            elif request["op"] == "validate":
+                image_a = os.path.join(uploads_dir, os.path.basename(request["imageAId"]))
+                image_bs = [os.path.join(uploads_dir, os.path.basename(image_id)) for image_id in request["imageBIds"]]
+                result = [problem for aoi in request["aois"]
+                          for problem in validate_aoi(image_a, image_bs, aoi, sidecars)]
+            else:
+                raise ValueError(f"Unknown op: {request['op']}")
+            response = {"id": request_id, "result": result}
+        except Exception as e:
+            traceback.print_exc()
+            response = {"id": request_id, "error": f"{type(e).__name__}: {e}"}
+        print(json.dumps(response), flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Spatial index over the footprints of ingested uploads")
+    parser.add_argument("--uploads_dir", required=True, help="Directory holding content-addressed uploads")
+    parser.add_argument("--rebuild", action="store_true", help="Rebuild the index from the sidecars")
+    parser.add_argument("--query", help="AOI as JSON {north, south, east, west}; prints the intersecting scenes")
+    parser.add_argument("--serve", action="store_true", help="Answer JSON-line requests on stdin")
+    
+    args = parser.parse_args()
+    
+    if args.serve:
+        serve(args.uploads_dir)
+        return
+    
+    if args.rebuild:
+        with index_lock(args.uploads_dir):
+            index = SceneIndex.build(args.uploads_dir)
+            index.save(args.uploads_dir)
+        print(f"Indexed {len(index.image_ids)} scenes")
+    
+    if args.query:
+        for match in SceneIndex.load(args.uploads_dir).query(json.loads(args.query)):
+            print(json.dumps(match))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,499 @@
+#!/usr/bin/env python3
+"""
+XYZ Tile Renderer for Job Outputs
+
+This script renders z/x/y Web Mercator tiles of the GeoTIFFs a job writes,
+so the map loads only the tiles it shows instead of whole rasters. Each tile
+is read through the dataset's overviews with one windowed read, stretched
+per band to 8 bits and encoded as PNG or WebP. Rendered tiles are kept in a
+size-bounded in-memory LRU cache and a size-bounded on-disk LRU cache that
+outlives the process. Run with --serve it answers JSON-line requests on
+stdin for the API server.
+"""
+
+import argparse
+import base64
+import hashlib
+import json
+import math
+import os
+import sys
+import threading
+import traceback
+import warnings
+from collections import OrderedDict
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+import numpy as np
+import rasterio
+from rasterio.enums import Resampling
+from rasterio.errors import NotGeoreferencedWarning
+from rasterio.io import MemoryFile
+from rasterio.transform import from_bounds as transform_from_bounds
+from rasterio.windows import Window, from_bounds
+
+# Side of a rendered tile in pixels
+TILE_SIZE = 256
+
+# Grid of the tiles: Web Mercator, whose square spans twice this many metres
+TILE_CRS = "EPSG:3857"
+MERCATOR_EXTENT = 20037508.342789244
+
+# Deepest zoom level accepted in tile requests
+MAX_ZOOM = 30
+
+# Tile formats with the GDAL driver and creation options encoding them
+TILE_FORMATS = {
+    'png': ('PNG', {'zlevel': 3}),
+    'webp': ('WEBP', {'quality': 90}),
+}
+
+# Percentiles of the valid pixels each band is stretched between (8-bit bands are shown as they are)
+STRETCH_PERCENTILES = (2, 98)
+
+# Longest side of the decimated read the stretch is computed from (served from the overviews)
+STRETCH_SAMPLE_SIZE = 1024
+
+# Default cache budgets
+MEMORY_CACHE_MB = 64
+DISK_CACHE_MB = 1024
+
+# Threads rendering tiles; GDAL releases the GIL while reading, warping and encoding
+RENDER_THREADS = 4
+
+# Open datasets kept by each render thread (rasterio handles are not thread-safe)
+DATASET_HANDLES = 8
+
+# Open datasets of the current render thread (see open_dataset)
+_handles = threading.local()
+
+# Encoded tiles are plain images that the map positions. Filtered once for the
+# process: catch_warnings is not thread-safe across the render threads
+warnings.filterwarnings('ignore', category=NotGeoreferencedWarning)
+
+
+def tile_bounds(z: int, x: int, y: int) -> Tuple[float, float, float, float]:
+    """(left, bottom, right, top) of an XYZ tile in TILE_CRS metres."""
+    size = 2 * MERCATOR_EXTENT / 2 ** z
+    left = -MERCATOR_EXTENT + x * size
+    top = MERCATOR_EXTENT - y * size
+    return left, top - size, left + size, top
+
+
+def dataset_key(path: str) -> str:
+    """Identity of a file's current contents, so a rewritten output never serves stale tiles."""
+    stat = os.stat(path)
+    identity = f"{os.path.realpath(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+    return hashlib.sha256(identity.encode()).hexdigest()[:16]
+
+
+def open_dataset(path: str):
+    """
+    Open a dataset for the current thread, reusing the handle of earlier tiles.
+    
+    Each thread keeps its DATASET_HANDLES most recently used datasets open;
+    a handle is reopened when its file has changed.
+    """
+    handles = getattr(_handles, 'datasets', None)
+    if handles is None:
+        handles = _handles.datasets = OrderedDict()
+    
+    key = dataset_key(path)
+    entry = handles.get(path)
+    if entry is not None and entry[0] == key:
+        handles.move_to_end(path)
+        return entry[1]
+    if entry is not None:
+        entry[1].close()
+    
+    handles[path] = (key, rasterio.open(path))
+    if len(handles) > DATASET_HANDLES:
+        _, (_, evicted) = handles.popitem(last=False)
+        evicted.close()
+    return handles[path][1]
+
+
+def display_bands(src) -> List[int]:
+    """Bands shown on the map: the first three as RGB, or the first as greyscale."""
+    return [1, 2, 3] if src.count >= 3 else [1]
+
+
+@lru_cache(maxsize=64)
+def band_stretch(path: str, key: str) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Value range each displayed band is stretched over, shared by all tiles of a dataset.
+    
+    Computed once per file contents (key) from a decimated read of the whole
+    dataset, so neighbouring tiles get the same colours.
+    
+    Returns:
+        Tuple of (low, high) values per displayed band
+    """
+    with rasterio.open(path) as src:
+        bands = display_bands(src)
+        if all(dtype == 'uint8' for dtype in src.dtypes):
+            return np.zeros(len(bands)), np.full(len(bands), 255.0)
+        
+        scale = max(1, math.ceil(max(src.width, src.height) / STRETCH_SAMPLE_SIZE))
+        shape = (max(1, src.height // scale), max(1, src.width // scale))
+        sample = src.read(bands, out_shape=(len(bands),) + shape, resampling=Resampling.nearest)
+        valid = src.dataset_mask(out_shape=shape) > 0
+    
+    low, high = np.zeros(len(bands)), np.ones(len(bands))
+    for index, band in enumerate(sample):
+        values = band[valid]
+        values = values[np.isfinite(values)] if values.dtype.kind == 'f' else values
+        if values.size:
+            low[index], high[index] = np.percentile(values, STRETCH_PERCENTILES)
+        if high[index] <= low[index]:
+            high[index] = low[index] + 1
+    return low, high
+
+
+def zoom_range(src) -> Tuple[int, int]:
+    """
+    Zoom levels worth rendering for a dataset.
+    
+    Returns:
+        (minzoom, maxzoom): the level at which the whole dataset fits in about
+        one tile, and the level matching its native resolution (deeper levels
+        only magnify, which the map does itself)
+    """
+    from rasterio.warp import calculate_default_transform
+    
+    transform, width, height = calculate_default_transform(src.crs, TILE_CRS, src.width, src.height,
+                                                           *src.bounds)
+    resolution = abs(transform.a)
+    maxzoom = max(0, min(MAX_ZOOM, math.ceil(math.log2(2 * MERCATOR_EXTENT / TILE_SIZE / resolution))))
+    minzoom = max(0, maxzoom - math.ceil(math.log2(max(width, height, TILE_SIZE) / TILE_SIZE)))
+    return minzoom, maxzoom
+
+
+def tile_info(path: str) -> dict:
+    """
+    Describe the tiles of a dataset for the map.
+    
+    Args:
+        path: Path to the GeoTIFF
+    
+    Returns:
+        Dict with bounds ([west, south, east, north] in degrees), minzoom,
+        maxzoom, the displayed bands and the available formats
+    """
+    from rasterio.warp import transform_bounds
+    
+    src = open_dataset(path)
+    minzoom, maxzoom = zoom_range(src)
+    return {
+        'bounds': [round(value, 8) for value in transform_bounds(src.crs, "EPSG:4326", *src.bounds)],
+        'minzoom': minzoom,
+        'maxzoom': maxzoom,
+        'bands': display_bands(src),
+        'formats': list(TILE_FORMATS),
+    }
+
+
+def encode_tile(rgba: np.ndarray, tile_format: str) -> bytes:
+    """Encode a (4, rows, cols) uint8 RGBA array with GDAL's driver for the format."""
+    driver, options = TILE_FORMATS[tile_format]
+    with MemoryFile() as memfile:
+        with memfile.open(driver=driver, width=rgba.shape[2], height=rgba.shape[1], count=4,
+                          dtype='uint8', **options) as dst:
+            dst.write(rgba)
+        return memfile.read()
+
+
+def render_tile(path: str, z: int, x: int, y: int, tile_format: str = "png") -> bytes:
+    """
+    Render one XYZ tile of a dataset.
+    
+    Only the dataset window under the tile is read, decimated to about the
+    tile's resolution so that GDAL serves it from the matching overview
+    level. The read is stretched to 8 bits (see band_stretch) and warped
+    onto the tile grid with the dataset mask as alpha. Tiles the dataset
+    does not reach are transparent.
+    
+    Args:
+        path: Path to the GeoTIFF
+        z: Zoom level
+        x: Tile column
+        y: Tile row
+        tile_format: One of TILE_FORMATS
+    
+    Returns:
+        Encoded tile
+    """
+    from rasterio.warp import reproject, transform_bounds
+    
+    if tile_format not in TILE_FORMATS:
+        raise ValueError(f"Unknown tile format: {tile_format}")
+    if not (0 <= z <= MAX_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        raise ValueError(f"No tile {z}/{x}/{y}")
+    
+    rgba = np.zeros((4, TILE_SIZE, TILE_SIZE), dtype=np.uint8)
+    src = open_dataset(path)
+    bounds = tile_bounds(z, x, y)
+    
+    # Dataset window under the tile, whole pixels, limited to the dataset extent
+    src_bounds = transform_bounds(TILE_CRS, src.crs, *bounds, densify_pts=21)
+    window = from_bounds(*src_bounds, transform=src.transform)
+    col_off, row_off = max(0, math.floor(window.col_off)), max(0, math.floor(window.row_off))
+    col_end = min(src.width, math.ceil(window.col_off + window.width))
+    row_end = min(src.height, math.ceil(window.row_off + window.height))
+    if col_end <= col_off or row_end <= row_off:
+        return encode_tile(rgba, tile_format)
+    
+    # Read at about the tile's resolution; coarser tiles come from coarser overviews
+    factor = max(1.0, min(window.width, window.height) / TILE_SIZE)
+    read_window = Window(col_off, row_off, col_end - col_off, row_end - row_off)
+    shape = (max(1, round(read_window.height / factor)), max(1, round(read_window.width / factor)))
+    bands = display_bands(src)
+    resampling = Resampling.average if factor > 1 else Resampling.nearest
+    data = src.read(bands, window=read_window, out_shape=(len(bands),) + shape, resampling=resampling)
+    valid = src.dataset_mask(window=read_window, out_shape=shape)
+    
+    low, high = band_stretch(path, dataset_key(path))
+    source = np.empty((4,) + shape, dtype=np.uint8)
+    for index, band in enumerate(data):
+        stretched = (band.astype(np.float32) - low[index]) * (255 / (high[index] - low[index]))
+        np.clip(stretched, 0, 255, out=stretched)
+        source[index] = stretched
+    if len(bands) == 1:
+        source[1:3] = source[0]
+    source[3] = valid
+    
+    src_transform = src.window_transform(read_window) * \
+        rasterio.Affine.scale(read_window.width / shape[1], read_window.height / shape[0])
+    # The read is already at about the tile's resolution; nearest neighbour only reprojects it
+    reproject(source, rgba, src_transform=src_transform, src_crs=src.crs,
+              dst_transform=transform_from_bounds(*bounds, TILE_SIZE, TILE_SIZE), dst_crs=TILE_CRS,
+              src_alpha=4, dst_alpha=4, resampling=Resampling.nearest)
+    return encode_tile(rgba, tile_format)
+
+
+class TileCache:
+    """
+    Two-level LRU cache of encoded tiles.
+    
+    The in-memory level holds the most recently used tiles up to its byte
+    budget. The on-disk level keeps tiles across restarts up to its own
+    budget, evicting the files used least recently (file modification times
+    are bumped on every hit, so the order survives restarts too).
+    """
+    
+    def __init__(self, cache_dir: Optional[str] = None, memory_bytes: int = MEMORY_CACHE_MB * 1024 * 1024,
+                 disk_bytes: int = DISK_CACHE_MB * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.memory = OrderedDict()
+        self.memory_used = 0
+        self.disk = OrderedDict()
+        self.disk_used = 0
+        self.lock = threading.Lock()
+        self.hits = {'memory': 0, 'disk': 0}
+        self.misses = 0
+        if cache_dir:
+            self.scan()
+    
+    def scan(self):
+        """Rebuild the on-disk index from the cache directory, least recently used first."""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        entries = []
+        for root, _, names in os.walk(self.cache_dir):
+            for name in names:
+                path = os.path.join(root, name)
+                if name.endswith('.tmp'):
+                    # Left behind by an interrupted write
+                    os.remove(path)
+                    continue
+                stat = os.stat(path)
+                entries.append((stat.st_mtime_ns, os.path.relpath(path, self.cache_dir), stat.st_size))
+        for _, key, size in sorted(entries):
+            self.disk[key] = size
+            self.disk_used += size
+        self.evict_disk()
+    
+    def get(self, key: str) -> Optional[bytes]:
+        """Cached tile for a key, or None."""
+        with self.lock:
+            data = self.memory.get(key)
+            if data is not None:
+                self.memory.move_to_end(key)
+                self.hits['memory'] += 1
+                return data
+            on_disk = key in self.disk
+        
+        if on_disk:
+            path = os.path.join(self.cache_dir, key)
+            try:
+                with open(path, 'rb') as f:
+                    data = f.read()
+                os.utime(path)
+            except OSError:
+                data = None
+            if data is not None:
+                with self.lock:
+                    if key in self.disk:
+                        self.disk.move_to_end(key)
+                    self.hits['disk'] += 1
+                    self.remember(key, data)
+                return data
+        
+        with self.lock:
+            self.misses += 1
+        return None
+    
+    def put(self, key: str, data: bytes):
+        """Store a rendered tile in both levels."""
+        with self.lock:
+            self.remember(key, data)
+        if not self.cache_dir or len(data) > self.disk_bytes:
+            return
+        
+        path = os.path.join(self.cache_dir, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        staging_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(staging_path, 'wb') as f:
+            f.write(data)
+        os.replace(staging_path, path)
+        with self.lock:
+            self.disk_used += len(data) - self.disk.pop(key, 0)
+            self.disk[key] = len(data)
+            self.evict_disk()
+    
+    def remember(self, key: str, data: bytes):
+        """Add a tile to the in-memory level, evicting the least recently used. Caller holds the lock."""
+        if len(data) > self.memory_bytes:
+            return
+        self.memory_used += len(data) - len(self.memory.pop(key, b''))
+        self.memory[key] = data
+        while self.memory_used > self.memory_bytes:
+            _, evicted = self.memory.popitem(last=False)
+            self.memory_used -= len(evicted)
+    
+    def evict_disk(self):
+        """Delete the least recently used tile files until the disk level fits its budget. Caller holds the lock."""
+        while self.disk_used > self.disk_bytes and self.disk:
+            key, size = self.disk.popitem(last=False)
+            self.disk_used -= size
+            try:
+                os.remove(os.path.join(self.cache_dir, key))
+            except OSError:
+                pass
+    
+    def stats(self) -> dict:
+        """Hit counters and the bytes held by each level."""
+        with self.lock:
+            return {'hits': dict(self.hits), 'misses': self.misses,
+                    'memory': {'tiles': len(self.memory), 'bytes': self.memory_used, 'maxBytes': self.memory_bytes},
+                    'disk': {'tiles': len(self.disk), 'bytes': self.disk_used, 'maxBytes': self.disk_bytes}}
+
+
+def cached_tile(cache: TileCache, path: str, z: int, x: int, y: int, tile_format: str = "png") -> bytes:
+    """Tile from the cache, rendered and cached on a miss."""
+    key = f"{dataset_key(path)}/{z}/{x}/{y}.{tile_format}"
+    data = cache.get(key)
+    if data is None:
+        data = render_tile(path, z, x, y, tile_format)
+        cache.put(key, data)
+    return data
+
+
+def serve(outputs_dir: str, cache: TileCache, threads: int = RENDER_THREADS):
+    """
+    Answer tile requests for the API server.
+    
+    Requests arrive on stdin as JSON lines {"id": ..., "op": ...}: op "tile"
+    takes jobId, filename, z, x, y and format and returns the encoded tile as
+    base64 data, op "info" takes jobId and filename and returns tile_info,
+    op "stats" returns the cache counters. Each response is one JSON line
+    {"id": ..., "result": ...} or {"id": ..., "error": ...}. Requests are
+    rendered on a thread pool, so responses may come back out of order.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    
+    output_lock = threading.Lock()
+    
+    def respond(response: dict):
+        line = json.dumps(response)
+        with output_lock:
+            print(line, flush=True)
+    
+    def handle(request: dict):
+        request_id = request.get("id")
+        try:
+            if request["op"] == "stats":
+                result = cache.stats()
+            else:
+                path = os.path.join(outputs_dir, os.path.basename(str(request["jobId"])),
+                                    os.path.basename(request["filename"]))
+                if request["op"] == "tile":
+                    data = cached_tile(cache, path, int(request["z"]), int(request["x"]), int(request["y"]),
+                                       request.get("format", "png"))
+                    result = {"format": request.get("format", "png"), "data": base64.b64encode(data).decode()}
+                elif request["op"] == "info":
+                    result = tile_info(path)
+                else:
+                    raise ValueError(f"Unknown op: {request['op']}")
+            response = {"id": request_id, "result": result}
+        except Exception as e:
+            traceback.print_exc()
+            response = {"id": request_id, "error": f"{type(e).__name__}: {e}"}
+        respond(response)
+    
+    respond({"event": "ready", "pid": os.getpid()})
+    
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        for line in sys.stdin:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+            except ValueError as e:
+                respond({"id": None, "error": f"{type(e).__name__}: {e}"})
+                continue
+            pool.submit(handle, request)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render XYZ tiles of job outputs")
+    parser.add_argument("--outputs_dir", help="Directory holding one output directory per job (serve mode)")
+    parser.add_argument("--cache_dir", help="Directory of the on-disk tile cache (default: no disk cache)")
+    parser.add_argument("--memory_cache_mb", type=int, default=MEMORY_CACHE_MB,
+                        help="Budget of the in-memory tile cache in MB")
+    parser.add_argument("--disk_cache_mb", type=int, default=DISK_CACHE_MB,
+                        help="Budget of the on-disk tile cache in MB")
+    parser.add_argument("--threads", type=int, default=RENDER_THREADS, help="Threads rendering tiles")
+    parser.add_argument("--serve", action="store_true", help="Answer JSON-line requests on stdin")
+    parser.add_argument("--info", help="GeoTIFF to describe; prints its tile bounds and zoom range")
+    parser.add_argument("--render", nargs=4, metavar=("PATH", "Z", "X", "Y"), help="Render one tile of a GeoTIFF")
+    parser.add_argument("--format", choices=list(TILE_FORMATS), default="png", help="Format of --render")
+    parser.add_argument("--output", help="File --render writes the tile to")
+    
+    args = parser.parse_args()
+    
+    cache = TileCache(args.cache_dir, args.memory_cache_mb * 1024 * 1024, args.disk_cache_mb * 1024 * 1024)
+    
+    if args.serve:
+        if not args.outputs_dir:
+            parser.error("--serve requires --outputs_dir")
+        serve(args.outputs_dir, cache, args.threads)
+        return
+    
+    if args.info:
+        print(json.dumps(tile_info(args.info)))
+    
+    if args.render:
+        if not args.output:
+            parser.error("--render requires --output")
+        path, z, x, y = args.render
+        data = cached_tile(cache, path, int(z), int(x), int(y), args.format)
+        with open(args.output, 'wb') as f:
+            f.write(data)
+        print(f"Wrote {len(data)} bytes to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,217 +7,2867 @@ It clips both images to the specified AOI and aligns Image B to Image A.
 """
 
 import argparse
+import importlib
 import numpy as np
 import rasterio
-from rasterio.mask import mask
-from rasterio.warp import reproject, Resampling
-from skimage.registration import phase_cross_correlation
-from shapely.geometry import box
+from rasterio.enums import MaskFlags, Resampling
+from rasterio.windows import Window, transform as window_transform
+from rasterio.transform import from_bounds
+from rasterio.errors import RasterBlockError, WindowError
 import json
+import math
 import os
-from typing import Tuple, List
+import shutil
+import struct
+import subprocess
+import tempfile
+import threading
+from contextlib import contextmanager
+import sys
+import time
+import traceback
+from typing import TYPE_CHECKING, Tuple, List, Iterator, Optional, Union, Callable
 
+if TYPE_CHECKING:
+    # Only for annotations; loaded on demand like the other job modules below
+    from multiprocessing.shared_memory import SharedMemory
 
-def clip_image_to_aoi(image_path: str, aoi: dict) -> np.ndarray:
+# Heavy modules (scikit-image/SciPy FFT, the GDAL warper, process pools) are
+# imported inside the functions that need them to keep worker startup short.
+# Modules loaded with the worker itself, then those a job may load on demand
+# (see --profile_startup)
+STARTUP_MODULES = ("numpy", "rasterio")
+JOB_MODULES = (
+    "skimage.registration._phase_cross_correlation",
+    "scipy.fft",
+    "rasterio.warp",
+    "concurrent.futures.process",
+    "multiprocessing.shared_memory",
+    "scene_index",
+)
+
+# Registration methods selectable from the command line
+REGISTRATION_METHODS = ("full", "pyramid", "tiled")
+
+# FFT backends for phase correlation: 'skimage' runs phase_cross_correlation on
+# complex transforms and is kept as the reference implementation; 'numpy' and
+# 'scipy' use real-input transforms, and 'scipy' also runs them on several threads
+FFT_BACKENDS = ("skimage", "numpy", "scipy")
+
+# Floating-point precision registration bands are cast to. Clips, shifted
+# outputs and scratch files keep the source dtype; only the band being
+# correlated is converted
+REGISTRATION_PRECISIONS = ("float32", "float64")
+DEFAULT_FFT_OPTIONS = {'backend': 'scipy', 'threads': 1, 'pad': True, 'precision': 'float32'}
+
+# Pyramid registration: longest side of the coarse level and side of the full-res refinement patch
+PYRAMID_TARGET_SIZE = 512
+PYRAMID_PATCH_SIZE = 256
+
+# Tiled registration: tile side, step between tile origins (half-tile overlap)
+# and the largest correlation error a tile may have to count towards the global shift
+TILE_SIZE = 512
+TILE_STEP = 256
+TILE_MAX_ERROR = 0.4
+
+# Tiles with a smaller valid (unmasked) fraction in either image are not registered
+TILE_MIN_VALID = 0.5
+
+# Output formats and compression codecs selectable from the command line
+OUTPUT_FORMATS = ("cog", "gtiff")
+COMPRESSION_METHODS = ("deflate", "zstd", "lzw", "none")
+
+# COG outputs: internal tile size, and the layout of the uncompressed staging file they are copied from
+# (blocks left unwritten, e.g. empty source blocks, take no space and read back as nodata)
+COG_BLOCKSIZE = 512
+STAGING_CREATION_OPTIONS = {'tiled': True, 'blockxsize': COG_BLOCKSIZE, 'blockysize': COG_BLOCKSIZE,
+                            'compress': 'none', 'interleave': 'band', 'sparse_ok': True}
+
+# Rows per block when writing in-memory or generated data
+WRITE_BLOCK_ROWS = 256
+
+# Blocks a pipelined job reads ahead of the writer (see --pipeline); bounds the
+# memory the overlap costs to a few blocks per output being written
+PIPELINE_QUEUE_BLOCKS = 8
+
+# Codecs whose tiles decode on their own, so compressed tiles can be copied
+# between GeoTIFFs that share compression, predictor, tiling and interleave
+RAW_COPY_COMPRESSION = ("NONE", "DEFLATE", "LZW", "ZSTD", "LZMA", "PACKBITS")
+
+# TIFF tags locating each tile's compressed bytes
+TIFF_TILE_OFFSETS = 324
+TIFF_TILE_BYTE_COUNTS = 325
+
+# Directory for memory-mapped intermediates, inside the job output directory
+SCRATCH_DIR = ".scratch"
+
+# Prefix of each AOI's output files when one job covers several AOIs
+AOI_OUTPUT_PREFIX = "aoi{index}_"
+
+# Checkpoint manifest of a job (see JobCheckpoint) and the lock file serializing its
+# updates, inside the job output directory, and the manifest layout version
+CHECKPOINT_FILE = "checkpoint.json"
+CHECKPOINT_LOCK_FILE = "checkpoint.lock"
+CHECKPOINT_VERSION = 1
+
+# Block data written between checkpoint commits; an interrupted job redoes at most this much per output
+CHECKPOINT_BYTES = 64 * 1024 * 1024
+
+# Job arguments that change how a job runs but not what it writes, so a job
+# can resume with different values (see job_signature)
+CHECKPOINT_IGNORED_ARGS = ("out_dir", "resume", "events", "profile_job", "trace_memory", "serve",
+                           "profile_startup", "workers", "fft_threads", "warp_threads", "warp_memory_mb",
+                           "compress_threads", "pipeline")
+
+# Peak work arrays of a full-resolution phase correlation per FFT backend, in
+# bands at the registration precision (complex spectra count as two)
+FULL_CORRELATION_WORK_BANDS = {'skimage': 12, 'numpy': 8, 'scipy': 3}
+
+# Resampling applied when Image B is not on Image A's pixel grid
+DEFAULT_WARP_OPTIONS = {'resampling': Resampling.bilinear, 'num_threads': 1, 'warp_mem_limit': 0}
+
+# Resampling kernels selectable from the command line
+RESAMPLING_METHODS = ("nearest", "bilinear", "cubic", "cubic_spline", "lanczos", "average")
+
+# Placeholder CRS for georeference-free resizes of in-memory arrays
+RESAMPLE_CRS = 'EPSG:3857'
+
+
+def aoi_window(src, aoi: dict) -> Window:
+    """
+    Compute the pixel window of a dataset that covers the AOI.
+    
+    The window is snapped to whole pixels and limited to the dataset extent,
+    so that in-memory and block-streamed clips have identical shapes.
+    
+    Args:
+        src: Open rasterio dataset
+        aoi: Area of Interest as {north: lat, south: lat, east: lng, west: lng}
+    
+    Returns:
+        Integer window into the dataset
+    """
+    # Convert AOI bounds to image coordinates
+    min_lon, min_lat = aoi['west'], aoi['south']
+    max_lon, max_lat = aoi['east'], aoi['north']
+    
+    # Get the window that covers the AOI
+    window = src.window(min_lon, min_lat, max_lon, max_lat)
+    window = window.round_offsets().round_lengths()
+    
+    return window.intersection(Window(0, 0, src.width, src.height))
+
+
+def clip_image_to_aoi(image_path: str, aoi: dict, bands: Optional[List[int]] = None) -> np.ndarray:
+    """
+    Clip an image to the specified AOI (Area of Interest).
+    
+    Args:
+        image_path: Path to the input GeoTIFF
+        aoi: Area of Interest as {north: lat, south: lat, east: lng, west: lng}
+        bands: Optional 1-based band indexes to read (default: all bands)
+    
+    Returns:
+        Clipped image array
+    """
+    with rasterio.open(image_path) as src:
+        window = aoi_window(src, aoi)
+        
+        # Read the clipped image based on the window
+        clipped_image = src.read(indexes=bands, window=window)
+        
+        return clipped_image
+
+
+def has_dataset_mask(src) -> bool:
+    """Whether a dataset marks invalid pixels with a mask band or alpha rather than a nodata value."""
+    return any(MaskFlags.per_dataset in flags or MaskFlags.alpha in flags for flags in src.mask_flag_enums)
+
+
+def nodata_pixels(block: np.ndarray, nodata) -> np.ndarray:
+    """Boolean array marking the pixels of a block equal to the nodata value (NaN included)."""
+    if isinstance(nodata, float) and math.isnan(nodata):
+        return np.isnan(block)
+    return block == nodata
+
+
+def band_mask(src, window: Window, band: np.ndarray) -> Optional[np.ndarray]:
+    """
+    Validity mask of a clipped band of a dataset.
+    
+    Args:
+        src: Open rasterio dataset
+        window: Clip window the band was read from
+        band: The clipped band (bands, rows, cols) or (rows, cols), for nodata checks without I/O
+    
+    Returns:
+        Boolean (rows, cols) array, True where the first band is valid, or
+        None when every pixel is valid
+    """
+    band = band[0] if band.ndim > 2 else band
+    flags = src.mask_flag_enums[0]
+    if MaskFlags.all_valid in flags:
+        return None
+    if MaskFlags.nodata in flags:
+        mask = ~nodata_pixels(band, src.nodata)
+    else:
+        mask = src.read_masks(1, window=window) > 0
+    return None if mask.all() else mask
+
+
+def sparse_block(src, indexes: Optional[List[int]], block_row: int, block_col: int) -> bool:
+    """Whether a block was never written (a sparse GeoTIFF block), so it holds only nodata."""
+    if src.driver != 'GTiff':
+        return False
+    for index in indexes or src.indexes:
+        try:
+            if src.block_size(index, block_row, block_col):
+                return False
+        except RasterBlockError:
+            # GDAL reports no size for blocks that were never written
+            continue
+    return True
+
+
+def iter_clip_blocks(src, window: Window, indexes: Optional[List[int]] = None, masked: bool = False,
+                     skip: Optional[Callable[[Window], bool]] = None) -> Iterator[Tuple[Window, np.ndarray]]:
+    """
+    Stream a clip window block by block.
+    
+    Walks the dataset's internal blocks, crops each one to the clip window and
+    reads only that part, so at most one block is held in memory at a time.
+    Empty blocks (never written, or nodata throughout) are skipped, so
+    consumers must pre-fill their output with nodata; sparse scenes then cost
+    time in proportion to their valid area.
+    
+    Args:
+        src: Open rasterio dataset
+        window: Clip window into the dataset (see aoi_window)
+        indexes: Optional 1-based band indexes (default: all bands)
+        masked: Yield masked arrays carrying the dataset mask (see save_geotiff)
+        skip: Optional predicate on the clip-relative window of a block; blocks
+            it accepts are not read (e.g. blocks a resumed job already wrote)
+    
+    Yields:
+        Tuples of (window relative to the clip, block array of shape (bands, rows, cols))
+    """
+    nodata = src.nodata
+    for (block_row, block_col), block_window in src.block_windows(1):
+        try:
+            part = block_window.intersection(window)
+        except WindowError:
+            # Block lies entirely outside the AOI
+            continue
+        
+        dst_window = Window(part.col_off - window.col_off, part.row_off - window.row_off,
+                            part.width, part.height)
+        if skip is not None and skip(dst_window):
+            continue
+        if sparse_block(src, indexes, block_row, block_col):
+            continue
+        block = src.read(indexes, window=part)
+        if nodata is not None and nodata_pixels(block, nodata).all():
+            continue
+        if masked:
+            invalid = src.read_masks(1, window=part) == 0
+            block = np.ma.MaskedArray(block, mask=np.broadcast_to(invalid, block.shape))
+        
+        yield dst_window, block
+
+
+def snap_window_to_blocks(src, window: Window) -> Window:
+    """
+    Expand a window outward to the dataset's internal block boundaries.
+    
+    Args:
+        src: Open rasterio dataset
+        window: Integer window into the dataset
+    
+    Returns:
+        Block-aligned window, limited to the dataset extent
+    """
+    block_rows, block_cols = src.block_shapes[0]
+    col_off = int(window.col_off) // block_cols * block_cols
+    row_off = int(window.row_off) // block_rows * block_rows
+    col_end = min(math.ceil((window.col_off + window.width) / block_cols) * block_cols, src.width)
+    row_end = min(math.ceil((window.row_off + window.height) / block_rows) * block_rows, src.height)
+    return Window(col_off, row_off, col_end - col_off, row_end - row_off)
+
+
+def read_tiff_tile_index(f) -> dict:
+    """
+    Locate the tile offset and byte count arrays of a little-endian TIFF's first image.
+    
+    Args:
+        f: TIFF file opened in binary mode
+    
+    Returns:
+        Dictionary mapping TIFF_TILE_OFFSETS and TIFF_TILE_BYTE_COUNTS to
+        (struct format, count, file position of the array)
+    
+    Raises:
+        ValueError: If the file is not a little-endian tiled TIFF
+    """
+    f.seek(0)
+    header = f.read(16)
+    if header[:2] != b'II':
+        raise ValueError("Only little-endian TIFF files are supported")
+    
+    magic = struct.unpack('<H', header[2:4])[0]
+    if magic == 42:
+        ifd_offset, count_format, entry_size, inline_size = struct.unpack('<I', header[4:8])[0], '<H', 12, 4
+    elif magic == 43:
+        # BigTIFF: 8-byte offsets and counts
+        ifd_offset, count_format, entry_size, inline_size = struct.unpack('<Q', header[8:16])[0], '<Q', 20, 8
+    else:
+        raise ValueError("Not a TIFF file")
+    
+    f.seek(ifd_offset)
+    count_size = struct.calcsize(count_format)
+    entry_count = struct.unpack(count_format, f.read(count_size))[0]
+    entries = f.read(entry_count * entry_size)
+    
+    value_formats = {3: 'H', 4: 'I', 16: 'Q'}
+    index = {}
+    for position in range(0, len(entries), entry_size):
+        tag, value_type = struct.unpack('<HH', entries[position:position + 4])
+        if tag not in (TIFF_TILE_OFFSETS, TIFF_TILE_BYTE_COUNTS):
+            continue
+        if value_type not in value_formats:
+            raise ValueError(f"Unsupported type {value_type} for TIFF tag {tag}")
+        
+        value_format = value_formats[value_type]
+        count_end = position + 4 + inline_size
+        count = struct.unpack('<I' if inline_size == 4 else '<Q', entries[position + 4:count_end])[0]
+        value_position = ifd_offset + count_size + count_end
+        if count * struct.calcsize(value_format) > inline_size:
+            # The array lives elsewhere; the entry holds its offset
+            value_position = struct.unpack('<I' if inline_size == 4 else '<Q',
+                                           entries[count_end:count_end + inline_size])[0]
+        index[tag] = (value_format, count, value_position)
+    
+    if len(index) != 2:
+        raise ValueError("TIFF image is not tiled")
+    return index
+
+
+def read_tiff_array(f, entry: Tuple[str, int, int]) -> List[int]:
+    """Read one array located by read_tiff_tile_index."""
+    value_format, count, position = entry
+    f.seek(position)
+    return list(struct.unpack(f'<{count}{value_format}', f.read(count * struct.calcsize(value_format))))
+
+
+def write_tiff_array(f, entry: Tuple[str, int, int], values: List[int]):
+    """Overwrite one array located by read_tiff_tile_index."""
+    value_format, count, position = entry
+    f.seek(position)
+    f.write(struct.pack(f'<{count}{value_format}', *values))
+
+
+def copy_raw_tiles(src, window: Window, output_path: str) -> bool:
+    """
+    Write a block-aligned clip of a tiled GeoTIFF by copying its compressed tiles.
+    
+    The output is created empty with the source's compression, predictor,
+    tiling and interleave and an adjusted geotransform; the source tiles are
+    then appended byte for byte and the output's tile index is pointed at
+    them, so no pixel is decoded or re-encoded. COG outputs cannot use it,
+    as building their overviews decodes every tile anyway.
+    
+    Args:
+        src: Open rasterio dataset
+        window: Clip window into the dataset
+        output_path: Path for the output file
+    
+    Returns:
+        True if the clip was written, False if the source or window does not
+        allow a raw copy (nothing is written; use save_geotiff instead)
+    """
+    structure = src.tags(ns='IMAGE_STRUCTURE')
+    compression = structure.get('COMPRESSION', 'NONE').upper()
+    block_rows, block_cols = src.block_shapes[0]
+    if (src.driver != 'GTiff' or not src.profile.get('tiled') or compression not in RAW_COPY_COMPRESSION
+            or len(set(src.block_shapes)) != 1 or len(set(src.dtypes)) != 1 or has_dataset_mask(src)):
+        return False
+    
+    col_off, row_off, width, height = (int(value) for value in
+                                       (window.col_off, window.row_off, window.width, window.height))
+    # Tiles at the right and bottom edges are only complete at the dataset edge
+    aligned = (col_off % block_cols == 0 and row_off % block_rows == 0
+               and (width % block_cols == 0 or col_off + width == src.width)
+               and (height % block_rows == 0 or row_off + height == src.height))
+    if not aligned or width <= 0 or height <= 0:
+        return False
+    
+    try:
+        with open(src.name, 'rb') as source:
+            source_index = read_tiff_tile_index(source)
+            source_offsets = read_tiff_array(source, source_index[TIFF_TILE_OFFSETS])
+            source_counts = read_tiff_array(source, source_index[TIFF_TILE_BYTE_COUNTS])
+    except (OSError, ValueError):
+        return False
+    
+    # Separate-plane files store every tile of band 1, then band 2, ...
+    planes = src.count if structure.get('INTERLEAVE', 'PIXEL').upper() == 'BAND' else 1
+    source_across = math.ceil(src.width / block_cols)
+    source_per_plane = source_across * math.ceil(src.height / block_rows)
+    tiles_across, tiles_down = math.ceil(width / block_cols), math.ceil(height / block_rows)
+    tiles = [plane * source_per_plane + (row_off // block_rows + row) * source_across + col_off // block_cols + col
+             for plane in range(planes) for row in range(tiles_down) for col in range(tiles_across)]
+    payload = sum(source_counts[tile] for tile in tiles)
+    
+    profile = src.profile.copy()
+    profile.update({
+        'height': height,
+        'width': width,
+        'transform': src.window_transform(window),
+        'blockxsize': block_cols,
+        'blockysize': block_rows,
+        'compress': compression.lower(),
+        'interleave': 'band' if planes > 1 else 'pixel',
+        'endianness': 'little',
+        # Leave every tile unwritten so the index can be filled in afterwards
+        'sparse_ok': True,
+        'bigtiff': 'yes' if payload > 0xF0000000 else 'no',
+    })
+    if 'PREDICTOR' in structure:
+        profile['predictor'] = int(structure['PREDICTOR'])
+    with rasterio.open(output_path, 'w', **profile):
+        pass
+    
+    with open(src.name, 'rb') as source, open(output_path, 'r+b') as dst:
+        index = read_tiff_tile_index(dst)
+        if index[TIFF_TILE_OFFSETS][1] != len(tiles):
+            raise ValueError(f"Unexpected tile layout in {output_path}")
+        
+        offsets, counts = [], []
+        dst.seek(0, os.SEEK_END)
+        for tile in tiles:
+            # Sparse source tiles stay sparse
+            if source_counts[tile] == 0:
+                offsets.append(0)
+                counts.append(0)
+                continue
+            source.seek(source_offsets[tile])
+            offsets.append(dst.tell())
+            counts.append(source_counts[tile])
+            dst.write(source.read(source_counts[tile]))
+        
+        write_tiff_array(dst, index[TIFF_TILE_OFFSETS], offsets)
+        write_tiff_array(dst, index[TIFF_TILE_BYTE_COUNTS], counts)
+    return True
+
+
+def fft_functions(backend: str) -> Tuple[Callable, Callable, Callable]:
+    """
+    Look up the real-input transforms of an FFT backend.
+    
+    Both backends keep a cache of FFT plans per transform length, so repeated
+    sizes (tiles, batch targets, padded lengths) reuse their plans.
+    
+    Args:
+        backend: 'numpy' or 'scipy'
+    
+    Returns:
+        Tuple of (rfft2, irfft2, next_fast_len); the transforms take the output
+        shape as s and a thread count as workers
+    """
+    if backend == "scipy":
+        import scipy.fft
+        return scipy.fft.rfft2, scipy.fft.irfft2, scipy.fft.next_fast_len
+    if backend == "numpy":
+        # NumPy's pocketfft is single-threaded and has no fast-length helper
+        return (lambda a, s=None, workers=None: np.fft.rfft2(a, s=s),
+                lambda a, s=None, workers=None: np.fft.irfft2(a, s=s),
+                lambda n, real=False: n)
+    raise ValueError(f"Unknown FFT backend: {backend}")
+
+
+def correlation_shape(shape: Tuple[int, int], options: dict, normalization: Optional[str] = "phase") -> Tuple[int, int]:
+    """
+    Choose the transform shape of a phase correlation.
+    
+    Phase-normalised correlations are zero-padded to lengths with small prime
+    factors, which the FFT handles several times faster than e.g. prime
+    lengths. Unnormalised correlations keep their shape, because their error
+    depends on the circular wrap-around that padding would remove.
+    
+    Args:
+        shape: (rows, cols) of the bands
+        options: FFT options (see DEFAULT_FFT_OPTIONS)
+        normalization: 'phase' or None
+    
+    Returns:
+        (rows, cols) of the transforms
+    """
+    if options['backend'] == "skimage" or not options['pad'] or normalization != "phase":
+        return tuple(shape)
+    _, _, next_fast_len = fft_functions(options['backend'])
+    # The last axis goes through the real-input transform
+    return next_fast_len(shape[0]), next_fast_len(shape[1], real=True)
+
+
+def _correlation_input(band: np.ndarray, shape: Tuple[int, int], dtype,
+                       mask: Optional[np.ndarray] = None, out: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Cast a band to the registration precision, zero-padded to shape around its mean.
+    
+    Masked pixels are set to the mean of the valid ones, i.e. to zero after the
+    mean removal, so they add nothing to the correlation; whatever they held
+    (including NaN nodata) never reaches the transform. With out (a zeroed
+    array of shape), the result is written there, e.g. into one plane of a stack.
+    """
+    if mask is None and band.shape == tuple(shape):
+        if out is None:
+            return band.astype(dtype, copy=False)
+        out[...] = band
+        return out
+    
+    # One allocation holds the cast, the padding and the mean removal
+    padded = np.zeros(shape, dtype=dtype) if out is None else out
+    rows, cols = band.shape
+    view = padded[:rows, :cols]
+    view[...] = band
+    # A non-zero mean would make the padding (or mask) edge the strongest correlation feature
+    if mask is None:
+        view -= view.mean(dtype=np.float64)
+    else:
+        # Filled rather than multiplied by the mask, since NaN * 0 is still NaN
+        np.copyto(view, 0, where=~mask)
+        valid = np.count_nonzero(mask)
+        view -= np.sum(view, dtype=np.float64) / valid if valid else 0
+        np.copyto(view, 0, where=~mask)
+    return padded
+
+
+def _correlation_stack(bands: np.ndarray, shape: Tuple[int, int], dtype,
+                       mask: Optional[np.ndarray] = None) -> np.ndarray:
+    """Prepare every band of a (bands, rows, cols) stack as _correlation_input does, in one array."""
+    stack = np.zeros((len(bands),) + tuple(shape), dtype=dtype)
+    for band, plane in zip(bands, stack):
+        _correlation_input(band, shape, dtype, mask, out=plane)
+    return stack
+
+
+def _skimage_input(band: np.ndarray, dtype) -> np.ndarray:
+    """Cast a band for the skimage backend, whose FFT promotes integer bands to float64 itself."""
+    if dtype == np.float64 and np.issubdtype(band.dtype, np.integer):
+        return band
+    return band.astype(dtype, copy=False)
+
+
+def band_energy(band: np.ndarray, centered: bool = False, mask: Optional[np.ndarray] = None) -> float:
+    """
+    Sum of squares of a band, accumulated in float64 one row block at a time.
+    
+    Args:
+        band: Band of any dtype
+        centered: Measure the band with its mean removed
+        mask: Optional validity mask; only valid pixels are measured
+    
+    Returns:
+        Energy of the band
+    """
+    energy, total, count = 0.0, 0.0, 0
+    for row in range(0, band.shape[0], WRITE_BLOCK_ROWS):
+        block = band[row:row + WRITE_BLOCK_ROWS].astype(np.float64)
+        block = block[mask[row:row + WRITE_BLOCK_ROWS]] if mask is not None else block.ravel()
+        energy += float(np.dot(block, block))
+        total += float(block.sum())
+        count += block.size
+    if centered and count:
+        energy -= total * total / count
+    return energy
+
+
+def fft_spectrum(band: np.ndarray, fft_options: Optional[dict] = None,
+                 mask: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Transform a reference band once so several targets can be correlated against it.
+    
+    Args:
+        band: Reference band, or a (bands, rows, cols) stack for phase_correlate_bands
+        fft_options: FFT options (see DEFAULT_FFT_OPTIONS)
+        mask: Optional validity mask of the band (see phase_correlate)
+    
+    Returns:
+        Spectrum in the layout phase_correlate (or phase_correlate_bands) expects
+        for its backend
+    """
+    options = dict(DEFAULT_FFT_OPTIONS, **(fft_options or {}))
+    dtype = np.dtype(options['precision'])
+    if band.ndim > 2:
+        rfft2, _, _ = fft_functions(joint_fft_backend(options))
+        shape = correlation_shape(band.shape[-2:], options)
+        return rfft2(_correlation_stack(band, shape, dtype, mask), workers=options['threads'])
+    if options['backend'] == "skimage":
+        if mask is not None:
+            return np.fft.fft2(_correlation_input(band, band.shape, dtype, mask))
+        return np.fft.fft2(_skimage_input(band, dtype))
+    
+    rfft2, _, _ = fft_functions(options['backend'])
+    shape = correlation_shape(band.shape, options)
+    return rfft2(_correlation_input(band, shape, dtype, mask), workers=options['threads'])
+
+
+def phase_correlate(reference: np.ndarray, moving: np.ndarray, normalization: Optional[str] = "phase",
+                    reference_spectrum: Optional[np.ndarray] = None,
+                    fft_options: Optional[dict] = None, upsample_factor: int = 1,
+                    reference_mask: Optional[np.ndarray] = None,
+                    moving_mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, float]:
+    """
+    Estimate the shift registering moving to reference by phase correlation.
+    
+    Bands keep their native dtype until here and are cast to the registration
+    precision one at a time. The numpy and scipy backends reproduce skimage's
+    phase_cross_correlation (peak of the inverse-transformed cross-power
+    spectrum, wrapped at the midpoint, and the same error measure) with
+    real-input transforms and in-place work arrays.
+    
+    Masked pixels (nodata, clouds) are set to the mean of the valid pixels of
+    their band before the transform, so they neither match nor mismatch, and
+    the error is measured over the valid pixels only.
+    
+    Args:
+        reference: Reference band
+        moving: Band to be registered (same shape)
+        normalization: 'phase' for phase correlation, None for plain cross-correlation
+        reference_spectrum: Optional cached fft_spectrum of reference
+        fft_options: FFT options (see DEFAULT_FFT_OPTIONS)
+        upsample_factor: Subpixel refinement of the skimage backend; the other
+            backends return the whole-pixel peak, which callers round to anyway
+        reference_mask: Optional validity mask of reference (True where valid);
+            a reference_spectrum must have been computed with it
+        moving_mask: Optional validity mask of moving
+    
+    Returns:
+        Tuple of ((row, col) shift, registration error)
+    """
+    options = dict(DEFAULT_FFT_OPTIONS, **(fft_options or {}))
+    dtype = np.dtype(options['precision'])
+    if options['backend'] == "skimage":
+        from skimage.registration import phase_cross_correlation
+        
+        if moving_mask is not None:
+            moving = _correlation_input(moving, moving.shape, dtype, moving_mask)
+        else:
+            moving = _skimage_input(moving, dtype)
+        if reference_mask is not None:
+            reference = _correlation_input(reference, reference.shape, dtype, reference_mask)
+        # skimage multiplies the spectrum energies in the input precision; in float32
+        # the product can overflow on large bands, which only saturates the error at 1
+        with np.errstate(over='ignore'):
+            if reference_spectrum is not None:
+                shift, error, _ = phase_cross_correlation(reference_spectrum, np.fft.fft2(moving), space="fourier",
+                                                          upsample_factor=upsample_factor,
+                                                          normalization=normalization)
+            else:
+                shift, error, _ = phase_cross_correlation(_skimage_input(reference, dtype), moving,
+                                                          upsample_factor=upsample_factor,
+                                                          normalization=normalization)
+        return shift, float(error)
+    
+    if normalization not in ("phase", None):
+        raise ValueError("normalization must be either phase or None")
+    
+    rfft2, irfft2, _ = fft_functions(options['backend'])
+    threads = options['threads']
+    shape = correlation_shape(reference.shape, options, normalization)
+    padded = shape != reference.shape
+    
+    # Band energies stand in for skimage's spectrum energies (Parseval)
+    reference_energy = band_energy(reference, padded or reference_mask is not None, reference_mask)
+    moving_energy = band_energy(moving, padded or moving_mask is not None, moving_mask)
+    
+    if reference_spectrum is None:
+        reference_spectrum = rfft2(_correlation_input(reference, shape, dtype, reference_mask), workers=threads)
+    product = rfft2(_correlation_input(moving, shape, dtype, moving_mask), workers=threads)
+    np.conjugate(product, out=product)
+    product *= reference_spectrum
+    del reference_spectrum
+    if normalization == "phase":
+        magnitude = np.abs(product)
+        np.maximum(magnitude, 100 * np.finfo(dtype).eps, out=magnitude)
+        product /= magnitude
+        del magnitude
+    correlation = irfft2(product, s=shape, workers=threads)
+    del product
+    
+    # The error only needs the magnitude of the peak
+    np.abs(correlation, out=correlation)
+    peak = np.unravel_index(np.argmax(correlation), shape)
+    shift = np.array(peak, dtype=float)
+    sizes = np.array(shape)
+    wrapped = shift > np.trunc(sizes / 2)
+    shift[wrapped] -= sizes[wrapped]
+    
+    if reference_energy * moving_energy <= 0:
+        # Nothing valid (or nothing but a constant) to correlate
+        return shift, 1.0
+    error = np.sqrt(abs(1 - float(correlation[peak]) ** 2 / (reference_energy * moving_energy)))
+    return shift, float(error)
+
+
+def joint_fft_backend(options: dict) -> str:
+    """FFT backend of a joint multi-band correlation; skimage has no batched transform, so NumPy's stands in."""
+    return "numpy" if options['backend'] == "skimage" else options['backend']
+
+
+def correlation_at(spectra: np.ndarray, position: Tuple[int, int], shape: Tuple[int, int]) -> np.ndarray:
+    """
+    Evaluate the inverse real transforms of a stack of half spectra at one position.
+    
+    A direct sum over the spectrum (with the Hermitian weights irfft2 implies)
+    costs one pass over the spectra instead of one inverse transform per band.
+    
+    Args:
+        spectra: (bands, rows, cols // 2 + 1) real-input spectra
+        position: (row, col) to evaluate
+        shape: (rows, cols) of the inverse transforms
+    
+    Returns:
+        Value of each band's inverse transform at position
+    """
+    rows, cols = shape
+    row_phase = np.exp(2j * np.pi * np.arange(rows) * position[0] / rows).astype(spectra.dtype)
+    col_phase = np.exp(2j * np.pi * np.arange(spectra.shape[-1]) * position[1] / cols)
+    # Columns other than 0 and the Nyquist column stand for their conjugate too
+    weights = np.full(spectra.shape[-1], 2.0)
+    weights[0] = 1.0
+    if cols % 2 == 0:
+        weights[-1] = 1.0
+    col_phase = (col_phase * weights).astype(spectra.dtype)
+    return ((row_phase @ spectra) @ col_phase).real / (rows * cols)
+
+
+def phase_correlate_bands(reference: np.ndarray, moving: np.ndarray, normalization: Optional[str] = "phase",
+                          reference_spectrum: Optional[np.ndarray] = None,
+                          fft_options: Optional[dict] = None,
+                          reference_mask: Optional[np.ndarray] = None,
+                          moving_mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, float, List[dict]]:
+    """
+    Estimate one shift registering several bands of moving to reference jointly.
+    
+    All bands go through one batched forward transform per image. Their
+    (normalised) cross-power spectra are summed and a single inverse transform
+    gives the fused correlation, so a band with little contrast is carried by
+    the others instead of deciding the peak on its own. The cost is close to
+    that of one band transformed n times over, not of n separate correlations.
+    
+    The error treats the bands as one multi-channel signal: the skimage error
+    measure with the fused peak and the summed band energies.
+    
+    Args:
+        reference: Reference bands (bands, rows, cols)
+        moving: Bands to be registered (same shape)
+        normalization: 'phase' for phase correlation, None for plain cross-correlation
+        reference_spectrum: Optional cached fft_spectrum of the reference stack
+        fft_options: FFT options (see DEFAULT_FFT_OPTIONS); the skimage backend
+            runs on NumPy's transforms (see joint_fft_backend)
+        reference_mask: Optional validity mask shared by the reference bands
+        moving_mask: Optional validity mask shared by the moving bands
+    
+    Returns:
+        Tuple of ((row, col) shift, registration error, contribution of each
+        band as {'peak', 'share'}: its correlation at the fused peak and its
+        fraction of the fused peak)
+    """
+    if normalization not in ("phase", None):
+        raise ValueError("normalization must be either phase or None")
+    
+    options = dict(DEFAULT_FFT_OPTIONS, **(fft_options or {}))
+    dtype = np.dtype(options['precision'])
+    rfft2, irfft2, _ = fft_functions(joint_fft_backend(options))
+    threads = options['threads']
+    shape = correlation_shape(reference.shape[-2:], options, normalization)
+    padded = shape != reference.shape[-2:]
+    
+    reference_energy = np.array([band_energy(band, padded or reference_mask is not None, reference_mask)
+                                 for band in reference])
+    moving_energy = np.array([band_energy(band, padded or moving_mask is not None, moving_mask)
+                              for band in moving])
+    
+    if reference_spectrum is None:
+        reference_spectrum = rfft2(_correlation_stack(reference, shape, dtype, reference_mask), workers=threads)
+    product = rfft2(_correlation_stack(moving, shape, dtype, moving_mask), workers=threads)
+    np.conjugate(product, out=product)
+    product *= reference_spectrum
+    del reference_spectrum
+    if normalization == "phase":
+        # Each band is normalised on its own, so every band weighs the same in the sum
+        magnitude = np.abs(product)
+        np.maximum(magnitude, 100 * np.finfo(dtype).eps, out=magnitude)
+        product /= magnitude
+        del magnitude
+    correlation = irfft2(product.sum(axis=0), s=shape, workers=threads)
+    
+    np.abs(correlation, out=correlation)
+    peak = np.unravel_index(np.argmax(correlation), shape)
+    fused = float(correlation[peak])
+    del correlation
+    shift = np.array(peak, dtype=float)
+    sizes = np.array(shape)
+    wrapped = shift > np.trunc(sizes / 2)
+    shift[wrapped] -= sizes[wrapped]
+    
+    peaks = correlation_at(product, peak, shape)
+    del product
+    total = float(peaks.sum())
+    contributions = [{'peak': round(float(value), 6), 'share': round(float(value) / total, 4) if total else 0.0}
+                     for value in peaks]
+    
+    energy = float(reference_energy.sum() * moving_energy.sum())
+    if energy <= 0:
+        # Nothing valid (or nothing but a constant) to correlate
+        return shift, 1.0, contributions
+    return shift, float(np.sqrt(abs(1 - fused ** 2 / energy))), contributions
+
+
+def pyramid_factor(shape: Tuple[int, int], overview_factors: List[int] = ()) -> int:
+    """
+    Choose the decimation factor for the coarse registration level.
+    
+    Args:
+        shape: (rows, cols) of the full-resolution clip
+        overview_factors: Decimation factors of the dataset's existing overviews
+    
+    Returns:
+        Power-of-two factor bringing the longest side near PYRAMID_TARGET_SIZE,
+        or the largest existing overview factor not exceeding it
+    """
+    factor = 1
+    while max(shape) // (factor * 2) >= PYRAMID_TARGET_SIZE:
+        factor *= 2
+    
+    usable = [f for f in overview_factors if 1 < f <= factor]
+    return max(usable) if usable else factor
+
+
+def read_overview_band(image_path: str, window: Window, factor: int, band: int = 1) -> Optional[np.ndarray]:
+    """
+    Read one band of a clip window from the dataset's overviews.
+    
+    Args:
+        image_path: Path to the input GeoTIFF
+        window: Clip window into the dataset
+        factor: Decimation factor of the level to read
+        band: 1-based band to read
+    
+    Returns:
+        Decimated band, or None if the dataset has no overviews
+    """
+    with open_raster(image_path) as src:
+        if not src.overviews(band):
+            return None
+        
+        # GDAL serves an out_shape read from the matching overview level
+        rows, cols = int(window.height) // factor, int(window.width) // factor
+        window = Window(window.col_off, window.row_off, cols * factor, rows * factor)
+        return src.read(band, window=window, out_shape=(rows, cols), resampling=Resampling.average)
+
+
+def downsample_band(band: np.ndarray, factor: int, dtype=np.float32,
+                    mask: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Build a coarse level by averaging factor x factor pixel blocks.
+    
+    Args:
+        band: Full-resolution band
+        factor: Decimation factor
+        dtype: Floating-point dtype of the result (the registration precision)
+        mask: Optional validity mask; only valid pixels are averaged and
+            blocks without any are 0
+    
+    Returns:
+        Decimated band
+    """
+    rows, cols = band.shape[0] // factor, band.shape[1] // factor
+    blocks = band[:rows * factor, :cols * factor].reshape(rows, factor, cols, factor)
+    if mask is None:
+        return blocks.mean(axis=(1, 3), dtype=dtype)
+    
+    # Masked averages a strip of blocks at a time, without a full-size copy
+    valid = mask[:rows * factor, :cols * factor].reshape(rows, factor, cols, factor)
+    coarse = np.zeros((rows, cols), dtype=dtype)
+    step = max(1, WRITE_BLOCK_ROWS // factor)
+    for row in range(0, rows, step):
+        strip = slice(row, row + step)
+        sums = np.sum(blocks[strip], axis=(1, 3), where=valid[strip], dtype=np.float64)
+        counts = valid[strip].sum(axis=(1, 3))
+        np.divide(sums, counts, out=sums, where=counts > 0)
+        coarse[strip] = sums
+    return coarse
+
+
+def downsample_mask(mask: np.ndarray, factor: int) -> np.ndarray:
+    """Coarse validity mask matching downsample_band: blocks at least half valid."""
+    rows, cols = mask.shape[0] // factor, mask.shape[1] // factor
+    valid = mask[:rows * factor, :cols * factor].reshape(rows, factor, cols, factor)
+    return valid.sum(axis=(1, 3)) * 2 >= factor * factor
+
+
+def valid_bounds(mask: np.ndarray) -> Tuple[slice, slice]:
+    """Row and column slices of the bounding box of the valid pixels of a mask."""
+    rows = np.flatnonzero(mask.any(axis=1))
+    cols = np.flatnonzero(mask.any(axis=0))
+    if rows.size == 0:
+        return slice(0, 0), slice(0, 0)
+    return slice(int(rows[0]), int(rows[-1]) + 1), slice(int(cols[0]), int(cols[-1]) + 1)
+
+
+def valid_patch_start(ranges: List[Tuple[int, int]], preferred: List[int], patch: int, offset: np.ndarray,
+                      reference_mask: Optional[np.ndarray], target_mask: Optional[np.ndarray],
+                      stride: int) -> List[int]:
+    """
+    Choose the refinement patch with the most pixels valid in both images.
+    
+    Candidates lie half a patch apart within the allowed start ranges; their
+    coverage is estimated on masks subsampled by stride. Ties go to the
+    candidate closest to the preferred (central) start.
+    
+    Args:
+        ranges: (lowest, highest) allowed start per axis
+        preferred: Start used when every candidate is equally valid
+        patch: Patch side
+        offset: Predicted (row, col) shift of the target patch
+        reference_mask: Optional validity mask of the reference band
+        target_mask: Optional validity mask of the target band
+        stride: Subsampling step of the coverage estimate
+    
+    Returns:
+        [row, col] start of the reference patch
+    """
+    candidates = [sorted(set(range(low, high + 1, max(1, patch // 2))) | {start})
+                  for (low, high), start in zip(ranges, preferred)]
+    best, best_key = preferred, None
+    for row in candidates[0]:
+        for col in candidates[1]:
+            valid = np.ones((len(range(0, patch, stride)),) * 2, dtype=bool)
+            if reference_mask is not None:
+                valid &= reference_mask[row:row + patch:stride, col:col + patch:stride]
+            if target_mask is not None:
+                valid &= target_mask[row - offset[0]:row - offset[0] + patch:stride,
+                                     col - offset[1]:col - offset[1] + patch:stride]
+            key = (-np.count_nonzero(valid), abs(row - preferred[0]) + abs(col - preferred[1]))
+            if best_key is None or key < best_key:
+                best, best_key = [row, col], key
+    return best
+
+
+def estimate_shift_pyramid(reference_band: np.ndarray, target_band: np.ndarray, factor: int,
+                           coarse_reference: Optional[np.ndarray] = None,
+                           coarse_target: Optional[np.ndarray] = None,
+                           fft_options: Optional[dict] = None,
+                           reference_mask: Optional[np.ndarray] = None,
+                           target_mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, float]:
+    """
+    Estimate the integer shift coarse-to-fine.
+    
+    The shift is first found on a decimated level, then refined by phase
+    correlation on a small full-resolution patch around the predicted offset.
+    With masks, the patch is moved to where both images are valid.
+    
+    Args:
+        reference_band: Full-resolution reference band
+        target_band: Full-resolution band to be aligned (same shape)
+        factor: Decimation factor of the coarse level
+        coarse_reference: Optional precomputed coarse reference (e.g. from overviews)
+        coarse_target: Optional precomputed coarse target
+        fft_options: FFT options for phase_correlate
+        reference_mask: Optional validity mask of the reference band
+        target_mask: Optional validity mask of the target band
+    
+    Returns:
+        Tuple of (integer (row, col) shift, registration error)
+    """
+    precision = dict(DEFAULT_FFT_OPTIONS, **(fft_options or {}))['precision']
+    if coarse_reference is None:
+        coarse_reference = downsample_band(reference_band, factor, precision, reference_mask)
+    if coarse_target is None:
+        coarse_target = downsample_band(target_band, factor, precision, target_mask)
+    if coarse_reference.shape != coarse_target.shape:
+        coarse_reference = downsample_band(reference_band, factor, precision, reference_mask)
+        coarse_target = downsample_band(target_band, factor, precision, target_mask)
+    
+    coarse_masks = [downsample_mask(mask, factor) if mask is not None else None
+                    for mask in (reference_mask, target_mask)]
+    coarse_shift, _ = phase_correlate(coarse_reference, coarse_target, fft_options=fft_options,
+                                      reference_mask=coarse_masks[0], moving_mask=coarse_masks[1])
+    predicted = np.round(coarse_shift * factor).astype(int)
+    
+    # The patch must cover the residual error of the coarse estimate
+    rows, cols = reference_band.shape
+    patch = max(PYRAMID_PATCH_SIZE, 8 * factor)
+    starts, ranges = [], []
+    for size, offset in ((rows, predicted[0]), (cols, predicted[1])):
+        low, high = max(0, offset), min(size, size + offset) - patch
+        if high < low:
+            starts = None
+            break
+        ranges.append((low, high))
+        starts.append(int(np.clip((size - patch) // 2, low, high)))
+    
+    if starts is None:
+        # Not enough overlap for a refinement patch; register at full resolution
+        shift, error = phase_correlate(reference_band, target_band, fft_options=fft_options,
+                                       reference_mask=reference_mask, moving_mask=target_mask)
+        return np.round(shift).astype(int), error
+    
+    if reference_mask is not None or target_mask is not None:
+        starts = valid_patch_start(ranges, starts, patch, predicted, reference_mask, target_mask, factor)
+    
+    row, col = starts
+    reference_window = (slice(row, row + patch), slice(col, col + patch))
+    target_window = (slice(row - predicted[0], row - predicted[0] + patch),
+                     slice(col - predicted[1], col - predicted[1] + patch))
+    residual, error = phase_correlate(
+        reference_band[reference_window], target_band[target_window], fft_options=fft_options,
+        reference_mask=reference_mask[reference_window] if reference_mask is not None else None,
+        moving_mask=target_mask[target_window] if target_mask is not None else None)
+    
+    return predicted + np.round(residual).astype(int), error
+
+
+def tile_origins(size: int, tile: int, step: int) -> List[int]:
+    """
+    Compute overlapping tile start offsets along one axis.
+    
+    Args:
+        size: Length of the axis
+        tile: Tile length
+        step: Distance between consecutive tile starts
+    
+    Returns:
+        Start offsets; the last tile ends exactly at size
+    """
+    if size <= tile:
+        return [0]
+    
+    origins = list(range(0, size - tile + 1, step))
+    if origins[-1] != size - tile:
+        origins.append(size - tile)
+    return origins
+
+
+# Registration bands attached in each tiled-registration pool process
+_tile_bands = {}
+
+
+def _attach_tile_bands(specs: dict):
+    """Pool initializer: map the shared registration bands into this process."""
+    for key, spec in specs.items():
+        shm, array = attach_shared_array(spec)
+        _tile_bands[key] = array
+        _tile_bands.setdefault('_handles', []).append(shm)
+
+
+def overlap_error(reference: np.ndarray, moving: np.ndarray, shift: np.ndarray,
+                  reference_mask: Optional[np.ndarray] = None, moving_mask: Optional[np.ndarray] = None) -> float:
+    """
+    Registration error of a shift measured on the pixels both bands cover.
+    
+    The error is sqrt(1 - r^2) for the correlation coefficient r of the pixels
+    that overlap after the shift and are valid in both bands, i.e. the
+    correlation normalised by the energy of those pixels only. A clean match
+    scores near 0 however much of the bands is masked or shifted out of
+    frame, while unrelated or anti-correlated content scores near 1.
+    
+    Args:
+        reference: Reference band
+        moving: Registered band (same shape)
+        shift: (row, col) shift registering moving to reference (see phase_correlate)
+        reference_mask: Optional validity mask of reference
+        moving_mask: Optional validity mask of moving
+    
+    Returns:
+        Registration error between 0 and 1
+    """
+    rows, cols = reference.shape
+    shift_y, shift_x = (int(round(value)) for value in shift)
+    # reference[row, col] lines up with moving[row - shift_y, col - shift_x]
+    reference_window = (slice(max(0, shift_y), min(rows, rows + shift_y)),
+                        slice(max(0, shift_x), min(cols, cols + shift_x)))
+    moving_window = (slice(max(0, -shift_y), min(rows, rows - shift_y)),
+                     slice(max(0, -shift_x), min(cols, cols - shift_x)))
+    valid = np.ones(reference[reference_window].shape, dtype=bool)
+    if reference_mask is not None:
+        valid &= reference_mask[reference_window]
+    if moving_mask is not None:
+        valid &= moving_mask[moving_window]
+    if not valid.any():
+        return 1.0
+    
+    a = reference[reference_window][valid].astype(np.float64)
+    b = moving[moving_window][valid].astype(np.float64)
+    a -= a.mean()
+    b -= b.mean()
+    energy = float(np.dot(a, a)) * float(np.dot(b, b))
+    if energy <= 0:
+        return 1.0
+    r = max(0.0, float(np.dot(a, b)) / np.sqrt(energy))
+    return float(np.sqrt(max(0.0, 1 - r * r)))
+
+
+def register_tile(row: int, col: int, tile: int, bands: Optional[dict] = None,
+                  fft_options: Optional[dict] = None) -> Tuple[float, float, float]:
+    """
+    Estimate the local shift of one tile.
+    
+    Correlation is unnormalised so that the returned error reflects how well
+    the tile matches (near 0 for a clean match, around 0.5 or more for
+    featureless or unrelated content). Tiles that are mostly masked in either
+    image are rejected without being correlated; partly masked tiles are
+    scored by overlap_error, so their error stays on the same scale as that
+    of fully valid tiles, which are correlated without masks.
+    
+    Args:
+        row: Tile start row
+        col: Tile start column
+        tile: Tile side
+        bands: Dict with 'reference' and 'target' bands and optionally their
+            'reference_mask' and 'target_mask' (default: the pool's shared bands)
+        fft_options: FFT options for phase_correlate
+    
+    Returns:
+        Tuple of (row shift, column shift, error)
+    """
+    if bands is None:
+        bands = _tile_bands
+    
+    window = (slice(row, row + tile), slice(col, col + tile))
+    reference_tile, target_tile = bands['reference'][window], bands['target'][window]
+    masks = [bands[key][window] if bands.get(key) is not None else None
+             for key in ('reference_mask', 'target_mask')]
+    if any(mask is not None and np.count_nonzero(mask) < TILE_MIN_VALID * mask.size for mask in masks):
+        # Nodata collars and clouds carry no registration signal
+        return 0.0, 0.0, 1.0
+    masks = [mask if mask is not None and not mask.all() else None for mask in masks]
+    if (np.std(reference_tile, where=masks[0] if masks[0] is not None else True) == 0
+            or np.std(target_tile, where=masks[1] if masks[1] is not None else True) == 0):
+        # Constant tiles carry no registration signal
+        return 0.0, 0.0, 1.0
+    
+    shift, error = phase_correlate(reference_tile, target_tile, normalization=None, fft_options=fft_options,
+                                   reference_mask=masks[0], moving_mask=masks[1])
+    if masks[0] is not None or masks[1] is not None:
+        # The masked correlation's error is normalised by all valid pixels, not only
+        # those that overlap, and would reject clean matches next to nodata
+        error = overlap_error(reference_tile, target_tile, shift, masks[0], masks[1])
+    return float(shift[0]), float(shift[1]), float(error)
+
+
+def estimate_shift_tiled(reference_band: np.ndarray, target_band: np.ndarray,
+                         tile: int = TILE_SIZE, step: int = TILE_STEP,
+                         max_error: float = TILE_MAX_ERROR, workers: int = 1,
+                         fft_options: Optional[dict] = None,
+                         reference_mask: Optional[np.ndarray] = None,
+                         target_mask: Optional[np.ndarray] = None) -> dict:
+    """
+    Estimate a per-tile shift field and a robust global shift.
+    
+    The clip is split into overlapping tiles that are registered independently,
+    across a process pool when workers > 1. Tiles whose correlation error
+    exceeds max_error are rejected; the global shift is the median of the rest.
+    
+    Args:
+        reference_band: Full-resolution reference band
+        target_band: Full-resolution band to be aligned (same shape)
+        tile: Tile side
+        step: Distance between tile origins
+        max_error: Largest accepted tile error
+        workers: Number of processes registering tiles
+        fft_options: FFT options for phase_correlate
+        reference_mask: Optional validity mask of the reference band
+        target_mask: Optional validity mask of the target band
+    
+    Returns:
+        Alignment info with the global shift, median accepted error and a
+        'tiles' entry holding the shift grid
+    """
+    rows, cols = reference_band.shape
+    tile = min(tile, rows, cols)
+    row_origins = tile_origins(rows, tile, step)
+    col_origins = tile_origins(cols, tile, step)
+    origins = [(row, col) for row in row_origins for col in col_origins]
+    bands = {'reference': reference_band, 'target': target_band,
+             'reference_mask': reference_mask, 'target_mask': target_mask}
+    
+    if workers > 1 and len(origins) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        
+        shared = {key: share_array(array) for key, array in bands.items() if array is not None}
+        specs = {key: spec for key, (_, spec) in shared.items()}
+        # Tiles already run in parallel; one FFT thread each avoids oversubscription
+        tile_fft_options = dict(fft_options or {}, threads=1)
+        try:
+            with ProcessPoolExecutor(max_workers=min(workers, len(origins)),
+                                     initializer=_attach_tile_bands, initargs=(specs,)) as pool:
+                results = list(pool.map(register_tile, *zip(*origins), [tile] * len(origins),
+                                        [None] * len(origins), [tile_fft_options] * len(origins),
+                                        chunksize=max(1, len(origins) // (4 * workers))))
+        finally:
+            release_shared(shared)
+    else:
+        results = [register_tile(row, col, tile, bands, fft_options) for row, col in origins]
+    
+    shifts = np.array(results).reshape(len(row_origins), len(col_origins), 3)
+    accepted = shifts[..., 2] <= max_error
+    print(f"Tiled registration: {int(accepted.sum())}/{accepted.size} tiles accepted")
+    
+    if accepted.any():
+        shift_y, shift_x = np.median(shifts[accepted][:, :2], axis=0)
+        error = float(np.median(shifts[accepted][:, 2]))
+    else:
+        # No confident tile; fall back to registering the whole clip
+        (shift_y, shift_x), error = phase_correlate(reference_band, target_band, fft_options=fft_options,
+                                                    reference_mask=reference_mask, moving_mask=target_mask)
+    
+    return {
+        "shift_x": int(np.round(shift_x)),
+        "shift_y": int(np.round(shift_y)),
+        "error": float(error),
+        "tiles": {
+            "size": tile,
+            "row_origins": row_origins,
+            "col_origins": col_origins,
+            "shift_x": shifts[..., 1].astype(int).tolist(),
+            "shift_y": shifts[..., 0].astype(int).tolist(),
+            "error": np.round(shifts[..., 2], 4).tolist(),
+            "accepted": accepted.tolist(),
+        },
+    }
+
+
+def resample_to_shape(image: np.ndarray, shape: Tuple[int, int],
+                      warp_options: Optional[dict] = None) -> np.ndarray:
+    """
+    Resize an image to the given (rows, cols), keeping its dtype.
+    
+    Args:
+        image: Image array of shape (bands, rows, cols)
+        shape: Target (rows, cols)
+        warp_options: Optional reproject keyword arguments (resampling, num_threads)
+    
+    Returns:
+        Resized image array
+    """
+    from rasterio.warp import reproject
+    
+    rows, cols = shape
+    destination = np.zeros(image.shape[:-2] + (rows, cols), dtype=image.dtype)
+    
+    # Both grids span the same unit square, so the warp is a pure resize
+    reproject(image, destination,
+              src_transform=from_bounds(0, 0, 1, 1, image.shape[-1], image.shape[-2]),
+              dst_transform=from_bounds(0, 0, 1, 1, cols, rows),
+              src_crs=RESAMPLE_CRS, dst_crs=RESAMPLE_CRS,
+              **dict(DEFAULT_WARP_OPTIONS, **(warp_options or {})))
+    return destination
+
+
+def iter_warped_blocks(src, dst_transform, dst_crs, shape: Tuple[int, int],
+                       indexes: Optional[List[int]] = None, fill_value=0, warp_options: Optional[dict] = None,
+                       skip: Optional[Callable[[Window], bool]] = None) -> Iterator[Tuple[Window, np.ndarray]]:
+    """
+    Warp a dataset onto a target grid one row block at a time.
+    
+    GDAL reads only the source pixels each block needs, so neither the source
+    clip nor the full warped image is held in memory.
+    
+    Args:
+        src: Open rasterio dataset to warp
+        dst_transform: Geotransform of the target grid
+        dst_crs: CRS of the target grid
+        shape: (rows, cols) of the target grid
+        indexes: Optional 1-based band indexes (default: all bands)
+        fill_value: Value for target pixels not covered by the source
+        warp_options: Optional reproject keyword arguments (resampling, num_threads, warp_mem_limit)
+        skip: Optional predicate on a block window; blocks it accepts are not warped
+    
+    Yields:
+        Tuples of (window into the target grid, warped block)
+    """
+    from rasterio.warp import reproject
+    
+    indexes = indexes or list(src.indexes)
+    rows, cols = shape
+    options = dict(DEFAULT_WARP_OPTIONS, **(warp_options or {}))
+    
+    for row in range(0, rows, WRITE_BLOCK_ROWS):
+        window = Window(0, row, cols, min(WRITE_BLOCK_ROWS, rows - row))
+        if skip is not None and skip(window):
+            continue
+        block = np.full((len(indexes), int(window.height), cols), fill_value, dtype=src.dtypes[0])
+        with locked_dataset(src) as dataset:
+            reproject(rasterio.band(dataset, indexes), block,
+                      dst_transform=window_transform(window, dst_transform), dst_crs=dst_crs,
+                      dst_nodata=dataset.nodata, init_dest_nodata=False, **options)
+        yield window, block
+
+
+def estimate_shift(image_a: np.ndarray, image_b: np.ndarray, method: str = "full",
+                   factor: Optional[int] = None, coarse_a: Optional[np.ndarray] = None,
+                   coarse_b: Optional[np.ndarray] = None,
+                   reference_spectrum: Optional[np.ndarray] = None, workers: int = 1,
+                   fft_options: Optional[dict] = None, mask_a: Optional[np.ndarray] = None,
+                   mask_b: Optional[np.ndarray] = None, bands: Optional[List[int]] = None) -> dict:
+    """
+    Estimate the integer shift registering Image B to Image A.
+    
+    Masked pixels (see band_mask) are excluded from the correlation, and the
+    full method only transforms the bounding box of Image A's valid pixels,
+    so nodata collars cost no FFT time. With several bands, the full method
+    registers them jointly (see phase_correlate_bands); the pyramid and tiled
+    methods register the first of them.
+    
+    Args:
+        image_a: Reference image array (only the first band is used unless bands is given)
+        image_b: Image to be aligned array on the same grid as image_a
+        method: Registration method, one of REGISTRATION_METHODS
+        factor: Pyramid decimation factor (default: chosen from the image size)
+        coarse_a: Optional overview level of image_a's first band at factor
+        coarse_b: Optional overview level of image_b's first band at factor
+        reference_spectrum: Optional fft_spectrum of image_a's first band, computed
+            with the same fft_options over the valid bounds of mask_a (full method)
+        workers: Number of processes registering tiles (tiled method)
+        fft_options: FFT backend, threads and padding (see DEFAULT_FFT_OPTIONS)
+        mask_a: Optional validity mask of image_a's first band
+        mask_b: Optional validity mask of image_b's first band
+        bands: Optional 1-based band numbers held by the rows of image_a and
+            image_b, all of which are registered (reported in the alignment info)
+    
+    Returns:
+        Alignment info with shift_x, shift_y and error (plus the shift grid
+        under 'tiles' for the tiled method, and the fused peak and per-band
+        contributions under 'joint' for joint registration)
+    """
+    # Calculate the shift using phase cross-correlation
+    # For multiband images, we typically use the first band for registration
+    reference_band = image_a[0] if len(image_a.shape) > 2 else image_a
+    target_band = image_b[0] if len(image_b.shape) > 2 else image_b
+    for label, mask in (("Image A", mask_a), ("Image B", mask_b)):
+        if mask is not None and not mask.any():
+            raise ValueError(f"{label} has no valid pixels in the AOI")
+    
+    if method == "pyramid" and factor is None:
+        factor = pyramid_factor(reference_band.shape)
+    
+    joint = bands is not None and len(bands) > 1
+    if joint and (method == "tiled" or (method == "pyramid" and factor > 1)):
+        print(f"{method.capitalize()} registration uses band {bands[0]} only")
+        joint = False
+    if joint:
+        reference_stack, target_stack = image_a[:len(bands)], image_b[:len(bands)]
+        if mask_a is not None:
+            rows, cols = valid_bounds(mask_a)
+            reference_stack, target_stack, mask_a = (reference_stack[:, rows, cols], target_stack[:, rows, cols],
+                                                     mask_a[rows, cols])
+            mask_b = mask_b[rows, cols] if mask_b is not None else None
+        shift, error, contributions = phase_correlate_bands(reference_stack, target_stack,
+                                                            reference_spectrum=reference_spectrum,
+                                                            fft_options=fft_options,
+                                                            reference_mask=mask_a, moving_mask=mask_b)
+        shift = np.round(shift).astype(int)
+        print(f"Calculated shift: {shift} (bands {', '.join(map(str, bands))} registered jointly)")
+        return {
+            "shift_x": int(shift[1]),
+            "shift_y": int(shift[0]),
+            "error": float(error),
+            "joint": {
+                "peak": round(float(sum(contribution['peak'] for contribution in contributions)), 6),
+                "bands": [dict(contribution, band=int(band)) for band, contribution in zip(bands, contributions)],
+            },
+        }
+    
+    # Calculate shift
+    if method == "tiled":
+        alignment_info = estimate_shift_tiled(reference_band, target_band, workers=workers,
+                                              fft_options=fft_options, reference_mask=mask_a, target_mask=mask_b)
+        print(f"Calculated shift: {[alignment_info['shift_y'], alignment_info['shift_x']]}")
+        return alignment_info
+    
+    if method == "pyramid" and factor > 1:
+        shift, error = estimate_shift_pyramid(reference_band, target_band, factor, coarse_a, coarse_b,
+                                              fft_options, mask_a, mask_b)
+    else:
+        if mask_a is not None:
+            # The shift is the same on any common crop; drop Image A's nodata collar
+            rows, cols = valid_bounds(mask_a)
+            reference_band, target_band, mask_a = reference_band[rows, cols], target_band[rows, cols], mask_a[rows, cols]
+            mask_b = mask_b[rows, cols] if mask_b is not None else None
+        # With a cached reference spectrum only the target is transformed here
+        shift, error = phase_correlate(reference_band, target_band, reference_spectrum=reference_spectrum,
+                                       fft_options=fft_options, upsample_factor=100,
+                                       reference_mask=mask_a, moving_mask=mask_b)
+    
+    # Round the shift to the nearest integer pixel
+    shift = np.round(shift).astype(int)
+    
+    print(f"Calculated shift: {shift}")
+    
+    return {
+        "shift_x": int(shift[1]),
+        "shift_y": int(shift[0]),
+        "error": float(error)
+    }
+
+
+def shift_windows(shape: Tuple[int, int], shift_y: int, shift_x: int) -> Optional[Tuple[Window, Window]]:
+    """
+    Compute the source and destination windows of an integer shift.
+    
+    Args:
+        shape: (rows, cols) of the image being shifted
+        shift_y: Row shift (positive moves content down)
+        shift_x: Column shift (positive moves content right)
+    
+    Returns:
+        Tuple of (source window, destination window), or None if the shift
+        moves the whole image out of frame
+    """
+    rows, cols = shape
+    height, width = rows - abs(shift_y), cols - abs(shift_x)
+    if height <= 0 or width <= 0:
+        return None
+    
+    source = Window(max(0, -shift_x), max(0, -shift_y), width, height)
+    destination = Window(max(0, shift_x), max(0, shift_y), width, height)
+    return source, destination
+
+
+def shifted_window(window: Window, shape: Tuple[int, int], shift_y: int, shift_x: int) -> Optional[Window]:
+    """
+    Destination of a block moved through an integer shift, as iter_shifted_blocks writes it.
+    
+    Args:
+        window: Block window in the unshifted image
+        shape: (rows, cols) of the image and of the output
+        shift_y: Row shift (positive moves content down)
+        shift_x: Column shift (positive moves content right)
+    
+    Returns:
+        Destination window of the part of the block that stays in frame, or
+        None when the shift moves the whole block out of frame
+    """
+    windows = shift_windows(shape, shift_y, shift_x)
+    if windows is None:
+        return None
+    try:
+        part = window.intersection(windows[0])
+    except WindowError:
+        return None
+    return Window(part.col_off + shift_x, part.row_off + shift_y, part.width, part.height)
+
+
+def iter_array_blocks(image: np.ndarray, block_rows: int = WRITE_BLOCK_ROWS) -> Iterator[Tuple[Window, np.ndarray]]:
+    """
+    Split an in-memory image into row blocks without copying.
+    
+    Args:
+        image: Image array of shape (bands, rows, cols)
+        block_rows: Rows per block
+    
+    Yields:
+        Tuples of (window, block view)
+    """
+    rows, cols = image.shape[-2:]
+    for row in range(0, rows, block_rows):
+        height = min(block_rows, rows - row)
+        yield Window(0, row, cols, height), image[:, row:row + height, :]
+
+
+def iter_shifted_blocks(blocks: Iterator[Tuple[Window, np.ndarray]], shape: Tuple[int, int],
+                        shift_y: int, shift_x: int, count: int, dtype,
+                        fill_value=0, masked: bool = False) -> Iterator[Tuple[Window, np.ndarray]]:
+    """
+    Move image blocks through an integer shift for writing.
+    
+    Each block is cropped to the part that stays in frame and re-targeted at its
+    shifted destination window; the uncovered border strips are emitted as
+    fill_value blocks. No full-size aligned array is ever allocated.
+    
+    Args:
+        blocks: Iterator of (window, block) pairs covering the unshifted image
+        shape: (rows, cols) of the image and of the output
+        shift_y: Row shift (positive moves content down)
+        shift_x: Column shift (positive moves content right)
+        count: Number of bands
+        dtype: Output dtype
+        fill_value: Value for pixels not covered after the shift (nodata)
+        masked: Yield masked arrays, with the border strips masked out, for
+            outputs that carry a mask instead of a nodata value
+    
+    Yields:
+        Tuples of (destination window, block array)
+    """
+    rows, cols = shape
+    windows = shift_windows(shape, shift_y, shift_x)
+    
+    if windows is not None:
+        source, _ = windows
+        for block_window, block in blocks:
+            try:
+                part = block_window.intersection(source)
+            except WindowError:
+                continue
+            
+            row = int(part.row_off - block_window.row_off)
+            col = int(part.col_off - block_window.col_off)
+            data = block[:, row:row + int(part.height), col:col + int(part.width)]
+            if masked and not isinstance(data, np.ma.MaskedArray):
+                data = np.ma.MaskedArray(data, mask=False)
+            yield Window(part.col_off + shift_x, part.row_off + shift_y, part.width, part.height), data
+    
+    # Border strips left uncovered by the shift
+    if windows is None:
+        strips = [Window(0, 0, cols, rows)]
+    else:
+        _, destination = windows
+        strips = []
+        if shift_y > 0:
+            strips.append(Window(0, 0, cols, shift_y))
+        elif shift_y < 0:
+            strips.append(Window(0, rows + shift_y, cols, -shift_y))
+        if shift_x > 0:
+            strips.append(Window(0, destination.row_off, shift_x, destination.height))
+        elif shift_x < 0:
+            strips.append(Window(cols + shift_x, destination.row_off, -shift_x, destination.height))
+    
+    for strip in strips:
+        for row in range(0, int(strip.height), WRITE_BLOCK_ROWS):
+            height = min(WRITE_BLOCK_ROWS, int(strip.height) - row)
+            fill = np.full((count, height, int(strip.width)), fill_value, dtype=dtype)
+            yield (Window(strip.col_off, strip.row_off + row, strip.width, height),
+                   np.ma.MaskedArray(fill, mask=True) if masked else fill)
+
+
+def align_images(image_a: np.ndarray, image_b: np.ndarray, method: str = "full",
+                 factor: Optional[int] = None, coarse_a: Optional[np.ndarray] = None,
+                 coarse_b: Optional[np.ndarray] = None,
+                 reference_spectrum: Optional[np.ndarray] = None,
+                 fill_value=0, warp_options: Optional[dict] = None,
+                 fft_options: Optional[dict] = None,
+                 registration_bands: Optional[List[int]] = None) -> Tuple[np.ndarray, dict]:
+    """
+    Align Image B to Image A using phase cross-correlation.
+    
+    In-memory variant: returns the aligned array. Jobs use estimate_shift and
+    iter_shifted_blocks to write the aligned product without materialising it.
+    
+    Args:
+        image_a: Reference image array
+        image_b: Image to be aligned array
+        method: Registration method, one of REGISTRATION_METHODS
+        factor: Pyramid decimation factor (default: chosen from the image size)
+        coarse_a: Optional overview level of image_a's first band at factor
+        coarse_b: Optional overview level of image_b's first band at factor
+        reference_spectrum: Optional cached 2-D FFT of image_a's first band (full method)
+        fill_value: Value for pixels not covered after the shift
+        warp_options: Optional reproject keyword arguments used when resizing image_b
+        fft_options: FFT backend, threads and padding (see DEFAULT_FFT_OPTIONS)
+        registration_bands: Optional 1-based bands of both images registered
+            jointly (default: the first band)
+    
+    Returns:
+        Tuple of (aligned image, alignment info)
+    """
+    # Ensure both images have the same dimensions (image_a may carry only the registration band)
+    if image_a.shape[-2:] != image_b.shape[-2:]:
+        # Resize image_b to match image_a
+        image_b = resample_to_shape(image_b, image_a.shape[-2:], warp_options)
+        # Overviews of the original B no longer match the resized grid
+        coarse_b = None
+    
+    reference, target, bands = image_a, image_b, None
+    if registration_bands and image_a.ndim > 2:
+        rows = [band - 1 for band in registration_bands]
+        reference, target, bands = image_a[rows], image_b[rows], registration_bands
+    alignment_info = estimate_shift(reference, target, method, factor, coarse_a, coarse_b, reference_spectrum,
+                                    fft_options=fft_options, bands=bands)
+    
+    # Apply the shift to all bands at once through the shifted windows
+    aligned_image = np.full_like(image_b, fill_value)
+    windows = shift_windows(image_b.shape[-2:], alignment_info["shift_y"], alignment_info["shift_x"])
+    if windows is not None:
+        source, destination = windows
+        aligned_image[..., destination.toslices()[0], destination.toslices()[1]] = \
+            image_b[..., source.toslices()[0], source.toslices()[1]]
+    
+    return aligned_image, alignment_info
+
+
+def cog_creation_options(compress: str = "deflate", num_threads: Union[int, str] = "ALL_CPUS",
+                         blocksize: int = COG_BLOCKSIZE) -> dict:
+    """
+    Build GDAL COG driver creation options.
+    
+    Args:
+        compress: Compression codec, one of COMPRESSION_METHODS
+        num_threads: Threads used for compression and overview generation
+        blocksize: Internal tile size
+    
+    Returns:
+        Creation options for write_cog / save_geotiff(cog_options=...)
+    """
+    options = {
+        'COMPRESS': compress.upper(),
+        'NUM_THREADS': str(num_threads),
+        'BLOCKSIZE': blocksize,
+        'OVERVIEWS': 'AUTO',
+        'RESAMPLING': 'AVERAGE',
+        'BIGTIFF': 'IF_SAFER',
+        # Tiles that are entirely nodata (or zero) are left out and read back unchanged
+        'SPARSE_OK': 'TRUE',
+    }
+    if compress.lower() != "none":
+        # Horizontal differencing (integer) or floating point predictor, chosen by GDAL
+        options['PREDICTOR'] = 'YES'
+    return options
+
+
+def write_cog(source_path: str, output_path: str, cog_options: dict):
+    """
+    Copy a raster into a Cloud-Optimized GeoTIFF.
+    
+    The COG driver tiles, compresses and builds the overviews in a single
+    copy pass over the source.
+    
+    Args:
+        source_path: Path to the source raster
+        output_path: Path for the COG
+        cog_options: Creation options from cog_creation_options
+    """
+    import rasterio.shutil
+    
+    rasterio.shutil.copy(source_path, output_path, driver='COG', **cog_options)
+
+
+def staging_path(output_path: str) -> str:
+    """Path of the uncompressed file a COG output is staged in before its COG copy."""
+    return f"{output_path}.staging.tif"
+
+
+def window_key(window: Window) -> Tuple[int, int, int, int]:
+    """Block window as the (col_off, row_off, width, height) tuple recorded in checkpoints."""
+    return int(window.col_off), int(window.row_off), int(window.width), int(window.height)
+
+
+class JobCheckpoint:
+    """
+    Manifest of the work a job has finished, kept in its output directory.
+    
+    Entries are keyed by output file name and record the alignment computed
+    for a target, the blocks already written to a file and whether a file is
+    complete. Every update re-reads the manifest and replaces it atomically
+    under a lock file, so the threads of a multi-AOI job and the processes of
+    a batch share one manifest and a job killed at any point leaves a
+    consistent one behind. Instances hold only paths and can be passed to
+    pool processes.
+    """
+    
+    def __init__(self, out_dir: str, job: dict):
+        self.out_dir = out_dir
+        self.job = job
+        self.path = os.path.join(out_dir, CHECKPOINT_FILE)
+    
+    @classmethod
+    def open(cls, out_dir: str, job: dict, resume: bool = False) -> "JobCheckpoint":
+        """
+        Continue the checkpoint of an interrupted job, or start a new one.
+        
+        Args:
+            out_dir: Job output directory
+            job: Signature of the job (see job_signature); a manifest written by
+                a job with another signature is never resumed
+            resume: Keep the existing manifest instead of starting over
+        
+        Returns:
+            Checkpoint of the job
+        """
+        checkpoint = cls(out_dir, job)
+        state = checkpoint.read()
+        if resume and state.get('version') == CHECKPOINT_VERSION and state.get('job') == job:
+            complete = sum(1 for entry in state['files'].values() if entry.get('complete'))
+            print(f"Resuming from {checkpoint.path} ({complete} files complete)")
+            return checkpoint
+        
+        if resume:
+            print(f"No checkpoint of this job in {out_dir}, starting over")
+        with checkpoint.locked():
+            checkpoint.write({'version': CHECKPOINT_VERSION, 'job': job, 'files': {}})
+        return checkpoint
+    
+    @contextmanager
+    def locked(self):
+        """Serialize read-modify-write cycles of the manifest across threads and processes."""
+        import fcntl
+        
+        with open(os.path.join(self.out_dir, CHECKPOINT_LOCK_FILE), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+    
+    def read(self) -> dict:
+        """Current manifest, or an empty dict when there is none."""
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+    
+    def write(self, state: dict):
+        """Replace the manifest atomically; callers hold the lock."""
+        staging = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(staging, 'w') as f:
+            json.dump(state, f)
+        os.replace(staging, self.path)
+    
+    def entry(self, path: str) -> dict:
+        """Recorded state of one output file (empty when nothing is recorded)."""
+        return self.read().get('files', {}).get(os.path.basename(path), {})
+    
+    def update(self, path: str, blocks: List[Tuple[int, int, int, int]] = (), **fields):
+        """
+        Record written blocks and other fields for one output file.
+        
+        Args:
+            path: Output file
+            blocks: Window keys (see window_key) of blocks now on disk
+            **fields: Entry fields to set, e.g. alignment or complete
+        """
+        with self.locked():
+            state = self.read()
+            entry = state.setdefault('files', {}).setdefault(os.path.basename(path), {})
+            if blocks:
+                entry['blocks'] = entry.get('blocks', []) + [list(key) for key in blocks]
+            entry.update(fields)
+            self.write(state)
+    
+    def discard(self, path: str):
+        """Forget one output file, e.g. a staging file that has been removed."""
+        with self.locked():
+            state = self.read()
+            state.get('files', {}).pop(os.path.basename(path), None)
+            self.write(state)
+    
+    def complete(self, path: str) -> bool:
+        """Whether an output file was finished and is still there."""
+        return bool(self.entry(path).get('complete')) and os.path.exists(path)
+    
+    def written_blocks(self, path: str) -> set:
+        """Window keys of the blocks recorded for an output file, if it is still there."""
+        if not os.path.exists(path):
+            return set()
+        return {tuple(key) for key in self.entry(path).get('blocks', ())}
+    
+    def written_filter(self, output_path: str) -> Optional[Callable[[Window], bool]]:
+        """
+        Predicate telling whether a block of an output was already written.
+        
+        Covers the blocks of the output itself and of its COG staging file.
+        
+        Returns:
+            Predicate on block windows, or None when no block was written yet
+        """
+        written = self.written_blocks(output_path) | self.written_blocks(staging_path(output_path))
+        if not written:
+            return None
+        return lambda window: window_key(window) in written
+
+
+def write_blocks(blocks: Iterator[Tuple[Window, np.ndarray]], output_path: str, profile: dict,
+                 checkpoint: Optional[JobCheckpoint] = None):
+    """
+    Write streamed blocks to a raster, recording them in the job checkpoint.
+    
+    With a checkpoint, the dataset is closed every CHECKPOINT_BYTES of block
+    data, which flushes GDAL's cached blocks to disk, before those blocks are
+    recorded. A resumed write reopens the file in update mode and skips the
+    recorded blocks.
+    
+    Args:
+        blocks: Iterator of (window, block) pairs; masked blocks also write the
+            output's mask band
+        output_path: Path for the output file
+        profile: Creation profile of the output
+        checkpoint: Optional job checkpoint
+    """
+    written = checkpoint.written_blocks(output_path) if checkpoint is not None else set()
+    dst = rasterio.open(output_path, 'r+') if written else rasterio.open(output_path, 'w', **profile)
+    pending, pending_bytes = [], 0
+    try:
+        for block_window, block in blocks:
+            key = window_key(block_window)
+            if key in written:
+                continue
+            if isinstance(block, np.ma.MaskedArray):
+                dst.write_mask(~np.ma.getmaskarray(block).all(axis=0), window=block_window)
+                block = block.data
+            dst.write(block, window=block_window)
+            
+            if checkpoint is not None:
+                pending.append(key)
+                pending_bytes += block.nbytes
+                if pending_bytes >= CHECKPOINT_BYTES:
+                    dst.close()
+                    checkpoint.update(output_path, pending)
+                    pending, pending_bytes = [], 0
+                    dst = rasterio.open(output_path, 'r+')
+    finally:
+        dst.close()
+    
+    if checkpoint is not None:
+        checkpoint.update(output_path, pending, complete=True)
+
+
+def save_geotiff(image_array: Union[np.ndarray, Iterator[Tuple[Window, np.ndarray]]], output_path: str,
+                 reference_path: str = None, window: Optional[Window] = None, transform=None, crs=None,
+                 cog_options: Optional[dict] = None, creation_options: Optional[dict] = None,
+                 checkpoint: Optional[JobCheckpoint] = None, pipeline_depth: int = 0):
+    """
+    Save an image array as a GeoTIFF file.
+    
+    Args:
+        image_array: Image array to save, or an iterator of (window, block) pairs
+            as produced by iter_clip_blocks; masked blocks also write the output's
+            mask band, and then windows that are never written stay masked
+        output_path: Path for the output file
+        reference_path: Optional path to reference GeoTIFF for metadata
+        window: Clip window into the reference image; sets the output size and
+            geotransform (required when streaming blocks)
+        transform: Optional geotransform overriding the one derived from window
+        crs: Optional CRS overriding the reference's
+        cog_options: Write a Cloud-Optimized GeoTIFF with these creation options
+            (see cog_creation_options) instead of copying the reference layout
+        creation_options: Optional profile entries overriding the reference's
+        checkpoint: Optional job checkpoint recording the streamed blocks as they
+            are written and the output once it is complete; a staging file with
+            recorded blocks is kept when the write fails, for a resumed job
+        pipeline_depth: Produce streamed blocks in a background thread up to this
+            many blocks ahead of the writer (see read_ahead); 0 reads and writes
+            them in turn
+    """
+    if cog_options is not None:
+        # Stage uncompressed tiles on disk, then compress and build overviews in one COG pass
+        staging = staging_path(output_path)
+        try:
+            if checkpoint is None or not checkpoint.complete(staging):
+                save_geotiff(image_array, staging, reference_path, window, transform, crs,
+                             creation_options=STAGING_CREATION_OPTIONS, checkpoint=checkpoint,
+                             pipeline_depth=pipeline_depth)
+            write_cog(staging, output_path, cog_options)
+            if checkpoint is not None:
+                checkpoint.update(output_path, complete=True)
+                checkpoint.discard(staging)
+        finally:
+            # After a failure, staged blocks already recorded are kept for a resumed job
+            if os.path.exists(staging) and (checkpoint is None or checkpoint.complete(output_path)
+                                            or not checkpoint.entry(staging)):
+                os.remove(staging)
+        return
+    
+    if not isinstance(image_array, np.ndarray):
+        # Streamed blocks go straight to disk without assembling the full array
+        with rasterio.open(reference_path) as ref_src:
+            profile = ref_src.profile.copy()
+            profile.update({
+                'height': window.height,
+                'width': window.width,
+                'transform': transform if transform is not None else ref_src.window_transform(window),
+            })
+            if crs is not None:
+                profile['crs'] = crs
+            profile.update(creation_options or {})
+        
+        with read_ahead(image_array, pipeline_depth) as blocks:
+            write_blocks(blocks, output_path, profile, checkpoint)
+        return
+    
+    if reference_path and os.path.exists(reference_path):
+        # Copy metadata from reference file
+        with rasterio.open(reference_path) as ref_src:
+            profile = ref_src.profile.copy()
+            profile.update({
+                'height': image_array.shape[1],
+                'width': image_array.shape[2] if len(image_array.shape) > 2 else image_array.shape[1],
+                'count': image_array.shape[0] if len(image_array.shape) > 2 else 1,
+            })
+            if crs is not None:
+                profile['crs'] = crs
+            if transform is not None:
+                profile['transform'] = transform
+            elif window is not None:
+                profile['transform'] = ref_src.window_transform(window)
+            profile.update(creation_options or {})
+            
+            with rasterio.open(output_path, 'w', **profile) as dst:
+                if len(image_array.shape) == 2:
+                    # Single band image
+                    dst.write(image_array, 1)
+                else:
+                    # Multi-band image
+                    for band_idx in range(image_array.shape[0]):
+                        dst.write(image_array[band_idx], band_idx + 1)
+    else:
+        # Create a basic GeoTIFF with dummy metadata
+        # This is a fallback - in practice, you'll want to preserve proper geospatial metadata
+        height, width = image_array.shape[1:] if len(image_array.shape) > 2 else image_array.shape
+        count = image_array.shape[0] if len(image_array.shape) > 2 else 1
+        
+        profile = {
+            'driver': 'GTiff',
+            'dtype': image_array.dtype,
+            'nodata': None,
+            'width': width,
+            'height': height,
+            'count': count,
+            'crs': 'EPSG:4326',  # WGS84
+            'transform': rasterio.transform.from_bounds(0, 0, 1, 1, width, height)
+        }
+        profile.update(creation_options or {})
+        
+        with rasterio.open(output_path, 'w', **profile) as dst:
+            if len(image_array.shape) == 2:
+                # Single band image
+                dst.write(image_array, 1)
+            else:
+                # Multi-band image
+                for band_idx in range(image_array.shape[0]):
+                    dst.write(image_array[band_idx], band_idx + 1)
+    
+    if checkpoint is not None:
+        checkpoint.update(output_path, complete=True)
+
+
+class SharedDataset:
+    """
+    A dataset handle shared by the threads of a multi-AOI job.
+    
+    GDAL handles must not be used from several threads at once, so every
+    attribute access and method call holds the handle's lock. Reading all
+    AOIs through one handle lets GDAL's block cache serve the blocks they
+    have in common.
+    """
+    
+    def __init__(self, path: str):
+        self.dataset = rasterio.open(path)
+        self.lock = threading.RLock()
+    
+    def __getattr__(self, name: str):
+        with self.lock:
+            value = getattr(self.dataset, name)
+        if not callable(value):
+            return value
+        
+        def locked(*args, **kwargs):
+            with self.lock:
+                return value(*args, **kwargs)
+        return locked
+    
+    def close(self):
+        self.dataset.close()
+
+
+# Datasets opened once for the running multi-AOI job, by path (see shared_datasets)
+_shared_datasets = {}
+
+
+@contextmanager
+def shared_datasets(paths: List[str]):
+    """
+    Open each dataset once and route open_raster calls for it to the shared handle.
+    
+    Args:
+        paths: Paths to the job's input datasets
+    """
+    for path in paths:
+        if path not in _shared_datasets:
+            _shared_datasets[path] = SharedDataset(path)
+    try:
+        yield
+    finally:
+        for path in list(_shared_datasets):
+            _shared_datasets.pop(path).close()
+
+
+@contextmanager
+def open_raster(path: str):
+    """Open a dataset for reading, or reuse the running job's shared handle to it."""
+    shared = _shared_datasets.get(path)
+    if shared is not None:
+        yield shared
+        return
+    with rasterio.open(path) as src:
+        yield src
+
+
+@contextmanager
+def locked_dataset(src):
+    """Yield the rasterio dataset behind src, holding its lock while it is in use if it is shared."""
+    if isinstance(src, SharedDataset):
+        with src.lock:
+            yield src.dataset
+    else:
+        yield src
+
+
+# Reference state attached in each batch pool process (see share_array)
+_shared_reference = {}
+
+
+def share_array(array: np.ndarray) -> Tuple[Optional["SharedMemory"], dict]:
+    """
+    Copy an array into a new shared memory block.
+    
+    Memory-mapped scratch arrays are shared through their file instead, so
+    they never have to fit in memory.
+    
+    Args:
+        array: Array to share
+    
+    Returns:
+        Tuple of (shared memory block owned by the caller, or None for
+        memory-mapped arrays, picklable spec for attach_shared_array)
+    """
+    if isinstance(array, np.memmap) and array.filename:
+        array.flush()
+        return None, {'path': array.filename, 'offset': array.offset, 'shape': array.shape,
+                      'dtype': array.dtype.str}
+    
+    from multiprocessing.shared_memory import SharedMemory
+    
+    shm = SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+    return shm, {'name': shm.name, 'shape': array.shape, 'dtype': array.dtype.str}
+
+
+def attach_shared_array(spec: dict) -> Tuple[Optional["SharedMemory"], np.ndarray]:
+    """
+    Map an array shared with share_array without copying it.
+    
+    Args:
+        spec: Spec returned by share_array
+    
+    Returns:
+        Tuple of (shared memory handle to keep alive, or None for
+        memory-mapped arrays, array view)
+    """
+    if 'path' in spec:
+        return None, np.memmap(spec['path'], dtype=np.dtype(spec['dtype']), mode='r',
+                               offset=spec['offset'], shape=tuple(spec['shape']))
+    
+    from multiprocessing.shared_memory import SharedMemory
+    
+    shm = SharedMemory(name=spec['name'])
+    return shm, np.ndarray(spec['shape'], dtype=np.dtype(spec['dtype']), buffer=shm.buf)
+
+
+def release_shared(shared: dict):
+    """Close and unlink the shared memory blocks created by share_array."""
+    for shm, _ in shared.values():
+        if shm is not None:
+            shm.close()
+            shm.unlink()
+
+
+def scratch_array(scratch_dir: str, shape: Tuple[int, ...], dtype) -> np.memmap:
+    """
+    Allocate an array backed by a new scratch file instead of the heap.
+    
+    Args:
+        scratch_dir: Directory for scratch files, removed when the job ends
+        shape: Array shape
+        dtype: Array data type
+    
+    Returns:
+        Writable memory-mapped array
+    """
+    os.makedirs(scratch_dir, exist_ok=True)
+    fd, path = tempfile.mkstemp(suffix='.dat', dir=scratch_dir)
+    os.close(fd)
+    return np.memmap(path, dtype=dtype, mode='w+', shape=shape)
+
+
+def assemble_blocks(blocks: Iterator[Tuple[Window, np.ndarray]], shape: Tuple[int, int, int], dtype,
+                    scratch_dir: Optional[str] = None, fill_value=0) -> np.ndarray:
+    """
+    Collect streamed blocks into one array.
+    
+    Args:
+        blocks: Iterator of (window, block) pairs covering the array, except
+            for empty blocks skipped by iter_clip_blocks
+        shape: (bands, rows, cols) of the result
+        dtype: Data type of the result
+        scratch_dir: Write into a memory-mapped scratch file in this directory
+            instead of allocating the array in memory
+        fill_value: Value of the pixels no block covers (nodata)
+    
+    Returns:
+        Assembled array (a numpy.memmap when scratch_dir is given)
+    """
+    if scratch_dir:
+        # Scratch files start out zeroed
+        array = scratch_array(scratch_dir, shape, dtype)
+        if fill_value:
+            array[...] = fill_value
+    else:
+        array = np.full(shape, fill_value, dtype=dtype)
+    for window, block in blocks:
+        rows, cols = window.toslices()
+        array[:, rows, cols] = block
+    return array
+
+
+@contextmanager
+def read_ahead(blocks: Iterator[Tuple[Window, np.ndarray]], depth: int = PIPELINE_QUEUE_BLOCKS):
+    """
+    Pull streamed blocks in a background thread, up to depth blocks ahead of the consumer.
+    
+    GDAL releases the GIL while it reads, decodes and warps, so the next blocks
+    are produced while the consumer writes the current one. The producer is
+    stopped and joined when the context exits, before the caller closes the
+    dataset it reads from.
+    
+    Args:
+        blocks: Iterator of (window, block) pairs, advanced only by the background thread
+        depth: Maximum number of blocks buffered; 0 yields blocks unchanged, without a thread
+    
+    Yields:
+        Iterator over the same (window, block) pairs in the same order; an
+        exception raised by the producer is raised from it
+    """
+    if depth <= 0:
+        yield blocks
+        return
+    
+    import queue
+    
+    buffer = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    errors = []
+    done = object()
+    
+    def put(item) -> bool:
+        # Give up once the consumer has left, instead of blocking on a full queue
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+    
+    def produce():
+        try:
+            for item in blocks:
+                if not put(item):
+                    break
+        except BaseException as error:
+            errors.append(error)
+        finally:
+            if hasattr(blocks, 'close'):
+                blocks.close()
+            put(done)
+    
+    def consume() -> Iterator[Tuple[Window, np.ndarray]]:
+        while True:
+            item = buffer.get()
+            if item is done:
+                if errors:
+                    raise errors[0]
+                return
+            yield item
+    
+    producer = threading.Thread(target=produce, name="read-ahead", daemon=True)
+    producer.start()
+    try:
+        yield consume()
+    finally:
+        stop.set()
+        producer.join()
+
+
+def registration_footprint(shape: Tuple[int, int], itemsize: int, method: str,
+                           fft_options: Optional[dict] = None, bands: int = 1) -> int:
+    """
+    Estimate the memory needed to hold and register the registration bands.
+    
+    Args:
+        shape: (rows, cols) of the clip
+        itemsize: Bytes per pixel of the registration band in its source dtype
+        method: Registration method, one of REGISTRATION_METHODS
+        fft_options: FFT backend and precision of the correlation (see DEFAULT_FFT_OPTIONS)
+        bands: Number of bands registered jointly (full method)
+    
+    Returns:
+        Estimated bytes for the reference and target bands plus, for the full
+        method, the FFT work arrays
+    """
+    options = dict(DEFAULT_FFT_OPTIONS, **(fft_options or {}))
+    pixels = shape[0] * shape[1]
+    if method != "full":
+        return 2 * pixels * itemsize
+    # A joint correlation holds every band's stack and spectra
+    work_bands = FULL_CORRELATION_WORK_BANDS[options['backend'] if bands == 1 else joint_fft_backend(options)]
+    return bands * (2 * pixels * itemsize + pixels * work_bands * np.dtype(options['precision']).itemsize)
+
+
+def _attach_reference(specs: dict, values: dict):
+    """Pool initializer: map the shared reference arrays into this process."""
+    # Only the job's own process writes to the event channel
+    set_event_sink(None)
+    _shared_reference.update(values)
+    for key, spec in specs.items():
+        shm, array = attach_shared_array(spec)
+        _shared_reference[key] = array
+        _shared_reference.setdefault('_handles', []).append(shm)
+
+
+# Receives the instrumentation events of the running job (see set_event_sink)
+_event_sink: Optional[Callable[[dict], None]] = None
+
+
+# Serialises events sent from the threads of a multi-AOI job
+_event_lock = threading.Lock()
+
+# Fields added to every event of the current thread (see event_fields)
+_event_context = threading.local()
+
+
+def set_event_sink(sink: Optional[Callable[[dict], None]]):
+    """Route instrumentation events of the current job to sink (None disables them)."""
+    global _event_sink
+    _event_sink = sink
+
+
+@contextmanager
+def event_fields(**fields):
+    """Tag the events this thread emits with fields, e.g. the AOI it works on."""
+    _event_context.fields = fields
+    try:
+        yield
+    finally:
+        del _event_context.fields
+
+
+def emit_event(event: dict):
+    """Send one instrumentation event to the current sink, if any."""
+    if _event_sink is not None:
+        event = dict(event, **getattr(_event_context, 'fields', {}), timestamp=round(time.time(), 3))
+        with _event_lock:
+            _event_sink(event)
+
+
+def reset_peak_rss() -> bool:
+    """Reset this process's peak RSS counter where the kernel allows it (Linux)."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def resource_usage() -> dict:
     """
-    Clip an image to the specified AOI (Area of Interest).
+    Sample the resource counters of this process.
+    
+    Returns:
+        Dictionary with wall seconds, cpu seconds, peak_rss_mb, and bytes_read
+        and bytes_written through system calls; CPU time and I/O include reaped
+        child processes such as batch and tile pools. Unavailable counters are None
+    """
+    times = os.times()
+    usage = {
+        'wall': time.perf_counter(),
+        'cpu': times.user + times.system + times.children_user + times.children_system,
+        'peak_rss_mb': None,
+        'bytes_read': None,
+        'bytes_written': None,
+    }
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    usage['peak_rss_mb'] = int(line.split()[1]) / 1024
+        with open('/proc/self/io') as f:
+            counters = dict(line.split(':') for line in f if ':' in line)
+        usage['bytes_read'] = int(counters['rchar'])
+        usage['bytes_written'] = int(counters['wchar'])
+    except (OSError, KeyError, ValueError):
+        pass
+    return usage
+
+
+@contextmanager
+def job_stage(name: str, progress: Optional[float] = None):
+    """
+    Emit start and end events with resource deltas around one job stage.
     
     Args:
-        image_path: Path to the input GeoTIFF
-        aoi: Area of Interest as {north: lat, south: lat, east: lng, west: lng}
+        name: Stage name
+        progress: Optional job fraction done when the stage starts
+    """
+    if _event_sink is None:
+        yield
+        return
     
-    Returns:
-        Clipped image array
+    # Concurrent AOI threads share the process counters; the peak can then
+    # only be reported since process start
+    exact_peak = reset_peak_rss() if not hasattr(_event_context, 'fields') else False
+    before = resource_usage()
+    event = {"event": "stage", "stage": name, "phase": "start"}
+    if progress is not None:
+        event["progress"] = progress
+    emit_event(event)
+    try:
+        yield
+    finally:
+        after = resource_usage()
+        delta = lambda key: after[key] - before[key] if after[key] is not None and before[key] is not None else None
+        emit_event({
+            "event": "stage",
+            "stage": name,
+            "phase": "end",
+            "wall_s": round(after['wall'] - before['wall'], 4),
+            "cpu_s": round(after['cpu'] - before['cpu'], 4),
+            # Peak since the stage started, or since process start where it cannot be reset
+            "peak_rss_mb": round(after['peak_rss_mb'], 1) if after['peak_rss_mb'] is not None else None,
+            "peak_rss_exact": exact_peak,
+            "bytes_read": delta('bytes_read'),
+            "bytes_written": delta('bytes_written'),
+        })
+
+
+@contextmanager
+def job_profiling(out_dir: str, profile: bool = False, trace_memory: bool = False):
     """
-    with rasterio.open(image_path) as src:
-        # Convert AOI bounds to image coordinates
-        min_lon, min_lat = aoi['west'], aoi['south']
-        max_lon, max_lat = aoi['east'], aoi['north']
-        
-        # Get the window that covers the AOI
-        window = src.window_from_bounds(min_lon, min_lat, max_lon, max_lat)
-        
-        # Read the clipped image based on the window
-        clipped_image = src.read(window=window)
-        
-        return clipped_image
+    Optionally profile a job with cProfile and tracemalloc.
+    
+    Writes profile.pstats (CPU profile) and tracemalloc.txt (largest
+    allocation sites and peak traced memory) to out_dir.
+    
+    Args:
+        out_dir: Job output directory
+        profile: Record a cProfile profile
+        trace_memory: Trace Python allocations with tracemalloc
+    """
+    profiler = None
+    if profile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    if trace_memory:
+        import tracemalloc
+        tracemalloc.start(25)
+    
+    try:
+        yield
+    finally:
+        os.makedirs(out_dir, exist_ok=True)
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(os.path.join(out_dir, "profile.pstats"))
+        if trace_memory:
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            with open(os.path.join(out_dir, "tracemalloc.txt"), 'w') as f:
+                f.write(f"Peak traced memory: {peak / 1024 / 1024:.1f} MB\n")
+                for statistic in snapshot.statistics('lineno')[:30]:
+                    f.write(f"{statistic}\n")
 
 
-def align_images(image_a: np.ndarray, image_b: np.ndarray) -> Tuple[np.ndarray, dict]:
+@contextmanager
+def job_pipeline(enabled: bool, threads: int = 2):
     """
-    Align Image B to Image A using phase cross-correlation.
+    Run job steps in background threads when the job is pipelined, or right away.
+    
+    Background steps carry the calling thread's event fields, so their stage
+    events are tagged like the thread's own (and report their peak memory as
+    shared with the steps running next to them).
     
     Args:
-        image_a: Reference image array
-        image_b: Image to be aligned array
+        enabled: Run steps in background threads (see --pipeline)
+        threads: Number of steps running at the same time
     
-    Returns:
-        Tuple of (aligned image, alignment info)
+    Yields:
+        submit(step) returning a Future of the step's result; the context waits
+        for background steps on exit
     """
-    # Ensure both images have the same dimensions
-    if image_a.shape != image_b.shape:
-        # Resize image_b to match image_a
-        from skimage.transform import resize
-        image_b = resize(image_b, image_a.shape, anti_aliasing=True, preserve_range=True).astype(image_a.dtype)
+    from concurrent.futures import Future, ThreadPoolExecutor
     
-    # Calculate the shift using phase cross-correlation
-    # For multiband images, we typically use the first band for registration
-    reference_band = image_a[0] if len(image_a.shape) > 2 else image_a
-    target_band = image_b[0] if len(image_b.shape) > 2 else image_b
+    if not enabled:
+        def run(step: Callable):
+            # Failures surface immediately, as without a pipeline
+            future = Future()
+            future.set_result(step())
+            return future
+        yield run
+        return
     
-    # Calculate shift
-    shift, error, diffphase = phase_cross_correlation(reference_band, target_band, upsample_factor=100)
+    fields = getattr(_event_context, 'fields', {})
     
-    # Round the shift to the nearest integer pixel
-    shift = np.round(shift).astype(int)
+    def run_step(step: Callable):
+        with event_fields(**fields):
+            return step()
     
-    print(f"Calculated shift: {shift}")
+    with ThreadPoolExecutor(max_workers=threads, thread_name_prefix="pipeline") as executor:
+        yield lambda step: executor.submit(run_step, step)
+
+
+def write_clip(image_path: str, window: Window, output_path: str, output_options: Optional[dict] = None,
+               checkpoint: Optional[JobCheckpoint] = None):
+    """
+    Write one clip window of a dataset to an output file, block by block.
     
-    # Apply the shift to image_b
-    aligned_image = np.zeros_like(image_b)
-    
-    # Determine the valid region after applying the shift
-    if shift[0] >= 0 and shift[1] >= 0:
-        # Positive shifts: shift target down/right, so source stays in place
-        src_y_slice = slice(None, -shift[0] if shift[0] != 0 else None)
-        src_x_slice = slice(None, -shift[1] if shift[1] != 0 else None)
-        dst_y_slice = slice(shift[0], None)
-        dst_x_slice = slice(shift[1], None)
-    elif shift[0] < 0 and shift[1] < 0:
-        # Negative shifts: shift target up/left
-        src_y_slice = slice(-shift[0], None)
-        src_x_slice = slice(-shift[1], None)
-        dst_y_slice = slice(None, shift[0] if shift[0] != 0 else None)
-        dst_x_slice = slice(None, shift[1] if shift[1] != 0 else None)
-    elif shift[0] >= 0 and shift[1] < 0:
-        # Positive y shift, negative x shift
-        src_y_slice = slice(None, -shift[0] if shift[0] != 0 else None)
-        src_x_slice = slice(-shift[1], None)
-        dst_y_slice = slice(shift[0], None)
-        dst_x_slice = slice(None, shift[1] if shift[1] != 0 else None)
-    else:  # shift[0] < 0 and shift[1] >= 0
-        # Negative y shift, positive x shift
-        src_y_slice = slice(-shift[0], None)
-        src_x_slice = slice(None, -shift[1] if shift[1] != 0 else None)
-        dst_y_slice = slice(None, shift[0] if shift[0] != 0 else None)
-        dst_x_slice = slice(shift[1], None)
-    
-    # Apply the alignment for each band
-    for band_idx in range(image_b.shape[0]):
-        aligned_image[band_idx][dst_y_slice, dst_x_slice] = image_b[band_idx][src_y_slice, src_x_slice]
-    
-    alignment_info = {
-        "shift_x": int(shift[1]),
-        "shift_y": int(shift[0]),
-        "error": float(error)
-    }
+    Args:
+        image_path: Path to the dataset
+        window: Clip window into the dataset (see aoi_window)
+        output_path: Path for the clipped GeoTIFF
+        output_options: Optional extra keyword arguments for save_geotiff
+        checkpoint: Optional job checkpoint; a complete output is kept and
+            recorded blocks are not written again
+    """
+    output_options = output_options or {}
+    with open_raster(image_path) as src:
+        # Tile-aligned GeoTIFF clips of tiled inputs skip the decode/encode round trip
+        if checkpoint is not None and checkpoint.complete(output_path):
+            print(f"{output_path} is complete in the checkpoint, skipping")
+        elif 'cog_options' not in output_options and copy_raw_tiles(src, window, output_path):
+            print(f"Copied the tiles of {image_path} without decoding")
+            if checkpoint is not None:
+                checkpoint.update(output_path, complete=True)
+        else:
+            # Mask bands (and alpha) are carried over to the clip; nodata comes with the profile
+            skip = checkpoint.written_filter(output_path) if checkpoint is not None else None
+            save_geotiff(iter_clip_blocks(src, window, masked=has_dataset_mask(src), skip=skip),
+                         output_path, image_path, window=window, checkpoint=checkpoint, **output_options)
+
+
+def read_reference(image_path: str, window: Window, reference: dict, method: str, fft_options: dict,
+                   cache_spectrum: bool = False, scratch_dir: Optional[str] = None) -> dict:
+    """
+    Read the registration bands of the reference image and derive what every target reuses.
     
-    return aligned_image, alignment_info
+    Args:
+        image_path: Path to Image A
+        window: Clip window into Image A
+        reference: Reference state holding shape, bands and, for the pyramid
+            method, factor (see align_target)
+        method: Registration method, one of REGISTRATION_METHODS
+        fft_options: FFT backend and precision of the correlation (see DEFAULT_FFT_OPTIONS)
+        cache_spectrum: Compute the reference spectrum once for a batch of targets
+        scratch_dir: Hold the bands in a memory-mapped scratch file in this directory
+    
+    Returns:
+        Reference entries band and mask and, where they apply, coarse and spectrum
+    """
+    bands, shape = reference['bands'], reference['shape']
+    with open_raster(image_path) as src:
+        if scratch_dir is not None:
+            fill_value = src.nodata if src.nodata is not None else 0
+            clipped = assemble_blocks(iter_clip_blocks(src, window, bands), (len(bands),) + tuple(shape),
+                                      src.dtypes[0], scratch_dir, fill_value)
+        else:
+            clipped = src.read(bands, window=window)
+        mask = band_mask(src, window, clipped)
+    entries = {'band': clipped, 'mask': mask}
+    if mask is not None:
+        print(f"Image A is {np.count_nonzero(mask) / mask.size:.0%} valid in the AOI")
+    
+    factor = reference.get('factor')
+    if method == "pyramid" and factor > 1:
+        coarse = read_overview_band(image_path, window, factor, bands[0])
+        entries['coarse'] = coarse if coarse is not None else \
+            downsample_band(clipped[0], factor, fft_options['precision'], mask)
+    elif method != "pyramid" and cache_spectrum:
+        # Over the same valid bounds estimate_shift crops the reference to; joint
+        # registration caches the spectra of the whole band stack
+        band = clipped if len(bands) > 1 else clipped[0]
+        if mask is not None:
+            rows, cols = valid_bounds(mask)
+            band, mask = band[..., rows, cols], mask[rows, cols]
+        entries['spectrum'] = fft_spectrum(band, fft_options, mask)
+    return entries
+
+
+def resolve_reference(reference: dict) -> dict:
+    """Wait for the reference entries still being read (see read_reference) and add them to reference."""
+    pending = reference.pop('pending', None)
+    if pending is not None:
+        reference.update(pending.result())
+    return reference
 
 
-def save_geotiff(image_array: np.ndarray, output_path: str, reference_path: str = None):
+def align_target(image_b: str, aoi: dict, output_path: str, method: str,
+                 reference: Optional[dict] = None, warp_options: Optional[dict] = None,
+                 registration_options: Optional[dict] = None,
+                 output_options: Optional[dict] = None, scratch_dir: Optional[str] = None,
+                 checkpoint: Optional[JobCheckpoint] = None) -> dict:
     """
-    Save an image array as a GeoTIFF file.
+    Clip one target image, align it to the reference and save it.
     
     Args:
-        image_array: Image array to save
-        output_path: Path for the output file
-        reference_path: Optional path to reference GeoTIFF for metadata
+        image_b: Path to the image to align
+        aoi: Area of Interest as {north: lat, south: lat, east: lng, west: lng}
+        output_path: Path for the aligned GeoTIFF
+        method: Registration method, one of REGISTRATION_METHODS
+        reference: Reference state with keys shape, band, transform, crs, factor,
+            bands (the registration bands band holds) and optionally coarse,
+            spectrum and pending, a Future of the entries still being read
+            (see resolve_reference); default: the pool's shared reference
+        warp_options: Optional reproject keyword arguments used when Image B is
+            not on Image A's pixel grid
+        registration_options: Optional extra keyword arguments for estimate_shift
+        output_options: Optional extra keyword arguments for save_geotiff (e.g. cog_options)
+        scratch_dir: Hold the registration band in a memory-mapped scratch file
+            in this directory instead of in memory (see --max_memory)
+        checkpoint: Optional job checkpoint; a shift or output blocks it records
+            for this target are reused instead of being computed again
+    
+    Returns:
+        Alignment info for this target
     """
-    if reference_path and os.path.exists(reference_path):
-        # Copy metadata from reference file
-        with rasterio.open(reference_path) as ref_src:
-            profile = ref_src.profile.copy()
-            profile.update({
-                'height': image_array.shape[1],
-                'width': image_array.shape[2] if len(image_array.shape) > 2 else image_array.shape[1],
-                'count': image_array.shape[0] if len(image_array.shape) > 2 else 1,
-            })
-            
-            with rasterio.open(output_path, 'w', **profile) as dst:
-                if len(image_array.shape) == 2:
-                    # Single band image
-                    dst.write(image_array, 1)
-                else:
-                    # Multi-band image
-                    for band_idx in range(image_array.shape[0]):
-                        dst.write(image_array[band_idx], band_idx + 1)
+    if reference is None:
+        reference = _shared_reference
+    
+    recorded = checkpoint.entry(output_path) if checkpoint is not None else {}
+    if checkpoint is not None and checkpoint.complete(output_path):
+        print(f"{output_path} is complete in the checkpoint, skipping {image_b}")
+        return recorded['alignment']
+    
+    shape = reference['shape']
+    with open_raster(image_b) as src_b:
+        window_b = aoi_window(src_b, aoi)
+        count, dtype, nodata = src_b.count, src_b.dtypes[0], src_b.nodata
+        dataset_mask = has_dataset_mask(src_b)
+    same_grid = (int(window_b.height), int(window_b.width)) == tuple(shape)
+    fill_value = nodata if nodata is not None else 0
+    
+    if 'alignment' in recorded:
+        alignment_info = recorded['alignment']
+        print(f"Using the shift of {image_b} from the checkpoint: "
+              f"{[alignment_info['shift_y'], alignment_info['shift_x']]}")
     else:
-        # Create a basic GeoTIFF with dummy metadata
-        # This is a fallback - in practice, you'll want to preserve proper geospatial metadata
-        height, width = image_array.shape[1:] if len(image_array.shape) > 2 else image_array.shape
-        count = image_array.shape[0] if len(image_array.shape) > 2 else 1
+        bands = reference.get('bands', [1])
+        if max(bands) > count:
+            raise ValueError(f"{image_b} has {count} bands, cannot register band {max(bands)}")
+        with job_stage("read_b", 0.2):
+            print(f"Clipping {image_b} to AOI...")
+            with open_raster(image_b) as src_b:
+                if same_grid:
+                    # Only the registration bands are held; the output streams from the source
+                    blocks = iter_clip_blocks(src_b, window_b, bands)
+                else:
+                    # Warp the registration bands onto Image A's clipped grid
+                    print(f"Reprojecting {image_b} onto Image A's grid...")
+                    blocks = iter_warped_blocks(src_b, reference['transform'], reference['crs'], shape,
+                                                bands, fill_value, warp_options)
+                clipped_b = assemble_blocks(blocks, (len(bands),) + tuple(shape), dtype, scratch_dir, fill_value)
+                if same_grid:
+                    mask_b = band_mask(src_b, window_b, clipped_b)
+                elif nodata is not None:
+                    # Warped pixels outside Image B are filled with its nodata value
+                    mask_b = ~nodata_pixels(clipped_b[0], nodata)
+                    mask_b = None if mask_b.all() else mask_b
+                else:
+                    mask_b = None
+            
+            factor, coarse_b = reference.get('factor'), None
+            if method == "pyramid" and factor and factor > 1 and same_grid:
+                coarse_b = read_overview_band(image_b, window_b, factor, bands[0])
         
-        profile = {
-            'driver': 'GTiff',
-            'dtype': image_array.dtype,
-            'nodata': None,
-            'width': width,
-            'height': height,
-            'count': count,
-            'crs': 'EPSG:4326',  # WGS84
-            'transform': rasterio.transform.from_bounds(0, 0, 1, 1, width, height)
-        }
+        resolve_reference(reference)
+        with job_stage("register", 0.35):
+            print(f"Aligning {image_b} to Image A...")
+            alignment_info = estimate_shift(reference['band'], clipped_b, method, factor,
+                                            reference.get('coarse'), coarse_b, reference.get('spectrum'),
+                                            mask_a=reference.get('mask'), mask_b=mask_b, bands=bands,
+                                            **(registration_options or {}))
+            del clipped_b, mask_b
         
-        with rasterio.open(output_path, 'w', **profile) as dst:
-            if len(image_array.shape) == 2:
-                # Single band image
-                dst.write(image_array, 1)
+        if checkpoint is not None:
+            checkpoint.update(output_path, alignment=alignment_info)
+    
+    # The aligned product lies on Image A's clipped grid; the shift is applied
+    # through offset destination windows with nodata in the uncovered strips.
+    # Without a nodata value the strips (and Image B's own mask) go to a mask band
+    shift_y, shift_x = alignment_info["shift_y"], alignment_info["shift_x"]
+    masked = nodata is None and (dataset_mask or shift_y != 0 or shift_x != 0)
+    
+    # Source blocks whose shifted destination a resumed job already wrote are not read again
+    written = checkpoint.written_filter(output_path) if checkpoint is not None else None
+    
+    def skip_written(window: Window) -> bool:
+        destination = shifted_window(window, shape, shift_y, shift_x)
+        return destination is None or written(destination)
+    
+    skip = skip_written if written is not None else None
+    
+    with job_stage("write_b", 0.5):
+        print(f"Saving aligned {image_b} to {output_path}")
+        output_window = Window(0, 0, shape[1], shape[0])
+        with open_raster(image_b) as src_b:
+            if same_grid:
+                blocks = iter_clip_blocks(src_b, window_b, masked=masked, skip=skip)
             else:
-                # Multi-band image
-                for band_idx in range(image_array.shape[0]):
-                    dst.write(image_array[band_idx], band_idx + 1)
+                blocks = iter_warped_blocks(src_b, reference['transform'], reference['crs'], shape,
+                                            fill_value=fill_value, warp_options=warp_options, skip=skip)
+            shifted = iter_shifted_blocks(blocks, shape, shift_y, shift_x, count, dtype, fill_value, masked)
+            save_geotiff(shifted, output_path, image_b, window=output_window, transform=reference['transform'],
+                         crs=reference['crs'], checkpoint=checkpoint, **(output_options or {}))
+    
+    return alignment_info
 
 
-def main():
+def import_job_modules():
+    """Import every module a job may load on demand, e.g. to warm a resident worker."""
+    for name in JOB_MODULES:
+        importlib.import_module(name)
+
+
+def profile_startup() -> List[Tuple[str, float]]:
+    """
+    Measure the cold import cost of the worker and of each module a job loads.
+    
+    Modules are imported one after another in a fresh interpreter, so each
+    figure is the extra cost that module adds on top of the ones before it.
+    
+    Returns:
+        List of (module, import milliseconds) in load order, ending with the
+        total wall time of the interpreter
+    """
+    modules = list(STARTUP_MODULES) + ["worker"] + list(JOB_MODULES)
+    code = (
+        "import importlib, json, sys, time\n"
+        "sys.path.insert(0, sys.argv[1])\n"
+        "timings = []\n"
+        "for name in sys.argv[2:]:\n"
+        "    started = time.perf_counter()\n"
+        "    importlib.import_module(name)\n"
+        "    timings.append((name, (time.perf_counter() - started) * 1000))\n"
+        "print(json.dumps(timings))\n"
+    )
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, "-c", code, os.path.dirname(os.path.abspath(__file__))] + modules,
+                            capture_output=True, text=True, check=True)
+    wall_ms = (time.perf_counter() - started) * 1000
+    
+    report = [(name, milliseconds) for name, milliseconds in json.loads(result.stdout)]
+    report.append(("total wall time", wall_ms))
+    return report
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """Build the command line parser shared by one-shot runs and serve mode job requests."""
     parser = argparse.ArgumentParser(description="Geospatial image alignment worker")
-    parser.add_argument("--image_a", required=True, help="Path to reference image A")
-    parser.add_argument("--image_b", required=True, help="Path to image B to align")
-    parser.add_argument("--aoi", required=True, help="Area of interest as string 'north=<latN>;south=<latS>;east=<lonE>;west=<lonW>'")
-    parser.add_argument("--out_dir", required=True, help="Output directory for aligned images")
+    parser.add_argument("--image_a", help="Path to reference image A")
+    parser.add_argument("--image_b", nargs='+',
+                        help="Path to image B to align (several paths align a batch against image A)")
+    parser.add_argument("--aoi", nargs='+',
+                        help="Area of interest as string 'north=<latN>;south=<latS>;east=<lonE>;west=<lonW>' "
+                             "or as a JSON object with the same keys (several AOIs run concurrently in one "
+                             "job, sharing dataset handles and reads)")
+    parser.add_argument("--out_dir", help="Output directory for aligned images")
+    parser.add_argument("--registration", choices=REGISTRATION_METHODS, default="full",
+                        help="Shift estimation method: 'full' correlates the whole clip, 'pyramid' "
+                             "estimates on an overview level and refines on a full-resolution patch, "
+                             "'tiled' registers overlapping tiles in parallel and reports a shift field")
+    parser.add_argument("--fft_backend", choices=FFT_BACKENDS, default=DEFAULT_FFT_OPTIONS['backend'],
+                        help="FFT implementation for phase correlation: 'scipy' uses multithreaded "
+                             "real-input transforms padded to fast lengths, 'numpy' the same single-threaded, "
+                             "'skimage' the reference complex implementation")
+    parser.add_argument("--registration_precision", choices=REGISTRATION_PRECISIONS,
+                        default=DEFAULT_FFT_OPTIONS['precision'],
+                        help="Floating-point precision of the band being registered; clips and outputs "
+                             "always keep the source dtype")
+    parser.add_argument("--registration_bands", nargs='+', default=["1"],
+                        help="1-based bands registered jointly from one batched FFT, their normalised "
+                             "cross-power spectra summed into one correlation peak ('all' for every band of "
+                             "Image A); the pyramid and tiled methods register the first band given")
+    parser.add_argument("--fft_threads", type=int, default=os.cpu_count(),
+                        help="Threads per FFT with the scipy backend (shared across batch workers)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="Maximum number of processes aligning batch targets or registering tiles in parallel")
+    parser.add_argument("--resampling", choices=RESAMPLING_METHODS, default="bilinear",
+                        help="Resampling kernel used when Image B is warped onto Image A's grid")
+    parser.add_argument("--warp_threads", type=int, default=os.cpu_count(),
+                        help="GDAL threads used when warping Image B (shared across batch workers)")
+    parser.add_argument("--warp_memory_mb", type=int, default=256,
+                        help="GDAL warp memory limit in MB")
+    parser.add_argument("--snap_to_tiles", action="store_true",
+                        help="Expand the AOI outward to Image A's internal tile boundaries so that, with "
+                             "--output_format gtiff, its clip is copied tile by tile without decoding")
+    parser.add_argument("--output_format", choices=OUTPUT_FORMATS, default="cog",
+                        help="'cog' writes tiled, compressed Cloud-Optimized GeoTIFFs with overviews; "
+                             "'gtiff' copies the input layout")
+    parser.add_argument("--compress", choices=COMPRESSION_METHODS, default="deflate",
+                        help="Compression codec for COG outputs (with predictor)")
+    parser.add_argument("--compress_threads", type=int, default=os.cpu_count(),
+                        help="Threads used to compress COG outputs and build their overviews")
+    parser.add_argument("--max_memory", type=int,
+                        help="Memory budget in MB; larger registrations keep their bands in memory-mapped "
+                             "scratch files in the output directory and use pyramid instead of full "
+                             "registration")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="Overlap I/O and compute: write Image A's clip and read its registration bands in "
+                             "background threads while Image B is read and registered, and read output blocks "
+                             "ahead of the writer (same outputs)")
+    parser.add_argument("--resume", action="store_true",
+                        help="Continue an interrupted job from the checkpoint manifest in the output directory, "
+                             "reusing its finished outputs, computed shifts and written blocks")
+    parser.add_argument("--events",
+                        help="Write progress and per-stage timing, CPU, memory and I/O events as JSON lines "
+                             "to this file (serve mode sends them on the protocol channel)")
+    parser.add_argument("--profile_job", action="store_true",
+                        help="Write a cProfile profile of the job to profile.pstats in the output directory")
+    parser.add_argument("--trace_memory", action="store_true",
+                        help="Trace Python allocations and write the largest sites to tracemalloc.txt "
+                             "in the output directory")
+    parser.add_argument("--serve", action="store_true",
+                        help="Stay resident and run job requests read as JSON lines from stdin")
+    parser.add_argument("--profile_startup", action="store_true",
+                        help="Report the cold import cost of each module a job loads and exit")
+    return parser
+
+
+def parse_job_args(parser: argparse.ArgumentParser, argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """
+    Parse and validate the arguments of one alignment job.
+    
+    Args:
+        parser: Parser from build_parser
+        argv: Argument list (default: sys.argv)
+    
+    Returns:
+        Parsed arguments
+    """
+    args = parser.parse_args(argv)
+    if not (args.serve or args.profile_startup):
+        missing = [name for name in ("image_a", "image_b", "aoi", "out_dir") if not getattr(args, name)]
+        if missing:
+            parser.error("the following arguments are required: " + ", ".join(f"--{name}" for name in missing))
+    if args.registration_bands != ["all"] and not all(band.isdigit() and int(band) > 0
+                                                       for band in args.registration_bands):
+        parser.error("--registration_bands takes 1-based band numbers or 'all'")
+    return args
+
+
+def resolve_registration_bands(values: List[str], count: int) -> List[int]:
+    """
+    Band numbers selected by --registration_bands.
+    
+    Args:
+        values: Parsed --registration_bands values
+        count: Number of bands of Image A
+    
+    Returns:
+        1-based band numbers, without repeats
+    """
+    if values == ["all"]:
+        return list(range(1, count + 1))
+    bands = list(dict.fromkeys(int(value) for value in values))
+    if max(bands) > count:
+        raise ValueError(f"Image A has {count} bands, cannot register band {max(bands)}")
+    return bands
+
+
+def job_signature(args: argparse.Namespace) -> dict:
+    """
+    Identify what a job writes, so that only the same job resumes its checkpoint.
+    
+    Args:
+        args: Parsed job arguments (see build_parser)
+    
+    Returns:
+        JSON-compatible dict of the arguments that affect the outputs, the size
+        and modification time of every input and a hash of the worker code
+    """
+    import hashlib
     
-    args = parser.parse_args()
+    signature = {name: value for name, value in sorted(vars(args).items()) if name not in CHECKPOINT_IGNORED_ARGS}
+    signature['inputs'] = {}
+    for path in [args.image_a] + list(args.image_b):
+        stat = os.stat(path)
+        signature['inputs'][path] = [stat.st_size, stat.st_mtime_ns]
+    with open(os.path.abspath(__file__), 'rb') as f:
+        signature['worker'] = hashlib.sha256(f.read()).hexdigest()
+    # Compare as it reads back from the manifest (tuples become lists)
+    return json.loads(json.dumps(signature))
+
+
+def parse_aoi(aoi_string: str) -> dict:
+    """
+    Parse an AOI string of the form 'north=<latN>;south=<latS>;east=<lonE>;west=<lonW>'
+    or a JSON object such as '{"north": <latN>, "south": <latS>, "east": <lonE>, "west": <lonW>}'.
+    
+    Args:
+        aoi_string: AOI as passed on the command line
+    
+    Returns:
+        AOI as {north: lat, south: lat, east: lng, west: lng}
+    """
+    if aoi_string.lstrip().startswith('{'):
+        return {key: float(value) for key, value in json.loads(aoi_string).items()}
     
-    # Parse AOI from string format
-    aoi_parts = args.aoi.split(';')
+    aoi_parts = aoi_string.split(';')
     aoi_dict = {}
     for part in aoi_parts:
         if '=' in part:
             key, value = part.split('=', 1)
             aoi_dict[key] = float(value)
     
-    # Use the AOI dictionary directly
-    aoi = aoi_dict
+    return aoi_dict
+
+
+def report_progress(fraction: float, message: str):
+    """Log a progress message and send it as a progress event."""
+    print(message)
+    emit_event({"event": "progress", "progress": fraction, "message": message})
+
+
+def run_job(args: argparse.Namespace) -> dict:
+    """
+    Run one alignment job: clip Image A, align every Image B and write the outputs.
+    
+    Progress and stage events go to the current event sink (see set_event_sink).
+    
+    Args:
+        args: Parsed job arguments (see build_parser)
+    
+    Returns:
+        Alignment info as written to alignment_info.json
+    """
+    aois = [parse_aoi(aoi_string) for aoi_string in args.aoi]
+    
+    # Reject AOIs that miss the images using their ingest sidecars, before any dataset is opened
+    from scene_index import validate_aoi
+    problems = [problem for aoi in aois for problem in validate_aoi(args.image_a, args.image_b, aoi)]
+    if problems:
+        raise ValueError("; ".join(problems))
     
     print(f"Processing images:")
     print(f"  Image A: {args.image_a}")
-    print(f"  Image B: {args.image_b}")
-    print(f"  AOI: {aoi}")
+    for image_b in args.image_b:
+        print(f"  Image B: {image_b}")
+    for aoi in aois:
+        print(f"  AOI: {aoi}")
     print(f"  Output directory: {args.out_dir}")
     
     # Create output directory if it doesn't exist
     os.makedirs(args.out_dir, exist_ok=True)
     
-    # Clip both images to AOI
-    print("Clipping Image A to AOI...")
-    clipped_a = clip_image_to_aoi(args.image_a, aoi)
-    
-    print("Clipping Image B to AOI...")
-    clipped_b = clip_image_to_aoi(args.image_b, aoi)
-    
-    # Align Image B to Image A
-    print("Aligning Image B to Image A...")
-    aligned_b, alignment_info = align_images(clipped_a, clipped_b)
-    
-    # Save the clipped and aligned images
-    output_path_a = os.path.join(args.out_dir, "A_clipped.tif")
-    output_path_b = os.path.join(args.out_dir, "B_clipped_aligned.tif")
-    
-    print(f"Saving clipped Image A to {output_path_a}")
-    save_geotiff(clipped_a, output_path_a, args.image_a)
+    # Shifts and written blocks are recorded as the job goes, so an interrupted job can --resume
+    checkpoint = JobCheckpoint.open(args.out_dir, job_signature(args), args.resume)
     
-    print(f"Saving aligned Image B to {output_path_b}")
-    save_geotiff(aligned_b, output_path_b, args.image_b)
+    if len(aois) == 1:
+        alignment_info = align_aoi(args, aois[0], checkpoint=checkpoint)
+    else:
+        alignment_info = align_aois(args, aois, checkpoint)
     
     print(f"Alignment completed successfully!")
     print(f"Alignment info: {alignment_info}")
@@ -226,7 +2876,318 @@ def main():
     alignment_info_path = os.path.join(args.out_dir, "alignment_info.json")
     with open(alignment_info_path, 'w') as f:
         json.dump(alignment_info, f, indent=2)
+    
+    report_progress(1.0, "Job finished")
+    return alignment_info
+
+
+def align_aois(args: argparse.Namespace, aois: List[dict], checkpoint: Optional[JobCheckpoint] = None) -> dict:
+    """
+    Align the image pair for several AOIs concurrently.
+    
+    Each dataset is opened once and its handle is shared by all AOI threads,
+    so blocks that several AOIs cover are read and decoded once and then
+    served from GDAL's block cache (sized by GDAL_CACHEMAX). The job's
+    processes and threads are split evenly between the AOIs running at the
+    same time.
+    
+    Args:
+        args: Parsed job arguments (see build_parser)
+        aois: AOIs as {north: lat, south: lat, east: lng, west: lng}
+        checkpoint: Optional job checkpoint shared by all AOIs (see align_aoi)
+    
+    Returns:
+        Alignment info with one entry per AOI under 'aois', in order
+    """
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+    
+    threads = max(1, min(args.workers, len(aois)))
+    aoi_args = argparse.Namespace(**vars(args))
+    for name in ("workers", "fft_threads", "warp_threads", "compress_threads"):
+        setattr(aoi_args, name, max(1, getattr(args, name) // threads))
+    
+    def run_aoi(index: int, aoi: dict) -> dict:
+        with event_fields(aoi=index):
+            info = align_aoi(aoi_args, aoi, AOI_OUTPUT_PREFIX.format(index=index), checkpoint)
+            report_progress(1.0, f"AOI {index} finished")
+            return info
+    
+    report_progress(0.0, f"Aligning {len(aois)} AOIs, {threads} at a time")
+    with shared_datasets([args.image_a] + list(args.image_b)), \
+            ThreadPoolExecutor(max_workers=threads) as pool:
+        futures = [pool.submit(run_aoi, index, aoi) for index, aoi in enumerate(aois, 1)]
+        for done, future in enumerate(as_completed(futures), 1):
+            future.result()
+            report_progress(done / len(futures), f"Aligned {done} of {len(futures)} AOIs")
+        aoi_infos = [future.result() for future in futures]
+    
+    return {
+        "reference": os.path.basename(args.image_a),
+        "aois": [dict(info, index=index, aoi=aoi) for index, (aoi, info) in enumerate(zip(aois, aoi_infos), 1)]
+    }
+
+
+def align_aoi(args: argparse.Namespace, aoi: dict, prefix: str = "",
+              checkpoint: Optional[JobCheckpoint] = None) -> dict:
+    """
+    Clip Image A to one AOI, align every Image B to it and write the outputs.
+    
+    Args:
+        args: Parsed job arguments (see build_parser)
+        aoi: Area of Interest as {north: lat, south: lat, east: lng, west: lng}
+        prefix: Prefix of this AOI's output file names
+        checkpoint: Optional job checkpoint; outputs it records as complete are
+            skipped, and Image A is not read for registration when every
+            target's shift is recorded
+    
+    Returns:
+        Alignment info of this AOI, naming its output files
+    """
+    output_path_a = os.path.join(args.out_dir, f"{prefix}A_clipped.tif")
+    if len(args.image_b) == 1:
+        output_paths = [os.path.join(args.out_dir, f"{prefix}B_clipped_aligned.tif")]
+    else:
+        output_paths = [os.path.join(args.out_dir, f"{prefix}B{index}_clipped_aligned.tif")
+                        for index in range(1, len(args.image_b) + 1)]
+    output_options = {}
+    if args.output_format == "cog":
+        output_options['cog_options'] = cog_creation_options(args.compress, args.compress_threads)
+    
+    pool_size = max(1, min(args.workers, len(args.image_b)))
+    fft_options = {'backend': args.fft_backend, 'threads': max(1, args.fft_threads // pool_size),
+                   'precision': args.registration_precision}
+    register = checkpoint is None or any('alignment' not in checkpoint.entry(path) for path in output_paths)
+    if args.pipeline:
+        output_options['pipeline_depth'] = PIPELINE_QUEUE_BLOCKS
+    
+    with open_raster(args.image_a) as src_a:
+        window_a = aoi_window(src_a, aoi)
+        if args.snap_to_tiles and src_a.profile.get('tiled'):
+            # Grow the clip to whole source tiles and clip every target to the same bounds
+            window_a = snap_window_to_blocks(src_a, window_a)
+            west, south, east, north = src_a.window_bounds(window_a)
+            aoi = {'north': north, 'south': south, 'east': east, 'west': west}
+            print(f"AOI snapped to Image A's tiles: {aoi}")
+        transform_a = src_a.window_transform(window_a)
+        crs_a = src_a.crs
+        overview_factors = src_a.overviews(1)
+        count_a, dtype_a = src_a.count, src_a.dtypes[0]
+    
+    # Over the memory budget the registration bands live in scratch files and the
+    # full-resolution correlation, which cannot run in chunks, gives way to the pyramid
+    method, scratch_dir = args.registration, None
+    bands = resolve_registration_bands(args.registration_bands, count_a)
+    shape_a = (int(window_a.height), int(window_a.width))
+    footprint = registration_footprint(shape_a, np.dtype(dtype_a).itemsize, method, fft_options, len(bands))
+    if register and args.max_memory and footprint > args.max_memory * 1024 * 1024:
+        scratch_dir = os.path.join(args.out_dir, SCRATCH_DIR)
+        if method == "full":
+            method = "pyramid"
+        report_progress(0.1, f"Registration needs ~{footprint / 1024 / 1024:.0f} MB, over the "
+                             f"{args.max_memory} MB budget: using scratch files and {method} registration")
+    if method != "full" and len(bands) > 1:
+        # Only the full method registers several bands jointly
+        print(f"{method.capitalize()} registration uses band {bands[0]} only")
+        bands = bands[:1]
+    
+    # Everything derived from Image A is computed once and reused for every target
+    reference = {'shape': shape_a, 'band': None, 'transform': transform_a, 'crs': crs_a, 'factor': None,
+                 'mask': None, 'bands': bands}
+    if register and method == "pyramid":
+        reference['factor'] = pyramid_factor(shape_a, overview_factors)
+        print(f"Pyramid registration at 1/{reference['factor']} resolution")
+    
+    warp_options = {
+        'resampling': Resampling[args.resampling],
+        'num_threads': max(1, args.warp_threads // pool_size),
+        'warp_mem_limit': args.warp_memory_mb,
+    }
+    # Tiled registration spreads across the processes not taken by batch targets
+    registration_options = {'workers': max(1, args.workers // pool_size), 'fft_options': fft_options}
+    
+    def clip_a():
+        # Stream Image A's clip straight to disk
+        with job_stage("clip_a", 0.0):
+            report_progress(0.0, f"Clipping Image A to AOI and saving to {output_path_a}")
+            write_clip(args.image_a, window_a, output_path_a, output_options, checkpoint)
+    
+    def prepare_reference() -> dict:
+        with job_stage("prepare_reference", 0.15):
+            return read_reference(args.image_a, window_a, reference, method, fft_options,
+                                  len(args.image_b) > 1 and scratch_dir is None, scratch_dir)
+    
+    # Pipelined jobs write Image A's clip and read its registration bands in
+    # background threads while Image B is read; targets wait for the reference
+    # only when they register
+    with job_pipeline(args.pipeline) as submit:
+        written_a = submit(clip_a)
+        if register:
+            # Unless every target's shift is in the checkpoint
+            reference['pending'] = submit(prepare_reference)
+        
+        report_progress(0.2, "Aligning Image B to Image A...")
+        if len(args.image_b) == 1:
+            alignment_info = align_target(args.image_b[0], aoi, output_paths[0], method, reference, warp_options,
+                                          registration_options, output_options, scratch_dir, checkpoint)
+        else:
+            target_infos = align_batch(args.image_b, aoi, output_paths, method, reference, pool_size,
+                                       warp_options, registration_options, output_options, scratch_dir, checkpoint)
+            alignment_info = {
+                "reference": os.path.basename(args.image_a),
+                "targets": [
+                    dict(info, image=os.path.basename(image_b), output=os.path.basename(output_path))
+                    for image_b, output_path, info in zip(args.image_b, output_paths, target_infos)
+                ]
+            }
+        written_a.result()
+    
+    if prefix:
+        alignment_info["output_a"] = os.path.basename(output_path_a)
+        if len(args.image_b) == 1:
+            alignment_info["output"] = os.path.basename(output_paths[0])
+    return alignment_info
+
+
+def align_batch(image_bs: List[str], aoi: dict, output_paths: List[str], method: str, reference: dict,
+                pool_size: int, warp_options: Optional[dict] = None,
+                registration_options: Optional[dict] = None, output_options: Optional[dict] = None,
+                scratch_dir: Optional[str] = None, checkpoint: Optional[JobCheckpoint] = None) -> List[dict]:
+    """
+    Align several target images against one prepared reference.
+    
+    Targets run across a process pool sharing the reference arrays, or one
+    after another in this process when pool_size is 1 (e.g. inside a
+    multi-AOI thread, where they read through the shared dataset handles).
+    
+    Args:
+        image_bs: Paths to the images to align
+        aoi: Area of Interest as {north: lat, south: lat, east: lng, west: lng}
+        output_paths: Output path of each target
+        method: Registration method, one of REGISTRATION_METHODS
+        reference: Reference state (see align_target)
+        pool_size: Number of targets aligned at the same time
+        warp_options: Optional reproject keyword arguments (see align_target)
+        registration_options: Optional extra keyword arguments for estimate_shift
+        output_options: Optional extra keyword arguments for save_geotiff
+        scratch_dir: Optional directory for memory-mapped registration bands
+        checkpoint: Optional job checkpoint (see align_target)
+    
+    Returns:
+        Alignment info of each target, in order
+    """
+    if pool_size == 1:
+        target_infos = []
+        for image_b, output_path in zip(image_bs, output_paths):
+            target_infos.append(align_target(image_b, aoi, output_path, method, reference, warp_options,
+                                             registration_options, output_options, scratch_dir, checkpoint))
+            report_progress(0.2 + 0.8 * len(target_infos) / len(image_bs),
+                            f"Aligned {len(target_infos)} of {len(image_bs)} targets")
+        return target_infos
+    
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    
+    # Share the reference arrays with the pool instead of pickling them per task
+    resolve_reference(reference)
+    arrays = {key: value for key, value in reference.items() if isinstance(value, np.ndarray)}
+    values = {key: value for key, value in reference.items() if key not in arrays}
+    shared = {key: share_array(array) for key, array in arrays.items()}
+    specs = {key: spec for key, (_, spec) in shared.items()}
+    
+    try:
+        with job_stage("align_targets", 0.2), \
+                ProcessPoolExecutor(max_workers=pool_size,
+                                    initializer=_attach_reference, initargs=(specs, values)) as pool:
+            futures = [pool.submit(align_target, image_b, aoi, output_path, method, None, warp_options,
+                                   registration_options, output_options, scratch_dir, checkpoint)
+                       for image_b, output_path in zip(image_bs, output_paths)]
+            for done, future in enumerate(as_completed(futures), 1):
+                future.result()
+                report_progress(0.2 + 0.8 * done / len(futures), f"Aligned {done} of {len(futures)} targets")
+            return [future.result() for future in futures]
+    finally:
+        release_shared(shared)
+
+
+def execute_job(args: argparse.Namespace) -> dict:
+    """
+    Run one job with the requested profiling and remove its scratch files afterwards.
+    
+    Args:
+        args: Parsed job arguments (see build_parser)
+    
+    Returns:
+        Alignment info as returned by run_job
+    """
+    try:
+        with job_profiling(args.out_dir, args.profile_job, args.trace_memory):
+            return run_job(args)
+    finally:
+        shutil.rmtree(os.path.join(args.out_dir, SCRATCH_DIR), ignore_errors=True)
+
+
+def serve(parser: argparse.ArgumentParser):
+    """
+    Run as a resident pool worker.
+    
+    Job requests arrive on stdin as JSON lines {"id": ..., "args": [...]}, where
+    args are the same command line arguments a one-shot run takes. Events are
+    written to stdout as JSON lines: ready, started, progress, stage, done and
+    error, each carrying the job id. Log output is redirected to stderr so it cannot
+    corrupt the protocol.
+    """
+    protocol = os.fdopen(os.dup(sys.stdout.fileno()), 'w', buffering=1)
+    sys.stdout.flush()
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    
+    def emit(event: dict):
+        protocol.write(json.dumps(event) + "\n")
+        protocol.flush()
+    
+    # Pay all import costs once, before the first job arrives
+    import_job_modules()
+    emit({"event": "ready", "pid": os.getpid()})
+    
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        
+        job_id = None
+        try:
+            request = json.loads(line)
+            job_id = request.get("id")
+            emit({"event": "started", "id": job_id})
+            args = parse_job_args(parser, request["args"])
+            set_event_sink(lambda event: emit(dict(event, id=job_id)))
+            alignment_info = execute_job(args)
+            emit({"event": "done", "id": job_id, "alignment_info": alignment_info})
+        except SystemExit as e:
+            # argparse reports invalid job arguments by exiting
+            emit({"event": "error", "id": job_id, "error": f"Invalid job arguments (exit code {e.code})"})
+        except Exception as e:
+            traceback.print_exc()
+            emit({"event": "error", "id": job_id, "error": f"{type(e).__name__}: {e}"})
+        finally:
+            set_event_sink(None)
+
+
+def main():
+    parser = build_parser()
+    args = parse_job_args(parser)
+    
+    if args.profile_startup:
+        print("Startup import profile (cold interpreter):")
+        for name, milliseconds in profile_startup():
+            print(f"  {name:<48} {milliseconds:8.1f} ms")
+    elif args.serve:
+        serve(parser)
+    elif args.events:
+        # Instrumentation events as JSON lines, e.g. --events /dev/fd/3
+        with open(args.events, 'w', buffering=1) as events:
+            set_event_sink(lambda event: events.write(json.dumps(event) + "\n"))
+            execute_job(args)
+    else:
+        execute_job(args)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()